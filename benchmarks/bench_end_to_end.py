@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    End-to-end PowerTrackClient benchmark against a MockGnipServer running
+    in its own process: activities per second, client CPU per activity and
+    delivery latency (send to callback) percentiles, uncompressed and
+    gzipped, with the callback inline and behind a queue.
+
+    Usage (with gnippy installed, e.g. pip install -e .):
+        python benchmarks/bench_end_to_end.py [activities] [activity_bytes] [rate]
+"""
+
+from __future__ import print_function
+
+import multiprocessing
+import sys
+import time
+
+from gnippy import PowerTrackClient
+from gnippy.mockserver import MockGnipServer
+
+
+def serve(ready, done, server_kwargs):
+    server = MockGnipServer(**server_kwargs).start()
+    ready.put(server.url)
+    done.wait()
+    server.stop()
+
+
+def sent_at(line):
+    """ Each mock activity starts with {"sent":<timestamp>, """
+    return float(line[8:line.index(b",")])
+
+
+def run(label, activities, activity_bytes, rate, gzip=False, **client_kwargs):
+    ready = multiprocessing.Queue()
+    done = multiprocessing.Event()
+    server = multiprocessing.Process(target=serve, args=(ready, done, {
+        "activities": activities, "activity_size": activity_bytes,
+        "rate": rate, "gzip": gzip}))
+    server.start()
+    url = ready.get()
+
+    latencies = []
+
+    def callback(line):
+        latencies.append(time.time() - sent_at(line))
+
+    client = PowerTrackClient(callback, url=url, auth=("bench", "bench"),
+                              gzip=gzip, **client_kwargs)
+    start, cpu_start = time.time(), time.process_time()
+    client.connect()
+    client.worker.join()
+    client.disconnect()
+    elapsed = time.time() - start
+    cpu = time.process_time() - cpu_start
+    done.set()
+    server.join()
+
+    assert len(latencies) == activities, (label, len(latencies))
+    latencies.sort()
+    pct = lambda p: latencies[min(len(latencies) - 1,
+                                  int(len(latencies) * p))] * 1e3
+    print("%-22s %9.0f activities/s %7.2f us CPU/activity "
+          "latency p50 %6.2fms p99 %7.2fms max %7.2fms" % (
+              label, activities / elapsed, cpu / activities * 1e6,
+              pct(0.5), pct(0.99), latencies[-1] * 1e3))
+
+
+def main():
+    activities = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    activity_bytes = int(sys.argv[2]) if len(sys.argv) > 2 else 4000
+    rate = float(sys.argv[3]) if len(sys.argv) > 3 else None
+    print("%d activities of %d bytes, %s" % (
+        activities, activity_bytes,
+        "%.0f/s" % rate if rate else "as fast as possible"))
+    run("inline", activities, activity_bytes, rate)
+    run("inline, gzip", activities, activity_bytes, rate, gzip=True)
+    run("queued", activities, activity_bytes, rate, queue_size=10000)
+    run("queued, gzip", activities, activity_bytes, rate, gzip=True,
+        queue_size=10000)
+
+
+if __name__ == "__main__":
+    main()
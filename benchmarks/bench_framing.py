@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Compares requests' iter_lines() (the previous Worker hot path) with
+    iter_content() + LineFramer on a synthetic PowerTrack stream.
+
+    Usage (with gnippy installed, e.g. pip install -e .):
+        python benchmarks/bench_framing.py [activities] [activity_bytes]
+"""
+
+from __future__ import print_function
+
+import io
+import sys
+import time
+
+import requests
+
+from gnippy.framing import DEFAULT_CHUNK_SIZE, LineFramer
+
+
+def make_stream(activities, activity_bytes, keepalive_every=1000):
+    activity = b'{"id":"tag:search.twitter.com,2005:1","body":"' + \
+        b"x" * max(0, activity_bytes - 48) + b'"}'
+    parts = []
+    for i in range(activities):
+        parts.append(activity)
+        if i % keepalive_every == 0:
+            parts.append(b"")
+    return b"\r\n".join(parts) + b"\r\n"
+
+
+def make_response(payload):
+    r = requests.Response()
+    r.status_code = 200
+    r.raw = io.BytesIO(payload)
+    return r
+
+
+def bench_iter_lines(payload):
+    n = 0
+    for line in make_response(payload).iter_lines():
+        if line:
+            n += 1
+    return n
+
+
+def bench_framer(payload, chunk_size=DEFAULT_CHUNK_SIZE):
+    n = 0
+    framer = LineFramer()
+    r = make_response(payload)
+    for chunk in r.iter_content(chunk_size=chunk_size):
+        for line in framer.feed(chunk):
+            n += 1
+    return n
+
+
+def timed(label, fn, payload, activities):
+    start = time.time()
+    n = fn(payload)
+    elapsed = time.time() - start
+    assert n == activities, (label, n)
+    print("%-28s %8.3fs %12.0f activities/s %8.1f MB/s" % (
+        label, elapsed, activities / elapsed,
+        len(payload) / elapsed / 1e6))
+
+
+def main():
+    activities = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    activity_bytes = int(sys.argv[2]) if len(sys.argv) > 2 else 4000
+    payload = make_stream(activities, activity_bytes)
+    print("%d activities of ~%d bytes (%.1f MB)" % (
+        activities, activity_bytes, len(payload) / 1e6))
+    timed("iter_lines (512 B reads)", bench_iter_lines, payload, activities)
+    timed("LineFramer (64 KB reads)", bench_framer, payload, activities)
+
+
+if __name__ == "__main__":
+    main()
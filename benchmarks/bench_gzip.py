@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    CPU versus bandwidth tradeoff of gzip streams: frames a synthetic
+    PowerTrack stream uncompressed, through GzipDecoder, and through
+    urllib3's own content decoding, and reports bytes on the wire.
+
+    Usage (with gnippy installed, e.g. pip install -e .):
+        python benchmarks/bench_gzip.py [activities] [activity_bytes]
+"""
+
+from __future__ import print_function
+
+import io
+import json
+import random
+import sys
+import time
+import zlib
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.packages.urllib3.response import HTTPResponse
+
+from gnippy.framing import DEFAULT_CHUNK_SIZE, GzipDecoder, LineFramer
+
+
+WORDS = ("coffee", "tea", "breaking", "news", "python", "stream", "gnip",
+         "power", "track", "rule", "match", "lang", "en", "the", "a", "of")
+
+
+def make_stream(activities, activity_bytes):
+    """ Activities with some realistic redundancy for the compressor. """
+    rng = random.Random(0)
+    lines = []
+    for i in range(activities):
+        body = " ".join(rng.choice(WORDS) for _ in range(activity_bytes // 6))
+        lines.append(json.dumps({
+            "id": "tag:search.twitter.com,2005:%d" % (10 ** 17 + i),
+            "objectType": "activity",
+            "body": body[:activity_bytes],
+            "gnip": {"matching_rules": [{"tag": "bench", "id": 1}]},
+        }).encode("utf-8"))
+    return b"\r\n".join(lines) + b"\r\n"
+
+
+def gzip_stream(payload, flush_every=64 * 1024):
+    """ Compress like a server would, flushing every so often. """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    out = []
+    for i in range(0, len(payload), flush_every):
+        out.append(compressor.compress(payload[i:i + flush_every]))
+        out.append(compressor.flush(zlib.Z_SYNC_FLUSH))
+    out.append(compressor.flush())
+    return b"".join(out)
+
+
+def make_response(payload, encoding=None):
+    headers = {"Content-Encoding": encoding} if encoding else {}
+    r = requests.Response()
+    r.status_code = 200
+    r.headers = CaseInsensitiveDict(headers)
+    r.raw = HTTPResponse(body=io.BytesIO(payload), headers=headers,
+                         preload_content=False)
+    return r
+
+
+def frame_plain(payload):
+    framer = LineFramer()
+    n = 0
+    for chunk in make_response(payload).iter_content(DEFAULT_CHUNK_SIZE):
+        n += len(framer.feed(chunk))
+    return n
+
+
+def frame_gzip_decoder(compressed):
+    framer = LineFramer()
+    decoder = GzipDecoder()
+    n = 0
+    r = make_response(compressed, "gzip")
+    for chunk in r.raw.stream(DEFAULT_CHUNK_SIZE, decode_content=False):
+        n += len(framer.feed(decoder.decompress(chunk)))
+    return n
+
+
+def frame_urllib3_decoding(compressed):
+    framer = LineFramer()
+    n = 0
+    r = make_response(compressed, "gzip")
+    for chunk in r.iter_content(DEFAULT_CHUNK_SIZE):
+        n += len(framer.feed(chunk))
+    return n
+
+
+def timed(label, fn, data, activities, wire_bytes):
+    start = time.process_time()
+    n = fn(data)
+    cpu = time.process_time() - start
+    assert n == activities, (label, n)
+    print("%-24s %8.3fs CPU %7.2f us/activity %9.1f MB on the wire" % (
+        label, cpu, cpu / activities * 1e6, wire_bytes / 1e6))
+
+
+def main():
+    activities = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    activity_bytes = int(sys.argv[2]) if len(sys.argv) > 2 else 4000
+    payload = make_stream(activities, activity_bytes)
+    compressed = gzip_stream(payload)
+    print("%d activities, %.1f MB raw, %.1f MB gzipped (%.1fx)" % (
+        activities, len(payload) / 1e6, len(compressed) / 1e6,
+        len(payload) / float(len(compressed))))
+    timed("uncompressed", frame_plain, payload, activities, len(payload))
+    timed("gzip, GzipDecoder", frame_gzip_decoder, compressed, activities,
+          len(compressed))
+    timed("gzip, urllib3 decoding", frame_urllib3_decoding, compressed,
+          activities, len(compressed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+    An asyncio PowerTrack client. Requires Python 3.6+ and aiohttp
+    (pip install gnippy[async]).
+"""
+
+import asyncio
+import base64
+import sys
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from gnippy import config
+from gnippy.errors import PowerTrackHTTPException, StreamStalledException
+from gnippy.framing import LineFramer
+from gnippy.powertrackclient import ReconnectPolicy, ReconnectSchedule, \
+    get_connection_url
+from gnippy.stats import StreamStats
+
+
+class AsyncPowerTrackClient(object):
+    """
+        AsyncPowerTrackClient streams activities from GNIP PowerTrack
+        on an asyncio event loop, so that many streams can share one
+        thread. Configuration is resolved exactly like PowerTrackClient.
+
+        Usage:
+            async with AsyncPowerTrackClient(reconnect=True) as client:
+                async for activity in client:
+                    ...
+    """
+
+    def __init__(self, exception_callback=None, reconnect=False,
+                 session=None, stall_timeout=None, **kwargs):
+        """
+            Optional Args:
+                exception_callback: Called with sys.exc_info() for errors
+                    that trigger a reconnect.
+                reconnect: True to reconnect automatically using the default
+                    ReconnectPolicy, or a ReconnectPolicy instance. Without
+                    it the iterator raises when the stream fails.
+                session: An aiohttp.ClientSession to share with other
+                    clients. One is created (and closed) otherwise.
+                stall_timeout: Seconds without receiving anything, not
+                    even a keep-alive, before the stream is considered dead
+                    and a StreamStalledException is raised (or reported,
+                    followed by a reconnect).
+        """
+        if aiohttp is None:
+            raise ImportError(
+                "AsyncPowerTrackClient requires aiohttp: "
+                "pip install gnippy[async]")
+        self.exception_callback = exception_callback
+        if reconnect is True:
+            reconnect = ReconnectPolicy()
+        self.reconnect = reconnect or None
+        self.session = session
+        self._owns_session = session is None
+        self.stall_timeout = stall_timeout
+        self.stream_stats = StreamStats()
+        self.schedule = None
+        c = config.resolve(kwargs)
+        self.url = c['url']
+        self.auth = c['auth']
+        credentials = "%s:%s" % self.auth
+        self._headers = {"Authorization": "Basic " + base64.b64encode(
+            credentials.encode("utf-8")).decode("ascii")}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def __aiter__(self):
+        return self.stream()
+
+    async def close(self):
+        if self._owns_session and self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def stats(self):
+        """
+            Counters and gauges for the stream, see PowerTrackClient.stats().
+            Callback latency isn't tracked since there's no callback.
+        """
+        snapshot = self.stream_stats.snapshot()
+        del snapshot['callback_latency']
+        return snapshot
+
+    async def stream(self, backfill_minutes=None):
+        """
+            Async generator over the raw activity lines (bytes) of the
+            stream. Keep-alive blank lines are skipped.
+        """
+        connection_url = get_connection_url(self.url, backfill_minutes)
+
+        if not self.reconnect:
+            async for line in self._consume(connection_url):
+                yield line
+            return
+
+        self.schedule = ReconnectSchedule(self.reconnect, connection_url)
+        while True:
+            established = [False]
+            status_code = None
+            try:
+                async for line in self._consume(self.schedule.next_url(),
+                                                established):
+                    yield line
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if isinstance(e, PowerTrackHTTPException):
+                    status_code = e.status_code
+                if self.schedule.exhausted(established[0]):
+                    raise
+                if self.exception_callback:
+                    self.exception_callback(sys.exc_info())
+
+            await asyncio.sleep(
+                self.schedule.disconnected(established[0], status_code))
+            self.stream_stats.increment("reconnects")
+
+    async def _consume(self, url, established=None):
+        if self.session is None:
+            self.session = aiohttp.ClientSession()
+
+        # The default aiohttp timeout would cut off a long-lived stream;
+        # sock_read measures the time since the last byte instead.
+        timeout = aiohttp.ClientTimeout(total=None,
+                                        sock_read=self.stall_timeout)
+        opened = False
+        try:
+            async with self.session.get(url, headers=self._headers,
+                                        timeout=timeout) as r:
+                if r.status != 200:
+                    raise PowerTrackHTTPException(r.status)
+
+                if established is not None:
+                    established[0] = True
+                stats = self.stream_stats
+                stats.connected()
+                opened = True
+
+                framer = LineFramer()
+                async for chunk in r.content.iter_any():
+                    keepalives = framer.keepalives
+                    lines = framer.feed(chunk)
+                    stats.record_chunk(len(chunk), len(lines),
+                                       framer.keepalives - keepalives)
+                    for line in lines:
+                        yield line
+        except asyncio.TimeoutError:
+            if self.stall_timeout is None:
+                raise
+            self.stream_stats.increment("stalls")
+            raise StreamStalledException(self.stall_timeout)
+        finally:
+            if opened:
+                self.stream_stats.disconnected()
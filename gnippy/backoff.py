@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+
+import random
+
+
+class Backoff(object):
+    """
+        A jittered exponential backoff schedule.
+        The delay before attempt n is initial * multiplier ** n, capped at
+        maximum, with up to a `jitter` fraction of it randomly shaved off
+        so that many clients don't reconnect in lockstep.
+    """
+
+    def __init__(self, initial, maximum, multiplier=2.0, jitter=0.5):
+        self.initial = initial
+        self.maximum = maximum
+        self.multiplier = multiplier
+        self.jitter = jitter
+
+    def delay(self, attempt):
+        d = min(self.maximum, self.initial * (self.multiplier ** attempt))
+        return d - random.uniform(0, d * self.jitter)
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+    Find redundancy in a rule set and compact it.
+
+    Every rule is reduced to a canonical form: keywords and operator
+    values lower-cased, nested ANDs and ORs flattened, and their clauses
+    de-duplicated and sorted. Rules with the same canonical form are
+    duplicates. A rule is subsumed by a broader one when each clause of
+    the broader rule is a clause of the narrower one (or an OR of the
+    broader rule contains it), e.g. "coffee lang:en" by "coffee OR tea".
+    Candidates are found through an index of clauses, never by comparing
+    every pair of rules.
+"""
+
+from collections import defaultdict
+from itertools import combinations_with_replacement
+
+from gnippy.rulesyntax import count_clauses, format_rule, \
+    MAX_NEGATED_CLAUSES, MAX_POSITIVE_CLAUSES, MAX_RULE_LENGTH, parse, \
+    RuleSyntaxError
+
+
+# Operators whose values are case-insensitive.
+_CASELESS_OPERATORS = frozenset(("from", "to", "lang", "has", "is",
+                                 "retweets_of", "contains", "sample"))
+
+
+def _canonical_tree(node):
+    kind = node[0]
+    if kind == "not":
+        return ("not", _canonical_tree(node[1]))
+    if kind in ("and", "or"):
+        children = {}
+        for child in node[1]:
+            child = _canonical_tree(child)
+            # (a OR b) OR c is a OR b OR c.
+            for leaf in (child[1] if child[0] == kind else [child]):
+                children[format_rule(leaf, kind)] = leaf
+        if len(children) == 1:
+            return list(children.values())[0]
+        return (kind, [children[key] for key in sorted(children)])
+    text = node[1]
+    if kind == "phrase":
+        return (kind, " ".join(text.lower().split()))
+    name, colon, operand = text.partition(":")
+    if colon and name not in _CASELESS_OPERATORS and \
+            name.replace("_", "").isalpha() and not operand.startswith("//"):
+        return (kind, text)
+    return (kind, text.lower())
+
+
+def canonical(value):
+    """ The canonical form of a rule value. Raises RuleSyntaxError. """
+    return format_rule(_canonical_tree(parse(value)))
+
+
+class _Shape(object):
+    """ A rule's canonical form broken into conjuncts and their disjuncts. """
+    __slots__ = ("rule", "key", "conjuncts", "conjunct_set", "disjuncts",
+                 "lookup", "positive", "negated")
+
+    def __init__(self, rule, tree, parsed):
+        self.rule = rule
+        self.key = format_rule(tree)
+        parts = tree[1] if tree[0] == "and" else [tree]
+        self.conjuncts = [format_rule(p, "and") for p in parts]
+        self.disjuncts = dict(
+            (c, frozenset(format_rule(d, "or") for d in p[1])
+             if p[0] == "or" else frozenset([c]))
+            for c, p in zip(self.conjuncts, parts))
+        self.conjunct_set = frozenset(self.conjuncts)
+        # A clause per conjunct that a broader rule covering it would
+        # have among the disjuncts of one of its conjuncts.
+        clauses = sorted(set(min(self.disjuncts[c]) for c in self.conjuncts))
+        self.lookup = [(c,) for c in clauses] + \
+            list(combinations_with_replacement(clauses, 2))
+        # Merged rules are built from the values as written, so count
+        # their clauses rather than the de-duplicated canonical ones.
+        self.positive, self.negated = count_clauses(parsed)
+
+    def index_keys(self, frequency):
+        """
+            The keys to file this rule under: the disjuncts of its least
+            common conjunct or, with several conjuncts, pairs of disjuncts
+            of its two least common ones, so that only rules sharing both
+            are ever compared with it.
+        """
+        rarest = sorted(self.conjuncts, key=lambda c: frequency[c])[:2]
+        if len(rarest) == 1:
+            return [(d,) for d in self.disjuncts[rarest[0]]]
+        return [tuple(sorted((d1, d2)))
+                for d1 in self.disjuncts[rarest[0]]
+                for d2 in self.disjuncts[rarest[1]]]
+
+    def covers(self, clause, other):
+        """ Does our conjunct `clause` hold whenever `other`'s conjuncts do? """
+        mine = self.disjuncts[clause]
+        for c in other.conjuncts:
+            if c == clause or other.disjuncts[c] <= mine:
+                return True
+        return False
+
+    def subsumes(self, other):
+        if self.key == other.key:
+            return False
+        for c in self.conjunct_set - other.conjunct_set:
+            # Only an OR can be covered by anything but itself.
+            if len(self.disjuncts[c]) == 1 or not self.covers(c, other):
+                return False
+        return True
+
+
+class RuleSetAnalysis(object):
+    """
+        The result of analyze():
+            invalid: (rule, error) pairs for rules that don't parse.
+            duplicates: Lists of rules that have the same canonical form,
+                whatever their tags.
+            subsumed: (rule, broader_rule) pairs.
+            merged: (merged_rule, [rules]) pairs for the OR-groups made.
+            compacted: The smallest equivalent rule set found: one rule
+                per duplicate group, no subsumed rules and, with merging,
+                rules with the same tag ORed together within the limits.
+                Unless tags were ignored, only rules with the same tag are
+                combined, so every activity keeps its tags. Invalid rules
+                are passed through untouched.
+    """
+
+    def __init__(self):
+        self.invalid = []
+        self.duplicates = []
+        self.subsumed = []
+        self.merged = []
+        self.compacted = []
+
+
+def analyze(rules_list, merge=True, ignore_tags=False,
+            max_length=MAX_RULE_LENGTH, max_positive=MAX_POSITIVE_CLAUSES,
+            max_negated=MAX_NEGATED_CLAUSES):
+    """
+        Analyze the rules (as returned by get_rules) for redundancy and
+        propose a compacted rule set. Returns a RuleSetAnalysis.
+    """
+    analysis = RuleSetAnalysis()
+    tag_of = (lambda rule: None) if ignore_tags else \
+        (lambda rule: rule.get('tag') or None)
+
+    # Duplicates: one shape per canonical form (and tag).
+    groups = defaultdict(list)
+    shapes = {}
+    for rule in rules_list:
+        try:
+            parsed = parse(rule['value'])
+            shape = _Shape(rule, _canonical_tree(parsed), parsed)
+        except RuleSyntaxError as e:
+            analysis.invalid.append((rule, str(e)))
+            continue
+        groups[shape.key].append(rule)
+        shapes.setdefault((shape.key, tag_of(rule)), shape)
+    analysis.duplicates = [g for g in groups.values() if len(g) > 1]
+
+    # Subsumption: index each rule under its least common conjuncts; a
+    # broader rule can only cover a narrower one that has them too.
+    frequency = defaultdict(int)
+    for shape in shapes.values():
+        for c in shape.conjuncts:
+            frequency[c] += 1
+    index = defaultdict(list)
+    for shape in shapes.values():
+        for key in shape.index_keys(frequency):
+            index[key].append(shape)
+
+    removed = set()
+    for (key, tag), shape in shapes.items():
+        candidates = {}
+        for d in shape.lookup:
+            for broader in index.get(d, ()):
+                candidates[id(broader)] = broader
+        for broader in candidates.values():
+            if broader.subsumes(shape):
+                analysis.subsumed.append((shape.rule, broader.rule))
+                if tag_of(broader.rule) == tag:
+                    removed.add((key, tag))
+    # Report each subsumed rule once, against the first broader rule found.
+    first = {}
+    for rule, broader in analysis.subsumed:
+        first.setdefault(id(rule), (rule, broader))
+    analysis.subsumed = list(first.values())
+
+    kept = [(tag, shape) for (key, tag), shape in shapes.items()
+            if (key, tag) not in removed]
+    # Keep the input order.
+    order = dict((id(rule), i) for i, rule in enumerate(rules_list))
+    kept.sort(key=lambda item: order[id(item[1].rule)])
+
+    analysis.compacted = [rule for rule, error in analysis.invalid]
+    if not merge:
+        analysis.compacted.extend(shape.rule for tag, shape in kept)
+        return analysis
+
+    by_tag = defaultdict(list)
+    for tag, shape in kept:
+        by_tag[tag].append(shape)
+    for tag, tag_shapes in by_tag.items():
+        for group in _pack(tag_shapes, max_length, max_positive,
+                           max_negated):
+            if len(group) == 1:
+                analysis.compacted.append(group[0].rule)
+                continue
+            rule = {'value': " OR ".join(_or_member(s) for s in group)}
+            if tag is not None:
+                rule['tag'] = tag
+            analysis.compacted.append(rule)
+            analysis.merged.append((rule, [s.rule for s in group]))
+    return analysis
+
+
+def _or_member(shape):
+    """ A rule's value as one side of an OR. """
+    value = shape.rule['value']
+    return value if len(shape.conjuncts) == 1 and \
+        not value.startswith("-") else "(%s)" % value
+
+
+def _pack(shapes, max_length, max_positive, max_negated):
+    """
+        First-fit decreasing packing of rules into OR-groups. Groups that
+        can't take even the smallest rule are set aside, which keeps the
+        search short.
+    """
+    sized = sorted(((len(_or_member(s)), s) for s in shapes),
+                   key=lambda item: item[0], reverse=True)
+    if not sized:
+        return []
+    smallest = sized[-1][0] + len(" OR ")
+    full = []
+    open_groups = []
+    for size, shape in sized:
+        for group in open_groups:
+            if group[1] + len(" OR ") + size <= max_length and \
+                    group[2] + shape.positive <= max_positive and \
+                    group[3] + shape.negated <= max_negated:
+                group[0].append(shape)
+                group[1] += len(" OR ") + size
+                group[2] += shape.positive
+                group[3] += shape.negated
+                break
+        else:
+            group = [[shape], size, shape.positive, shape.negated]
+            open_groups.append(group)
+        if group[2] >= max_positive or group[3] >= max_negated or \
+                group[1] + smallest > max_length:
+            open_groups.remove(group)
+            full.append(group)
+    return [group[0] for group in full + open_groups]
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+from six import text_type
+
+from gnippy.errors import BadArgumentException
+
+
+def _load_json():
+    return json.loads
+
+
+def _load_ujson():
+    import ujson
+    return ujson.loads
+
+
+def _load_orjson():
+    import orjson
+    return orjson.loads
+
+
+# Fastest first. These all accept the raw bytes the Worker hands out.
+PARSERS = (
+    ("orjson", _load_orjson),
+    ("ujson", _load_ujson),
+    ("json", _load_json),
+)
+
+
+def get_parser(parser=None):
+    """
+        Returns a loads() function.
+        parser can be a callable (returned as-is), the name of one of
+        PARSERS, or None for the fastest one that is installed.
+    """
+    if callable(parser):
+        return parser
+
+    for name, load in PARSERS:
+        if parser is None:
+            try:
+                return load()
+            except ImportError:
+                continue
+        elif parser == name:
+            return load()
+
+    raise BadArgumentException(
+        "Unknown parser '%s'. Use one of: %s" % (
+            parser, ", ".join(name for name, load in PARSERS)))
+
+
+_raw_decode = json.JSONDecoder().raw_decode
+
+
+def _scan_value(line, key, last=False, window=256):
+    """
+        Decode only the value of `key` in the raw activity (its first
+        occurrence, or its last if `last` is True). A quote inside a JSON
+        string is always escaped, so the literal sequence "key": can only
+        be an actual key. Only `window` characters after the key are
+        decoded unless the value turns out to be longer.
+        Returns None when the key is missing.
+    """
+    if isinstance(line, text_type):
+        marker = u'"%s":' % key
+    else:
+        marker = ('"%s":' % key).encode("ascii")
+    start = line.rfind(marker) if last else line.find(marker)
+    if start == -1:
+        return None
+    start += len(marker)
+
+    for end in (start + window, None):
+        tail = line[start:end]
+        try:
+            if not isinstance(tail, text_type):
+                tail = tail.decode("utf-8")
+            return _raw_decode(tail.lstrip())[0]
+        except ValueError:
+            if end is None or end >= len(line):
+                raise
+
+
+def extract_id(line):
+    """
+        Return the activity's id without decoding the whole activity.
+        Relies on the top level id preceding any nested object that has
+        its own id, which holds for both the Activity Streams and the
+        original Twitter formats GNIP delivers.
+    """
+    return _scan_value(line, "id")
+
+
+def extract_matching_rules(line):
+    """
+        Return the gnip matching_rules list (dicts with "tag" and
+        "id"/"value") without decoding the whole activity, or [] if the
+        activity has none.
+    """
+    return _scan_value(line, "matching_rules", last=True) or []
+
+
+def extract_matching_rule_tags(line):
+    """ The tags of the rules that matched this activity. """
+    return [rule.get("tag") for rule in extract_matching_rules(line)]
+
+
+class LazyActivity(object):
+    """
+        Wraps a raw activity and only decodes the parts that are asked
+        for: `id` and `matching_rules` are pulled out with a partial scan,
+        and the full activity is parsed the first time json() is called.
+    """
+    __slots__ = ("raw", "_loads", "_id", "_matching_rules", "_data")
+
+    _missing = object()
+
+    def __init__(self, raw, loads=json.loads):
+        self.raw = raw
+        self._loads = loads
+        self._id = self._missing
+        self._matching_rules = self._missing
+        self._data = self._missing
+
+    @property
+    def id(self):
+        if self._id is self._missing:
+            if self._data is not self._missing:
+                self._id = self._data.get("id")
+            else:
+                self._id = extract_id(self.raw)
+        return self._id
+
+    @property
+    def matching_rules(self):
+        if self._matching_rules is self._missing:
+            self._matching_rules = extract_matching_rules(self.raw)
+        return self._matching_rules
+
+    @property
+    def matching_rule_tags(self):
+        return [rule.get("tag") for rule in self.matching_rules]
+
+    def json(self):
+        if self._data is self._missing:
+            self._data = self._loads(self.raw)
+        return self._data
+
+
+class Decoder(object):
+    """
+        Callback wrapper that decodes each activity before passing it on.
+        With lazy=True the callback receives LazyActivity objects instead
+        of dicts. Works for batch callbacks too (batch=True), in which case
+        the whole list is decoded on the thread that delivers it.
+    """
+
+    def __init__(self, callback, parser=None, lazy=False, batch=False):
+        self.callback = callback
+        self.loads = get_parser(parser)
+        self.lazy = lazy
+        self.batch = batch
+
+    def decode(self, line):
+        if self.lazy:
+            return LazyActivity(line, self.loads)
+        return self.loads(line)
+
+    def decode_batch(self, lines):
+        decode = self.decode
+        return [decode(line) for line in lines]
+
+    def __call__(self, data):
+        if self.batch:
+            self.callback(self.decode_batch(data))
+        else:
+            self.callback(self.decode(data))
@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+
+from collections import deque
+import os
+import sys
+import threading
+import time
+
+from six import text_type
+from six.moves import queue
+
+from gnippy.errors import BadArgumentException
+
+
+OVERFLOW_BLOCK = "block"
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_SPILL = "spill"
+OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_SPILL)
+
+
+class ActivityQueue(object):
+    """
+        A bounded FIFO that sits between the stream reader and the
+        consumers. What happens when it fills up depends on `overflow`:
+            block: the reader waits for a consumer to make room.
+            drop_oldest: the oldest queued line is discarded.
+            spill: lines go to an append-only file at spill_path and are
+                read back, in order, once the consumers catch up.
+                Spilled lines are returned as bytes.
+    """
+
+    def __init__(self, maxsize, overflow=OVERFLOW_BLOCK, spill_path=None):
+        if maxsize < 1:
+            raise BadArgumentException("maxsize must be at least 1")
+        if overflow not in OVERFLOW_POLICIES:
+            raise BadArgumentException(
+                "overflow must be one of: %s" % ", ".join(OVERFLOW_POLICIES))
+        if overflow == OVERFLOW_SPILL and not spill_path:
+            raise BadArgumentException(
+                "spill_path is required when overflow is 'spill'")
+
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.spill_path = spill_path
+        self.dropped = 0
+        self.spilled = 0
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._spill = None
+        self._spill_pending = 0
+        self._spill_read_offset = 0
+        self._spill_write_offset = 0
+
+    def qsize(self):
+        """ Number of lines waiting, including those spilled to disk. """
+        with self._cond:
+            return len(self._items) + self._spill_backlog()
+
+    def put(self, line):
+        with self._cond:
+            if self._spill_backlog():
+                # Keep FIFO order: once we've started spilling, everything
+                # goes to disk until the consumers have read it back.
+                self._spill_line(line)
+            elif len(self._items) < self.maxsize:
+                self._items.append(line)
+            elif self.overflow == OVERFLOW_DROP_OLDEST:
+                self._items.popleft()
+                self._items.append(line)
+                self.dropped += 1
+            elif self.overflow == OVERFLOW_SPILL:
+                self._spill_line(line)
+            else:
+                while len(self._items) >= self.maxsize:
+                    self._cond.wait()
+                self._items.append(line)
+            self._cond.notify_all()
+
+    def get(self, timeout=None):
+        """
+            Remove and return the oldest line.
+            Raises queue.Empty if nothing arrives within `timeout` seconds.
+        """
+        with self._cond:
+            if not self._items and self._spill_backlog():
+                self._refill_from_spill()
+            if not self._items:
+                self._cond.wait(timeout)
+                if not self._items and self._spill_backlog():
+                    self._refill_from_spill()
+                if not self._items:
+                    raise queue.Empty()
+            line = self._items.popleft()
+            self._cond.notify_all()
+            return line
+
+    def close(self):
+        """ Remove the spill file, if any. """
+        with self._cond:
+            if self._spill is not None:
+                self._spill.close()
+                self._spill = None
+                os.remove(self.spill_path)
+
+    def _spill_backlog(self):
+        return self._spill_pending
+
+    def _spill_line(self, line):
+        if self._spill is None:
+            self._spill = open(self.spill_path, "w+b")
+        if isinstance(line, text_type):
+            line = line.encode("utf-8")
+        self._spill.seek(self._spill_write_offset)
+        self._spill.write(line + b"\n")
+        self._spill_write_offset = self._spill.tell()
+        self._spill_pending += 1
+        self.spilled += 1
+
+    def _refill_from_spill(self):
+        self._spill.flush()
+        self._spill.seek(self._spill_read_offset)
+        while len(self._items) < self.maxsize and self._spill_backlog():
+            line = self._spill.readline()
+            self._spill_read_offset = self._spill.tell()
+            self._spill_pending -= 1
+            self._items.append(line[:-1])
+        if not self._spill_backlog():
+            # Fully drained, so the file can be reused from the start.
+            self._spill.seek(0)
+            self._spill.truncate()
+            self._spill_read_offset = self._spill_write_offset = 0
+
+
+class ConsumerPool(object):
+    """
+        A fixed number of threads that drain an ActivityQueue and hand
+        each line to `callback`. Exceptions raised by the callback are
+        passed to `exception_callback` as sys.exc_info() and the consumer
+        carries on with the next line.
+    """
+
+    poll_interval = 0.1
+
+    def __init__(self, activity_queue, callback, consumers=1,
+                 exception_callback=None):
+        if consumers < 1:
+            raise BadArgumentException("consumers must be at least 1")
+        self.queue = activity_queue
+        self.callback = callback
+        self.on_error = exception_callback
+        self._stop_event = threading.Event()
+        self._threads = []
+        for i in range(consumers):
+            t = threading.Thread(target=self._consume,
+                                 name="gnippy-consumer-%d" % i)
+            t.setDaemon(True)
+            self._threads.append(t)
+
+    def start(self):
+        for t in self._threads:
+            t.start()
+
+    def stop(self):
+        """ Stop the consumers once the queue has been drained. """
+        self._stop_event.set()
+
+    def join(self, timeout=None):
+        for t in self._threads:
+            t.join(timeout)
+
+    def _consume(self):
+        while True:
+            try:
+                line = self.queue.get(timeout=self.poll_interval)
+            except queue.Empty:
+                if self._stop_event.isSet():
+                    return
+                continue
+
+            try:
+                self.callback(line)
+            except Exception:
+                if self.on_error:
+                    self.on_error(sys.exc_info())
+
+
+class QueuedCallback(object):
+    """
+        Puts (callback, line) pairs on a queue shared by several streams,
+        so that one ConsumerPool (using call_pair) can serve them all.
+        drain() waits for the lines queued so far to be delivered.
+    """
+
+    poll_interval = 0.1
+
+    def __init__(self, activity_queue, callback):
+        self.queue = activity_queue
+        self.callback = callback
+        self._queued = 0
+        self._active = 0
+        self._cond = threading.Condition()
+
+    def __call__(self, line):
+        with self._cond:
+            self._queued += 1
+        self.queue.put((self._deliver, line))
+
+    def _deliver(self, line):
+        with self._cond:
+            self._queued -= 1
+            self._active += 1
+        try:
+            self.callback(line)
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._cond.notify_all()
+
+    def drain(self):
+        """
+            Wait until the lines queued so far have been delivered. Stops
+            waiting for queued lines once the shared queue is empty, since
+            a drop_oldest queue may have discarded some of them.
+        """
+        with self._cond:
+            while self._active or (self._queued and self.queue.qsize()):
+                self._cond.wait(self.poll_interval)
+
+
+def call_pair(item):
+    """ ConsumerPool callback for queues filled by QueuedCallback. """
+    callback, line = item
+    callback(line)
+
+
+class Batcher(object):
+    """
+        Collects lines and hands them to `callback` as a list once either
+        `max_size` lines are pending or the oldest pending line has waited
+        `max_latency` seconds. Instances are callable so they can be used
+        anywhere a per-line callback is expected, and are safe to call
+        from several threads.
+    """
+
+    def __init__(self, callback, max_size=500, max_latency=0.5,
+                 exception_callback=None):
+        if max_size < 1:
+            raise BadArgumentException("max_size must be at least 1")
+        self.callback = callback
+        self.max_size = max_size
+        self.max_latency = max_latency
+        self.on_error = exception_callback
+        self._batch = []
+        self._first_at = None
+        self._cond = threading.Condition()
+        self._deliver_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._timer = threading.Thread(target=self._flush_when_due,
+                                       name="gnippy-batcher")
+        self._timer.setDaemon(True)
+
+    def __call__(self, line):
+        with self._cond:
+            if not self._batch:
+                self._first_at = time.time()
+                self._cond.notify_all()
+            self._batch.append(line)
+            # Once stopped there's no timer, so deliver straight away.
+            full = len(self._batch) >= self.max_size or \
+                self._stop_event.isSet()
+        if full:
+            self.flush()
+
+    def start(self):
+        self._timer.start()
+
+    def stop(self):
+        """ Stop the latency timer and deliver whatever is still pending. """
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._timer.is_alive():
+            self._timer.join()
+        self.flush()
+
+    def flush(self):
+        """ Deliver the pending lines now, if there are any. """
+        with self._deliver_lock:
+            with self._cond:
+                batch, self._batch = self._batch, []
+                self._first_at = None
+            if batch:
+                self._deliver(batch)
+
+    def _deliver(self, batch):
+        try:
+            self.callback(batch)
+        except Exception:
+            if self.on_error:
+                self.on_error(sys.exc_info())
+            else:
+                raise
+
+    def _flush_when_due(self):
+        while not self._stop_event.isSet():
+            with self._cond:
+                # stop() notifies while holding _cond, so checking again
+                # here means its wakeup can't arrive before we wait.
+                if self._stop_event.isSet():
+                    return
+                if self._first_at is None:
+                    self._cond.wait()
+                    continue
+                remaining = self._first_at + self.max_latency - time.time()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+            try:
+                self.flush()
+            except Exception:
+                # Without an exception_callback there's nowhere to report
+                # this; keep the timer alive for the next batch.
+                pass
@@ -16,8 +16,10 @@ class BadArgumentException(Exception):
 
 
 class RuleAddFailedException(Exception):
-    """ Raised when a rule add fails. """
-    pass
+    """ Raised when a rule add fails. `report` says which rules failed. """
+    def __init__(self, message, report=None):
+        super(RuleAddFailedException, self).__init__(message)
+        self.report = report
 
 
 class RulesListFormatException(Exception):
@@ -25,6 +27,21 @@ class RulesListFormatException(Exception):
     pass
 
 
+class RuleSyntaxException(RulesListFormatException):
+    """ Raised when rules fail validation. `invalid` holds (rule, [errors]) pairs. """
+    def __init__(self, invalid):
+        super(RuleSyntaxException, self).__init__(
+            "%d invalid rules: %s" % (len(invalid), "; ".join(
+                "'%s': %s" % (rule['value'], ", ".join(errors))
+                for rule, errors in invalid[:10])))
+        self.invalid = invalid
+
+
+class RuleSyntaxWarning(UserWarning):
+    """ Warned when a rule uses an operator that local validation doesn't know. """
+    pass
+
+
 class RulesGetFailedException(Exception):
     """ Raised when listing the current rule set fails. """
     pass
@@ -36,5 +53,24 @@ class BadPowerTrackUrlException(Exception):
 
 
 class RuleDeleteFailedException(Exception):
-    """ Raised when a rule delete fails. """
-    pass
\ No newline at end of file
+    """ Raised when a rule delete fails. `report` says which rules failed. """
+    def __init__(self, message, report=None):
+        super(RuleDeleteFailedException, self).__init__(message)
+        self.report = report
+
+
+class PowerTrackHTTPException(Exception):
+    """ Raised when the PowerTrack stream responds with a non-200 status. """
+    def __init__(self, status_code):
+        super(PowerTrackHTTPException, self).__init__(
+            "GNIP returned HTTP {}".format(status_code))
+        self.status_code = status_code
+
+
+class StreamStalledException(Exception):
+    """ Raised when nothing, not even a keep-alive, arrives on the stream for too long. """
+    def __init__(self, idle_seconds):
+        super(StreamStalledException, self).__init__(
+            "No data received from GNIP for {:.1f} seconds".format(
+                idle_seconds))
+        self.idle_seconds = idle_seconds
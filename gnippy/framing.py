@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+import zlib
+
+# PowerTrack delimits activities with \r\n and sends a bare \r\n roughly
+# every 10 seconds as a keep-alive.
+DELIMITER = b"\r\n"
+
+# Read size for the stream. Activities are several KB each, so the 512
+# byte default of requests' iter_lines means many reads per activity.
+# For chunked responses urllib3 returns each HTTP chunk as soon as it
+# arrives (up to this size), so a large value doesn't add latency.
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+class LineFramer(object):
+    """
+        Splits a stream of byte chunks into PowerTrack activities.
+
+        feed() returns the complete activities found so far and keeps any
+        trailing partial activity for the next call. Each activity is
+        copied exactly once (by the C-level bytes.split); the only other
+        copy is joining a partial activity onto the next chunk. Keep-alive
+        blank lines are not returned, they are counted in `keepalives`.
+        A partial activity left when the stream drops is discarded.
+    """
+
+    def __init__(self):
+        self.keepalives = 0
+        self._pending = b""
+
+    def feed(self, chunk):
+        if self._pending:
+            chunk = self._pending + chunk
+        lines = chunk.split(DELIMITER)
+        self._pending = lines.pop()
+        activities = [line for line in lines if line]
+        self.keepalives += len(lines) - len(activities)
+        return activities
+
+
+class GzipDecoder(object):
+    """
+        Incrementally decompresses a gzip stream. decompress() returns
+        everything zlib can produce from the input so far, so activities
+        reach the framer as soon as their compressed bytes arrive.
+    """
+
+    def __init__(self):
+        self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def decompress(self, chunk):
+        data = self._decompressor.decompress(chunk)
+        unused = self._decompressor.unused_data
+        while unused:
+            # The stream is a series of gzip members; start on the next.
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            data += self._decompressor.decompress(unused)
+            unused = self._decompressor.unused_data
+        return data
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+from gnippy.dispatch import ActivityQueue, ConsumerPool, OVERFLOW_BLOCK, \
+    call_pair
+from gnippy.errors import BadArgumentException
+from gnippy.powertrackclient import PowerTrackClient
+
+
+# Stats that are summed across streams by StreamManager.stats()
+SUMMED_STATS = ("bytes", "bytes_per_second", "compressed_bytes",
+                "activities", "activities_per_second", "heartbeats",
+                "reconnects", "stalls")
+
+
+class StreamManager(object):
+    """
+        Runs several PowerTrack streams in one process.
+
+        Each stream is a PowerTrackClient whose configuration is resolved
+        the usual way (url/auth/config_file_path kwargs, environment, or
+        ~/.gnippy). Every stream keeps its own reader thread, but callbacks
+        for all of them run on one shared ConsumerPool, and a single
+        supervisor thread restarts streams whose worker has died.
+        Streams can be added and removed while the others keep running.
+
+        Usage:
+            manager = StreamManager([
+                {"name": "prod", "callback": on_prod, "url": prod_url},
+                {"name": "replay", "callback": on_replay, "url": replay_url},
+            ], consumers=8)
+            manager.start()
+            manager.add_stream("labels", on_labels, url=labels_url)
+            print(manager.stats())
+            manager.stop()
+    """
+
+    def __init__(self, streams=None, consumers=4, queue_size=10000,
+                 overflow=OVERFLOW_BLOCK, exception_callback=None,
+                 supervise_interval=5):
+        """
+            Args:
+                streams: A list of dicts, each with a "name", a "callback"
+                    and any other PowerTrackClient keyword arguments.
+                consumers: Size of the shared consumer pool.
+                queue_size, overflow: See ActivityQueue. The "spill" policy
+                    can't be used since queued items aren't plain lines.
+                exception_callback: Called with (stream name, exc_info).
+                    The name is None for errors raised by callbacks on the
+                    shared consumer pool.
+                supervise_interval: Seconds between health checks.
+        """
+        self.queue = ActivityQueue(queue_size, overflow)
+        self.consumer_pool = ConsumerPool(
+            self.queue, call_pair, consumers=consumers,
+            exception_callback=self._error_handler(None))
+        self.exception_callback = exception_callback
+        self.supervise_interval = supervise_interval
+        self.restarts = {}
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._supervisor = None
+        for stream in streams or []:
+            stream = dict(stream)
+            self.add_stream(stream.pop("name"), stream.pop("callback"),
+                            connect=False, **stream)
+
+    def start(self):
+        """ Start the consumers, the supervisor and every stream. """
+        self.consumer_pool.start()
+        self._supervisor = threading.Thread(target=self._supervise,
+                                            name="gnippy-supervisor")
+        self._supervisor.setDaemon(True)
+        self._supervisor.start()
+        with self._lock:
+            for client in self._clients.values():
+                client.connect()
+
+    def stop(self):
+        """ Disconnect every stream and drain the shared queue. """
+        self._stop_event.set()
+        if self._supervisor:
+            self._supervisor.join()
+        with self._lock:
+            clients = [client for client in self._clients.values()
+                       if hasattr(client, "worker")]
+        # Stop reading everywhere first, then let the consumers deliver
+        # each stream's backlog before its batching is torn down.
+        for client in clients:
+            client.worker.stop()
+        for client in clients:
+            client.disconnect()
+        self.consumer_pool.stop()
+        self.consumer_pool.join()
+
+    def add_stream(self, name, callback, connect=None, **kwargs):
+        """
+            Add a stream. It is connected right away if the manager has
+            been started (or connect=True). Streams reconnect on their own
+            unless reconnect=False is passed.
+        """
+        kwargs.setdefault("reconnect", True)
+        kwargs.pop("queue_size", None)
+        client = PowerTrackClient(
+            callback, exception_callback=self._error_handler(name),
+            shared_queue=self.queue, **kwargs)
+        with self._lock:
+            if name in self._clients:
+                raise BadArgumentException(
+                    "A stream named '%s' already exists" % name)
+            self._clients[name] = client
+            self.restarts[name] = 0
+        if connect or (connect is None and self._supervisor is not None):
+            client.connect()
+        return client
+
+    def remove_stream(self, name):
+        """ Disconnect a stream and forget about it. """
+        with self._lock:
+            client = self._clients.pop(name)
+            self.restarts.pop(name, None)
+        if hasattr(client, "worker"):
+            client.disconnect()
+        return client
+
+    def streams(self):
+        with self._lock:
+            return sorted(self._clients)
+
+    def get_stream(self, name):
+        with self._lock:
+            return self._clients[name]
+
+    def health(self):
+        """ {name: {"connected": bool, "restarts": int, "stats": dict}} """
+        with self._lock:
+            items = list(self._clients.items())
+            restarts = dict(self.restarts)
+        result = {}
+        for name, client in items:
+            result[name] = {
+                "connected": hasattr(client, "worker") and client.connected(),
+                "restarts": restarts.get(name, 0),
+                "stats": client.stats(),
+            }
+        return result
+
+    def stats(self):
+        """ Totals across all streams, plus the shared queue depth. """
+        health = self.health()
+        totals = dict((key, 0) for key in SUMMED_STATS)
+        for stream in health.values():
+            for key in SUMMED_STATS:
+                totals[key] += stream["stats"][key]
+        totals["streams"] = len(health)
+        totals["connected_streams"] = sum(
+            1 for stream in health.values() if stream["connected"])
+        totals["queue_depth"] = self.queue.qsize()
+        totals["queue_dropped"] = self.queue.dropped
+        return totals
+
+    def _error_handler(self, name):
+        def on_error(exinfo):
+            if self.exception_callback:
+                self.exception_callback(name, exinfo)
+        return on_error
+
+    def _supervise(self):
+        while not self._stop_event.wait(self.supervise_interval):
+            with self._lock:
+                items = list(self._clients.items())
+            for name, client in items:
+                if hasattr(client, "worker") and not client.connected():
+                    with self._lock:
+                        if self._clients.get(name) is not client:
+                            continue
+                        self.restarts[name] += 1
+                    # Tear down the old delivery pipeline before restarting.
+                    client.disconnect()
+                    client.connect()
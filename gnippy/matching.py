@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""
+    Evaluate PowerTrack rules against activities locally, e.g. to replay a
+    spool against a candidate rule set.
+
+    Every activity is reduced to a set of features: the lower-cased words
+    of its text plus #hashtags, @mentions and operator features such as
+    "lang:en", "from:gnip", "has:links" and "is:retweet". Each compiled
+    rule is indexed under a few features at least one of which must be
+    present for it to match, so an activity is only checked against the
+    rules that share a feature with it rather than against every rule.
+"""
+
+import re
+
+from six import string_types
+
+from gnippy.decoding import get_parser
+from gnippy.rulesyntax import parse, RuleSyntaxError
+
+
+_WORDS = re.compile(r"\w+", re.UNICODE)
+_TAGS = re.compile(r"[#@$]\w+", re.UNICODE)
+
+# Operators whose value is matched as a feature of the activity.
+FEATURE_OPERATORS = frozenset(("from", "lang", "has", "is"))
+
+
+class UnsupportedRuleException(Exception):
+    """ Raised when a rule uses syntax the local matcher can't evaluate. """
+    pass
+
+
+def _words(text):
+    """ Lower-cased words, ignoring punctuation. """
+    return _WORDS.findall(text.lower())
+
+
+def _get(obj, *path):
+    for key in path:
+        if not isinstance(obj, dict):
+            return None
+        obj = obj.get(key)
+    return obj
+
+
+class ActivityFeatures(object):
+    """
+        The text and features of an activity, in either the Activity
+        Streams or the original Twitter format.
+    """
+    __slots__ = ("features", "text", "_joined")
+
+    def __init__(self, activity):
+        if "body" in activity or "verb" in activity:
+            self._activity_streams(activity)
+        else:
+            self._original(activity)
+        self._joined = None
+
+    def _activity_streams(self, a):
+        self.text = _get(a, "long_object", "body") or a.get("body") or ""
+        entities = a.get("twitter_entities") or {}
+        features = self._common(entities, a.get("twitter_lang"))
+        actor = a.get("actor") or {}
+        if actor.get("preferredUsername"):
+            features.add("from:" + actor["preferredUsername"].lower())
+        if actor.get("id"):
+            features.add("from:" + actor["id"].rsplit(":", 1)[-1])
+        if a.get("verb") == "share":
+            features.add("is:retweet")
+        if a.get("inReplyTo"):
+            features.add("is:reply")
+        if a.get("twitter_quoted_status"):
+            features.add("is:quote")
+        if a.get("geo") or a.get("location"):
+            features.add("has:geo")
+        if (a.get("gnip") or {}).get("urls") or entities.get("urls"):
+            features.add("has:links")
+
+    def _original(self, a):
+        self.text = _get(a, "extended_tweet", "full_text") or \
+            a.get("text") or ""
+        entities = _get(a, "extended_tweet", "entities") or \
+            a.get("entities") or {}
+        features = self._common(entities, a.get("lang"))
+        user = a.get("user") or {}
+        if user.get("screen_name"):
+            features.add("from:" + user["screen_name"].lower())
+        if user.get("id_str"):
+            features.add("from:" + user["id_str"])
+        if a.get("retweeted_status"):
+            features.add("is:retweet")
+        if a.get("in_reply_to_status_id_str"):
+            features.add("is:reply")
+        if a.get("is_quote_status"):
+            features.add("is:quote")
+        if a.get("coordinates") or a.get("place"):
+            features.add("has:geo")
+        if entities.get("urls"):
+            features.add("has:links")
+
+    def _common(self, entities, lang):
+        features = self.features = set(_words(self.text))
+        features.update(_TAGS.findall(self.text.lower()))
+        if lang:
+            features.add("lang:" + lang.lower())
+            features.add("has:lang")
+        for tag in entities.get("hashtags") or ():
+            features.add("#" + tag["text"].lower())
+            features.add("has:hashtags")
+        for mention in entities.get("user_mentions") or ():
+            features.add("@" + mention["screen_name"].lower())
+            features.add("has:mentions")
+        if entities.get("symbols"):
+            features.add("has:symbols")
+        for media in entities.get("media") or ():
+            features.add("has:media")
+            features.add("has:videos" if media.get("type") in
+                         ("video", "animated_gif") else "has:images")
+        return features
+
+    @property
+    def joined(self):
+        """ The words joined by single spaces, for phrase matching. """
+        if self._joined is None:
+            self._joined = " %s " % " ".join(_words(self.text))
+        return self._joined
+
+
+def _compile(node):
+    """
+        Turn a rulesyntax tree into a tree of
+            ("feature", name), ("phrase", " words "), ("contains", text),
+            ("and", [nodes]), ("or", [nodes]), ("not", node)
+    """
+    kind = node[0]
+    if kind in ("and", "or"):
+        return (kind, [_compile(child) for child in node[1]])
+    if kind == "not":
+        return ("not", _compile(node[1]))
+    text = node[1]
+    if kind == "phrase":
+        return _words_node(text[1:-1].replace('\\"', '"'))
+    name, colon, operand = text.partition(":")
+    if colon and name.replace("_", "").isalpha() and \
+            not operand.startswith("//"):
+        if name in FEATURE_OPERATORS:
+            return ("feature", "%s:%s" % (name, operand.lower()))
+        if name == "contains":
+            return ("contains", operand.strip('"').lower())
+        raise UnsupportedRuleException(
+            "The %s: operator isn't supported locally" % name)
+    if text[0] in "#@$" and len(text) > 1:
+        return ("feature", text.lower())
+    return _words_node(text)
+
+
+def _words_node(text):
+    """ A keyword, or a phrase if it's several words. """
+    words = _words(text)
+    if not words:
+        raise UnsupportedRuleException("No words in '%s'" % text)
+    if len(words) == 1:
+        return ("feature", words[0])
+    return ("phrase", " %s " % " ".join(words))
+
+
+def _anchors(node):
+    """
+        Features at least one of which an activity must have for `node`
+        to match, or None if there are no such features.
+    """
+    kind = node[0]
+    if kind == "feature":
+        return set([node[1]])
+    if kind == "phrase":
+        # The longest word is likely the rarest.
+        return set([max(node[1].split(), key=len)])
+    if kind == "and":
+        best = None
+        for child in node[1]:
+            anchors = _anchors(child)
+            if anchors is not None and (best is None or
+                                        len(anchors) < len(best)):
+                best = anchors
+        return best
+    if kind == "or":
+        union = set()
+        for child in node[1]:
+            anchors = _anchors(child)
+            if anchors is None:
+                return None
+            union |= anchors
+        return union
+    return None
+
+
+def _evaluate(node, activity):
+    kind = node[0]
+    if kind == "feature":
+        return node[1] in activity.features
+    if kind == "and":
+        for child in node[1]:
+            if not _evaluate(child, activity):
+                return False
+        return True
+    if kind == "or":
+        for child in node[1]:
+            if _evaluate(child, activity):
+                return True
+        return False
+    if kind == "not":
+        return not _evaluate(node[1], activity)
+    if kind == "phrase":
+        return node[1] in activity.joined
+    return node[1] in activity.text.lower()
+
+
+class RuleMatcher(object):
+    """
+        Matches activities against a set of built rules (see rules.build).
+        Rules using operators that can't be evaluated locally are left
+        out and listed, with the reason, in `unsupported`.
+    """
+
+    def __init__(self, rules_list, parser=None):
+        self.loads = get_parser(parser)
+        self.rules = []
+        self.unsupported = []
+        self._index = {}
+        self._unanchored = []
+        for rule in rules_list:
+            self.add(rule)
+
+    def add(self, rule):
+        try:
+            compiled = _compile(parse(rule['value']))
+        except (RuleSyntaxError, UnsupportedRuleException) as e:
+            self.unsupported.append((rule, str(e)))
+            return
+        i = len(self.rules)
+        self.rules.append((rule, compiled))
+        anchors = _anchors(compiled)
+        if anchors is None:
+            self._unanchored.append(i)
+        else:
+            for feature in anchors:
+                self._index.setdefault(feature, []).append(i)
+
+    def match(self, activity):
+        """
+            Returns the rules the activity matches, in the order they were
+            added. `activity` can be a dict, raw JSON or a LazyActivity.
+        """
+        if hasattr(activity, "json"):
+            activity = activity.json()
+        elif isinstance(activity, (string_types, bytes)):
+            activity = self.loads(activity)
+        activity = ActivityFeatures(activity)
+
+        index = self._index
+        candidates = set(self._unanchored)
+        for feature in activity.features:
+            if feature in index:
+                candidates.update(index[feature])
+        rules = self.rules
+        return [rules[i][0] for i in sorted(candidates)
+                if _evaluate(rules[i][1], activity)]
+
+    def matching_rules(self, activity):
+        """ Like match(), in the form of gnip.matching_rules. """
+        return [dict((k, rule[k]) for k in ("value", "tag") if k in rule)
+                for rule in self.match(activity)]
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+
+import json
+import threading
+import time
+import zlib
+
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from six.moves.socketserver import ThreadingMixIn
+from six.moves.urllib.parse import parse_qs, urlparse
+
+
+STREAM_PATH = "/stream"
+RULES_PATH = "/rules"
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        self.server.gnip.record("GET", self.path)
+        if path == STREAM_PATH:
+            self.server.gnip.stream(self)
+        elif path == RULES_PATH:
+            self.server.gnip.get_rules(self)
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        parsed = urlparse(self.path)
+        self.server.gnip.record("POST", self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        if parsed.path != RULES_PATH:
+            self.send_json(404, {"error": "not found"})
+        elif parse_qs(parsed.query).get("_method") == ["delete"]:
+            self.server.gnip.delete_rules(self, body)
+        else:
+            self.server.gnip.add_rules(self, body)
+
+    def send_json(self, status, obj, headers=None):
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MockGnipServer(object):
+    """
+        A local HTTP server that behaves enough like GNIP to test and
+        benchmark against: a PowerTrack stream at `url` and the Rules API
+        at `rules_url`.
+
+        The stream uses chunked transfer encoding and sends `activities`
+        activities (forever if None) of about `activity_size` bytes each,
+        at `rate` activities per second (as fast as possible if None),
+        with a keep-alive whenever nothing was sent for
+        `keepalive_interval` seconds. Each connection is dropped without
+        ending the response after `disconnect_after` activities, and the
+        stream is gzipped when `gzip` is True and the client accepts it.
+
+        Each activity carries its send time in a leading "sent" field, a
+        postedTime, and the tags of the current rules in
+        gnip.matching_rules.
+
+        Status codes queued in `stream_errors` or `rules_errors` are
+        returned, in order, instead of serving the next requests, with a
+        Retry-After header when `retry_after` is set.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, activities=None,
+                 activity_size=1000, rate=None, keepalive_interval=10,
+                 disconnect_after=None, gzip=False, rules=None,
+                 stream_errors=(), rules_errors=(), retry_after=None):
+        self.activities = activities
+        self.activity_size = activity_size
+        self.rate = rate
+        self.keepalive_interval = keepalive_interval
+        self.disconnect_after = disconnect_after
+        self.gzip = gzip
+        self.rules = list(rules or [])
+        self.stream_errors = list(stream_errors)
+        self.rules_errors = list(rules_errors)
+        self.retry_after = retry_after
+        self.requests = []
+        self.connections = 0
+        self.sent = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self.httpd = _ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.gnip = self
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return "http://%s:%d" % (host, port)
+
+    @property
+    def url(self):
+        return self.base_url + STREAM_PATH
+
+    @property
+    def rules_url(self):
+        return self.base_url + RULES_PATH
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever,
+                                        name="gnippy-mockserver")
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def record(self, method, path):
+        with self._lock:
+            self.requests.append((method, path))
+
+    def _error(self, handler, errors):
+        """ Send the next queued error status, if any. """
+        with self._lock:
+            if not errors:
+                return False
+            status = errors.pop(0)
+        headers = {}
+        if self.retry_after is not None:
+            headers["Retry-After"] = str(self.retry_after)
+        handler.send_json(status, {"error": {"message": "mock error"}},
+                          headers)
+        return True
+
+    # Streaming
+
+    def activity(self, n):
+        """ A raw activity, padded to roughly activity_size bytes. """
+        tags = [r.get("tag") for r in self.rules] or ["mock"]
+        matching = ",".join('{"tag":%s,"value":"mock"}' % json.dumps(tag)
+                            for tag in tags)
+        now = time.time()
+        posted = time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(now))
+        head = '{"sent":%.6f,"id":"tag:search.twitter.com,2005:%d",' \
+               '"objectType":"activity","postedTime":"%s","body":"' % (
+                   now, n, posted)
+        tail = '","gnip":{"matching_rules":[%s]}}' % matching
+        padding = max(0, self.activity_size - len(head) - len(tail))
+        return (head + "x" * padding + tail).encode("utf-8")
+
+    def stream(self, handler):
+        if self._error(handler, self.stream_errors):
+            return
+        with self._lock:
+            self.connections += 1
+        accepts_gzip = "gzip" in (handler.headers.get("Accept-Encoding") or "")
+        compressor = None
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Transfer-Encoding", "chunked")
+        if self.gzip and accepts_gzip:
+            compressor = zlib.compressobj(6, zlib.DEFLATED,
+                                          16 + zlib.MAX_WBITS)
+            handler.send_header("Content-Encoding", "gzip")
+        handler.end_headers()
+
+        def write(data, flush=False):
+            if compressor is not None:
+                data = compressor.compress(data)
+                if flush:
+                    data += compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                handler.wfile.write(("%x\r\n" % len(data)).encode("ascii") +
+                                    data + b"\r\n")
+            if flush:
+                handler.wfile.flush()
+
+        try:
+            if not self._send_activities(write):
+                # Forced disconnect: close without ending the response.
+                handler.close_connection = True
+                return
+            if compressor is not None:
+                data = compressor.flush()
+                handler.wfile.write(("%x\r\n" % len(data)).encode("ascii") +
+                                    data + b"\r\n")
+            handler.wfile.write(b"0\r\n\r\n")
+        except (IOError, OSError):
+            # The client went away.
+            pass
+        handler.close_connection = True
+
+    def _send_activities(self, write, batch=100):
+        """ Write activities; returns False to force a disconnect. """
+        sent = 0
+        started = last_write = time.time()
+        while not self._stopped.is_set():
+            if self.activities is not None:
+                with self._lock:
+                    remaining = self.activities - self.sent
+                if remaining <= 0:
+                    return True
+            else:
+                remaining = batch
+            if self.disconnect_after is not None and \
+                    sent >= self.disconnect_after:
+                return False
+            due = batch
+            if self.rate:
+                due = int((time.time() - started) * self.rate) - sent
+            if self.disconnect_after is not None:
+                due = min(due, self.disconnect_after - sent)
+            due = min(due, remaining, batch)
+            if due > 0:
+                with self._lock:
+                    first = self.sent
+                    self.sent += due
+                write(b"".join(self.activity(first + i) + b"\r\n"
+                               for i in range(due)), flush=True)
+                sent += due
+                last_write = time.time()
+                continue
+            if time.time() - last_write >= self.keepalive_interval:
+                write(b"\r\n", flush=True)
+                last_write = time.time()
+            time.sleep(0.005)
+        return True
+
+    # Rules API
+
+    def get_rules(self, handler):
+        if self._error(handler, self.rules_errors):
+            return
+        with self._lock:
+            rules = list(self.rules)
+        handler.send_json(200, {"rules": rules})
+
+    def add_rules(self, handler, body):
+        if self._error(handler, self.rules_errors):
+            return
+        try:
+            new_rules = json.loads(body.decode("utf-8"))["rules"]
+        except (ValueError, KeyError):
+            handler.send_json(400, {"error": {"message": "bad request"}})
+            return
+        with self._lock:
+            values = set(r["value"] for r in self.rules)
+            for rule in new_rules:
+                if rule["value"] not in values:
+                    self.rules.append(rule)
+                    values.add(rule["value"])
+        handler.send_json(201, {"summary": {"created": len(new_rules)}})
+
+    def delete_rules(self, handler, body):
+        if self._error(handler, self.rules_errors):
+            return
+        try:
+            values = set(r["value"] for r in
+                         json.loads(body.decode("utf-8"))["rules"])
+        except (ValueError, KeyError):
+            handler.send_json(400, {"error": {"message": "bad request"}})
+            return
+        with self._lock:
+            before = len(self.rules)
+            self.rules = [r for r in self.rules if r["value"] not in values]
+            deleted = before - len(self.rules)
+        handler.send_json(200, {"summary": {"deleted": deleted}})
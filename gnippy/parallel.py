@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+    Fan-out of activity processing to a pool of worker processes, so that
+    parsing and filtering can use every core instead of one GIL.
+    Requires Python 3.
+"""
+
+import multiprocessing
+import struct
+import sys
+import traceback
+import zlib
+
+from gnippy.decoding import Decoder, extract_matching_rule_tags
+from gnippy.dispatch import Batcher
+from gnippy.errors import BadArgumentException
+
+
+ORDERING_NONE = "none"
+ORDERING_TAG = "tag"
+ORDERINGS = (ORDERING_NONE, ORDERING_TAG)
+
+# Lines in a record are joined with the PowerTrack delimiter, which the
+# framer guarantees can't appear inside a line.
+RECORD_DELIMITER = b"\r\n"
+
+_length = struct.Struct("<I")
+
+
+class SharedRingBuffer(object):
+    """
+        A single-producer, single-consumer ring of length-prefixed byte
+        records in shared memory. Records are copied straight into and out
+        of the shared buffer, nothing is pickled. Semaphores signal new
+        records and freed space (and act as the memory barriers between
+        the two processes).
+    """
+
+    def __init__(self, size=4 * 1024 * 1024):
+        self.size = size
+        self._buffer = multiprocessing.RawArray("B", size)
+        # Total bytes ever written / read; the difference is what's queued.
+        self._written = multiprocessing.RawValue("Q", 0)
+        self._read = multiprocessing.RawValue("Q", 0)
+        self._records = multiprocessing.Semaphore(0)
+        self._freed = multiprocessing.Semaphore(0)
+        self._view = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_view"] = None
+        return state
+
+    def _buffer_view(self):
+        if self._view is None:
+            self._view = memoryview(self._buffer).cast("B")
+        return self._view
+
+    def _copy_in(self, position, data):
+        view = self._buffer_view()
+        start = position % self.size
+        first = min(len(data), self.size - start)
+        view[start:start + first] = data[:first]
+        if first < len(data):
+            view[:len(data) - first] = data[first:]
+
+    def _copy_out(self, position, n):
+        view = self._buffer_view()
+        start = position % self.size
+        first = min(n, self.size - start)
+        data = view[start:start + first].tobytes()
+        if first < n:
+            data += view[:n - first].tobytes()
+        return data
+
+    def put(self, data):
+        """ Append a record, waiting for the consumer to free up space. """
+        needed = _length.size + len(data)
+        if needed > self.size:
+            raise BadArgumentException(
+                "Record of %d bytes doesn't fit a %d byte ring" % (
+                    len(data), self.size))
+        written = self._written.value
+        while self.size - (written - self._read.value) < needed:
+            self._freed.acquire(timeout=0.01)
+        self._copy_in(written, _length.pack(len(data)))
+        self._copy_in(written + _length.size, data)
+        self._written.value = written + needed
+        self._records.release()
+
+    def get(self, timeout=None):
+        """ Remove and return the oldest record, or None on timeout. """
+        if not self._records.acquire(timeout=timeout):
+            return None
+        read = self._read.value
+        n = _length.unpack(self._copy_out(read, _length.size))[0]
+        data = self._copy_out(read + _length.size, n)
+        self._read.value = read + _length.size + n
+        self._freed.release()
+        return data
+
+
+def _consume(ring, callback, batch, decode, parser, exception_callback):
+    """ The worker process loop. An empty record means stop. """
+    if decode:
+        callback = Decoder(callback, parser, lazy=decode == "lazy",
+                           batch=batch)
+    while True:
+        record = ring.get()
+        if not record:
+            return
+        lines = record.split(RECORD_DELIMITER)
+        try:
+            if batch:
+                callback(lines)
+            else:
+                for line in lines:
+                    callback(line)
+        except Exception:
+            if exception_callback:
+                exception_callback(sys.exc_info())
+            else:
+                traceback.print_exc()
+
+
+class ProcessPool(object):
+    """
+        A callback that fans activities out to `processes` worker
+        processes, each of which runs `callback`. Pass it to
+        PowerTrackClient in place of the callback:
+
+            pool = ProcessPool(handle_activity, processes=8, decode=True)
+            pool.start()
+            client = PowerTrackClient(pool)
+            client.connect()
+            ...
+            client.disconnect()
+            pool.stop()
+
+        Lines are grouped into batches of up to `batch_size` lines (or
+        whatever arrived within `batch_latency` seconds) and each batch is
+        copied into a worker's SharedRingBuffer, in as few records as fit
+        the ring.
+
+        ordering:
+            "none": batches go to the workers round-robin.
+            "tag": activities are routed by their first matching rule tag,
+                so all activities for a tag are handled by one worker, in
+                order.
+
+        callback (and exception_callback) run in the worker processes, so
+        they must be picklable (e.g. module-level functions) when the
+        "spawn" start method is used. With batch=True the callback gets
+        lists of lines (a batch too big for the ring arrives in parts).
+        decode and parser work like PowerTrackClient's, except the decoding
+        happens in the workers. Errors handing lines to the workers, such
+        as a single line too big for the ring, are reported in this
+        process through exception_callback.
+    """
+
+    def __init__(self, callback, processes=None, ordering=ORDERING_NONE,
+                 batch_size=500, batch_latency=0.05, batch=False,
+                 decode=False, parser=None, exception_callback=None,
+                 ring_size=4 * 1024 * 1024):
+        if ordering not in ORDERINGS:
+            raise BadArgumentException(
+                "ordering must be one of: %s" % ", ".join(ORDERINGS))
+        self.processes = processes or multiprocessing.cpu_count()
+        self.ordering = ordering
+        self.rings = [SharedRingBuffer(ring_size)
+                      for i in range(self.processes)]
+        self.workers = [
+            multiprocessing.Process(
+                target=_consume, name="gnippy-process-%d" % i,
+                args=(ring, callback, batch, decode, parser,
+                      exception_callback))
+            for i, ring in enumerate(self.rings)]
+        self.batcher = Batcher(self._dispatch, max_size=batch_size,
+                               max_latency=batch_latency,
+                               exception_callback=exception_callback)
+        self._next = 0
+
+    def __call__(self, line):
+        self.batcher(line)
+
+    def start(self):
+        for worker in self.workers:
+            worker.daemon = True
+            worker.start()
+        self.batcher.start()
+
+    def stop(self):
+        """ Deliver what's pending and wait for the workers to finish. """
+        self.batcher.stop()
+        for ring in self.rings:
+            ring.put(b"")
+        for worker in self.workers:
+            worker.join()
+
+    def _dispatch(self, lines):
+        if self.ordering == ORDERING_NONE:
+            ring = self.rings[self._next]
+            self._next = (self._next + 1) % self.processes
+            self._put(ring, lines)
+            return
+
+        partitions = {}
+        for line in lines:
+            tags = extract_matching_rule_tags(line)
+            tag = tags[0] if tags else None
+            key = zlib.crc32((tag or "").encode("utf-8")) % self.processes
+            partitions.setdefault(key, []).append(line)
+        for key, partition in partitions.items():
+            self._put(self.rings[key], partition)
+
+    def _put(self, ring, lines):
+        """ Copy lines into ring, split into records that fit it. """
+        limit = ring.size - _length.size
+        record = []
+        size = 0
+        for line in lines:
+            extra = len(line) + (len(RECORD_DELIMITER) if record else 0)
+            if record and size + extra > limit:
+                ring.put(RECORD_DELIMITER.join(record))
+                record = []
+                extra = len(line)
+                size = 0
+            record.append(line)
+            size += extra
+        if record:
+            ring.put(RECORD_DELIMITER.join(record))
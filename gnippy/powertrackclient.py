@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 
 from contextlib import closing
+import math
 import sys
 import threading
+import time
+import traceback
 
 try:
     import urlparse
@@ -12,8 +15,26 @@ except: # For Python 3
     from urllib.parse import urlencode
 
 import requests
+from requests.packages.urllib3.exceptions import ProtocolError, \
+    ReadTimeoutError
+from six import string_types
 
 from gnippy import config
+from gnippy.backoff import Backoff
+from gnippy.decoding import Decoder
+from gnippy.dispatch import ActivityQueue, Batcher, ConsumerPool, \
+    OVERFLOW_BLOCK, QueuedCallback
+from gnippy.errors import BadArgumentException, PowerTrackHTTPException, \
+    StreamStalledException
+from gnippy.framing import DEFAULT_CHUNK_SIZE, GzipDecoder, LineFramer
+from gnippy.routing import Router, ROUTE_BY_TAG
+from gnippy.shedding import LagMonitor, LoadShedder
+from gnippy.spool import Spool, SpooledCallback
+from gnippy.stats import StatsReporter, StreamStats, TimedCallback
+
+
+# GNIP only honours backfillMinutes between 1 and 5.
+MAX_BACKFILL_MINUTES = 5
 
 
 def append_backfill_to_url(url, backfill_minutes):
@@ -30,6 +51,102 @@ def append_backfill_to_url(url, backfill_minutes):
     return urlparse.urlunparse(parsed)
 
 
+class ReconnectPolicy(object):
+    """
+        Decides how long the Worker waits between reconnect attempts.
+        The defaults follow GNIP's reconnect guidance:
+            - network errors and dropped streams back off from 250ms up to 16s
+            - HTTP errors back off from 5s up to 320s
+            - HTTP 429 (rate limited) backs off from 1 minute
+        When backfill is True the reconnect URL asks GNIP to replay the
+        minutes we were disconnected for (capped at MAX_BACKFILL_MINUTES).
+    """
+
+    def __init__(self, network_backoff=None, http_backoff=None,
+                 rate_limit_backoff=None, max_attempts=None, backfill=True):
+        self.network_backoff = network_backoff or Backoff(0.25, 16)
+        self.http_backoff = http_backoff or Backoff(5, 320)
+        self.rate_limit_backoff = rate_limit_backoff or Backoff(60, 960)
+        self.max_attempts = max_attempts
+        self.backfill = backfill
+
+    def delay(self, attempt, status_code=None):
+        if status_code == 429:
+            backoff = self.rate_limit_backoff
+        elif status_code is not None:
+            backoff = self.http_backoff
+        else:
+            backoff = self.network_backoff
+        return backoff.delay(attempt)
+
+    def backfill_minutes(self, disconnected_seconds):
+        minutes = int(math.ceil(disconnected_seconds / 60.0))
+        return max(1, min(MAX_BACKFILL_MINUTES, minutes))
+
+
+class ReconnectSchedule(object):
+    """
+        Tracks the reconnect attempts of a single stream against a
+        ReconnectPolicy: which URL to connect to next and how long to
+        wait after each failure. Shared by the threaded and asyncio
+        clients so both reconnect the same way.
+    """
+
+    def __init__(self, policy, url):
+        self.policy = policy
+        self.url = url
+        self.attempt = 0
+        self.reconnect_count = 0
+        self.disconnected_at = None
+
+    def next_url(self):
+        """ The stream URL, with backfill for the time spent disconnected. """
+        if self.disconnected_at is None or not self.policy.backfill:
+            return self.url
+        return append_backfill_to_url(
+            self.url,
+            self.policy.backfill_minutes(time.time() - self.disconnected_at))
+
+    def exhausted(self, established):
+        """ True if a failed connection shouldn't be retried. """
+        attempt = 0 if established else self.attempt
+        max_attempts = self.policy.max_attempts
+        return max_attempts is not None and attempt >= max_attempts
+
+    def disconnected(self, established, status_code=None):
+        """
+            Record the end of a connection attempt and return how many
+            seconds to wait before the next one.
+        """
+        if established:
+            # We had a live stream, so the backoff schedule restarts.
+            self.attempt = 0
+            self.disconnected_at = time.time()
+        delay = self.policy.delay(self.attempt, status_code)
+        self.attempt += 1
+        self.reconnect_count += 1
+        return delay
+
+
+def get_connection_url(url, backfill_minutes=None):
+    """ Validate backfill_minutes and append it to the stream URL. """
+    connection_url = url
+
+    if backfill_minutes:
+        assert type(backfill_minutes) is int, \
+            "backfill_minutes is not an integer: {0}".format(
+                backfill_minutes)
+
+        assert backfill_minutes <= MAX_BACKFILL_MINUTES, \
+            "backfill_minutes should be 5 or less: {0}".format(
+                backfill_minutes)
+
+        connection_url = append_backfill_to_url(
+            connection_url, backfill_minutes)
+
+    return connection_url
+
+
 class PowerTrackClient:
     """
         PowerTrackClient allows you to connect to the GNIP
@@ -39,9 +156,108 @@ class PowerTrackClient:
     url = None
     auth = None
 
-    def __init__(self, callback, exception_callback=None, **kwargs):
+    def __init__(self, callback, exception_callback=None, reconnect=False,
+                 queue_size=None, consumers=1, overflow=OVERFLOW_BLOCK,
+                 spill_path=None, batch_callback=None, batch_size=500,
+                 batch_latency=0.5, chunk_size=DEFAULT_CHUNK_SIZE,
+                 decode=False, parser=None, stall_timeout=None,
+                 stats_hook=None, stats_interval=10, gzip=False,
+                 shared_queue=None, spool=None, shedding=None, routes=None,
+                 route_by=ROUTE_BY_TAG, **kwargs):
+        """
+            Optional Args:
+                exception_callback: Called with sys.exc_info() whenever the
+                    worker or a consumer hits an error.
+                reconnect: True to reconnect automatically using the default
+                    ReconnectPolicy, or a ReconnectPolicy instance.
+                queue_size: When set, the reader thread only pushes lines
+                    onto a bounded ActivityQueue of this size and `consumers`
+                    threads call the callback.
+                overflow: What to do when the queue is full, one of
+                    "block", "drop_oldest" or "spill" (see ActivityQueue).
+                spill_path: File used by the "spill" overflow policy.
+                batch_callback: Called with lists of lines instead of
+                    calling `callback` once per line. A batch is delivered
+                    once it holds `batch_size` lines or its oldest line is
+                    `batch_latency` seconds old. `callback` may be None.
+                chunk_size: Maximum number of bytes read from the socket
+                    at a time.
+                decode: True to deliver decoded activities (dicts) instead
+                    of raw lines, or "lazy" to deliver LazyActivity objects
+                    that only decode the fields that are accessed.
+                    Decoding happens on the consumer threads when
+                    queue_size is set.
+                parser: The JSON parser used by decode: "json", "ujson",
+                    "orjson" or a loads() callable. Defaults to the fastest
+                    one installed.
+                stall_timeout: Seconds without receiving anything, not
+                    even a keep-alive, after which the connection is
+                    considered dead and a StreamStalledException is
+                    reported (and, with reconnect, a new connection made).
+                    GNIP sends keep-alives every 10 seconds, so 30 is a
+                    sensible value.
+                stats_hook: Called with the stats() dict every
+                    `stats_interval` seconds while connected.
+                gzip: Ask GNIP for a gzip compressed stream, which is
+                    decompressed incrementally as it arrives.
+                shared_queue: An ActivityQueue shared with other clients
+                    and drained by a ConsumerPool using call_pair (this is
+                    how StreamManager shares its consumers). Takes the
+                    place of queue_size. disconnect() waits for this
+                    stream's queued lines to be delivered, so the
+                    consumers must still be running.
+                spool: A Spool (or a directory to create one in) that every
+                    raw line is durably appended to on the reader thread
+                    before delivery. `callback` may be None to only spool,
+                    leaving processing to a SpoolReader.
+                shedding: A SheddingPolicy that starts sampling, dropping
+                    low priority tags or spooling activities once the
+                    consumer lag or the queue depth crosses its thresholds.
+                routes: A dict mapping rule tags (or rule values, with
+                    route_by="value") to callbacks or queues. Each activity
+                    goes only to the routes of the rules it matched, found
+                    with a partial scan; `callback` gets the rest and may
+                    be None to drop them. Callbacks are decoded and timed
+                    as usual, queues get raw lines.
+        """
         self.callback = callback
         self.exception_callback = exception_callback
+        if reconnect is True:
+            reconnect = ReconnectPolicy()
+        self.reconnect = reconnect or None
+        self.queue_size = queue_size
+        self.consumers = consumers
+        self.overflow = overflow
+        self.spill_path = spill_path
+        self.batch_callback = batch_callback
+        self.batch_size = batch_size
+        self.batch_latency = batch_latency
+        self.chunk_size = chunk_size
+        self.decode = decode
+        self.parser = parser
+        self.stall_timeout = stall_timeout
+        self.stats_hook = stats_hook
+        self.stats_interval = stats_interval
+        self.gzip = gzip
+        self.shared_queue = shared_queue
+        if isinstance(spool, string_types):
+            spool = Spool(spool)
+        self.spool = spool
+        self.shedding = shedding
+        if routes and batch_callback:
+            raise BadArgumentException(
+                "routes can't be combined with batch_callback")
+        self.routes = routes
+        self.route_by = route_by
+        self.router = None
+        self.lag_monitor = None
+        self.shedder = None
+        self.stream_stats = StreamStats()
+        self.stats_reporter = None
+        self.queue = None
+        self.consumer_pool = None
+        self.queued_callback = None
+        self.batcher = None
         c = config.resolve(kwargs)
         self.url = c['url']
         self.auth = c['auth']
@@ -50,32 +266,125 @@ class PowerTrackClient:
 
         connection_url = self.get_connection_url(backfill_minutes)
 
-        self.worker = Worker(
-            url=connection_url,
-            auth=self.auth,
-            callback=self.callback,
-            exception_callback=self.exception_callback)
+        on_data = self._start_delivery()
 
-        self.worker.setDaemon(True)
+        self.worker = self._start_worker(connection_url, on_data)
 
-        self.worker.start()
-
-    def get_connection_url(self, backfill_minutes=None):
-        connection_url = self.url
+        self._start_stats_reporter()
 
-        if backfill_minutes:
-            assert type(backfill_minutes) is int, \
-                "backfill_minutes is not an integer: {0}".format(
-                    backfill_minutes)
-
-            assert backfill_minutes <= 5, \
-                "backfill_minutes should be 5 or less: {0}".format(
-                    backfill_minutes)
-
-            connection_url = append_backfill_to_url(
-                connection_url, backfill_minutes)
+    def _start_worker(self, connection_url, on_data):
+        worker = Worker(
+            url=connection_url,
+            auth=self.auth,
+            callback=on_data,
+            exception_callback=self.exception_callback,
+            reconnect=self.reconnect,
+            chunk_size=self.chunk_size,
+            stall_timeout=self.stall_timeout,
+            stats=self.stream_stats,
+            gzip=self.gzip)
+
+        worker.setDaemon(True)
+
+        worker.start()
+
+        return worker
+
+    def _start_stats_reporter(self):
+        if self.stats_hook:
+            self.stats_reporter = StatsReporter(
+                self.stats, self.stats_hook, self.stats_interval)
+            self.stats_reporter.start()
+
+    def _start_delivery(self):
+        """
+            Set up whatever sits between the reader thread and the user's
+            callback and return the callable the Worker should feed.
+        """
+        latency = self.stream_stats.callback_latency
+        lazy = self.decode == "lazy"
+        batch_callback = self.batch_callback
+        if batch_callback:
+            batch_callback = TimedCallback(batch_callback, latency)
+            if self.decode:
+                batch_callback = Decoder(batch_callback, self.parser, lazy,
+                                         batch=True)
+
+        def wrap(callback):
+            if callback is None or hasattr(callback, "put"):
+                return callback
+            callback = TimedCallback(callback, latency)
+            if self.decode:
+                callback = Decoder(callback, self.parser, lazy)
+            return callback
+
+        on_data = wrap(self.callback)
+        if self.routes:
+            routes = dict((key, wrap(route))
+                          for key, route in self.routes.items())
+            self.router = Router(routes, default=on_data, by=self.route_by)
+            on_data = self.router
+
+        if batch_callback:
+            self.batcher = Batcher(
+                batch_callback, max_size=self.batch_size,
+                max_latency=self.batch_latency,
+                exception_callback=self.exception_callback)
+            self.batcher.start()
+            on_data = self.batcher
+
+        if on_data is not None:
+            self.lag_monitor = LagMonitor(on_data)
+            on_data = self.lag_monitor
+
+        if on_data is None:
+            # Spool only; the lines are processed later with a SpoolReader.
+            pass
+        elif self.shared_queue is not None:
+            self.queued_callback = QueuedCallback(self.shared_queue, on_data)
+            on_data = self.queued_callback
+        elif self.queue_size:
+            self.queue = ActivityQueue(self.queue_size, self.overflow,
+                                       self.spill_path)
+            self.consumer_pool = ConsumerPool(
+                self.queue, on_data, consumers=self.consumers,
+                exception_callback=self.exception_callback)
+            self.consumer_pool.start()
+            on_data = self.queue.put
+
+        if self.shedding is not None and on_data is not None:
+            self.shedder = LoadShedder(
+                on_data, self.shedding, self.lag_monitor,
+                activity_queue=self.queue or self.shared_queue)
+            on_data = self.shedder
+
+        if self.spool is not None:
+            # Spool on the reader thread, before anything can be dropped.
+            if on_data is None:
+                on_data = self.spool
+            else:
+                on_data = SpooledCallback(self.spool, on_data)
+
+        return on_data
+
+    def _stop_delivery(self):
+        """ Drain and tear down what _start_delivery set up. """
+        if self.queued_callback:
+            # The shared consumers must deliver this stream's queued lines
+            # before the Batcher behind them is stopped.
+            self.queued_callback.drain()
+        if self.consumer_pool:
+            # Let the consumers drain whatever the reader already queued.
+            self.consumer_pool.stop()
+            self.consumer_pool.join()
+            self.queue.close()
+        if self.batcher:
+            self.batcher.stop()
+        if self.spool is not None:
+            self.spool.sync()
 
-        return connection_url
+    def get_connection_url(self, backfill_minutes=None):
+        return get_connection_url(self.url, backfill_minutes)
 
     def connected(self):
 
@@ -84,6 +393,36 @@ class PowerTrackClient:
     def disconnect(self):
         self.worker.stop()
         self.worker.join()
+        self._stop_delivery()
+        self._stop_stats_reporter()
+
+    def _stop_stats_reporter(self):
+        if self.stats_reporter:
+            self.stats_reporter.stop()
+
+    def stats(self):
+        """
+            Returns a dict of counters and gauges for the stream: bytes and
+            activities (totals and per second over the last 10 seconds),
+            compressed bytes read when gzip is on, heartbeats, reconnects,
+            stalls, time connected, callback latency, consumer lag (how far
+            behind postedTime delivery is running), activities shed and,
+            when queue_size is set, queue depth.
+        """
+        snapshot = self.stream_stats.snapshot()
+        if self.lag_monitor is not None:
+            snapshot['lag_seconds'] = self.lag_monitor.lag
+        if self.router is not None:
+            snapshot['routed'] = dict(self.router.routed)
+            snapshot['unrouted'] = self.router.unrouted
+        if self.shedder is not None:
+            snapshot['shedding'] = self.shedder.overloaded
+            snapshot['shed'] = self.shedder.shed
+        if self.queue is not None:
+            snapshot['queue_depth'] = self.queue.qsize()
+            snapshot['queue_dropped'] = self.queue.dropped
+            snapshot['queue_spilled'] = self.queue.spilled
+        return snapshot
 
     def load_config_from_file(self, url, auth, config_file_path):
         """ Attempt to load the config from a file. """
@@ -104,15 +443,39 @@ class PowerTrackClient:
             self.auth = auth
 
 
+def _raw_chunks(raw, chunk_size):
+    """
+        Read chunks from a urllib3 response without decoding them, raising
+        the same requests exceptions for read errors as iter_content does.
+    """
+    try:
+        for chunk in raw.stream(chunk_size, decode_content=False):
+            yield chunk
+    except ReadTimeoutError as e:
+        raise requests.exceptions.ConnectionError(e)
+    except ProtocolError as e:
+        raise requests.exceptions.ChunkedEncodingError(e)
+
+
 class Worker(threading.Thread):
     """ Background worker to fetch data without blocking """
 
-    def __init__(self, url, auth, callback, exception_callback=None):
+    def __init__(self, url, auth, callback, exception_callback=None,
+                 reconnect=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                 stall_timeout=None, stats=None, gzip=False):
         super(Worker, self).__init__()
         self.url = url
         self.auth = auth
         self.on_data = callback
         self.on_error = exception_callback
+        self.reconnect = reconnect
+        self.chunk_size = chunk_size
+        self.stall_timeout = stall_timeout
+        self.stats = stats or StreamStats()
+        self.gzip = gzip
+        self.schedule = None
+        self.connected_at = None
+        self.last_data_at = None
         self._stop_event = threading.Event()
 
     def stop(self):
@@ -123,19 +486,10 @@ class Worker(threading.Thread):
 
     def run(self):
         try:
-            with closing(
-                    requests.get(self.url, auth=self.auth, stream=True)) as r:
-                if r.status_code != 200:
-                    self.stop()
-                    raise Exception(
-                        "GNIP returned HTTP {}".format(r.status_code))
-
-                for line in r.iter_lines():
-                    if line:
-                        self.on_data(line)
-
-                    if self.stopped():
-                        break
+            if self.reconnect:
+                self._run_with_reconnect()
+            else:
+                self._consume(self.url)
         except Exception:
             if self.on_error:
                 exinfo = sys.exc_info()
@@ -147,3 +501,116 @@ class Worker(threading.Thread):
             if not self.stopped():
                 # clean up and set the stop event
                 self.stop()
+
+    def _consume(self, url):
+        """
+            Open one streaming connection and feed lines to the callback
+            until the stream ends or the worker is stopped.
+        """
+        self.connected_at = None
+        self.last_data_at = time.time()
+        try:
+            self._stream(url)
+        except requests.exceptions.RequestException:
+            idle = time.time() - self.last_data_at
+            if self.stall_timeout and idle >= self.stall_timeout:
+                self.stats.increment("stalls")
+                raise StreamStalledException(idle)
+            raise
+        finally:
+            # Other connections may share the stats, so only close what
+            # this one opened.
+            if self.connected_at is not None:
+                self.stats.disconnected()
+
+    def _stream(self, url):
+        kwargs = {}
+        if self.stall_timeout:
+            # A socket read timeout measures exactly the time since the
+            # last byte, keep-alives included.
+            kwargs['timeout'] = self.stall_timeout
+        if self.gzip:
+            kwargs['headers'] = {'Accept-Encoding': 'gzip'}
+
+        with closing(requests.get(url, auth=self.auth, stream=True,
+                                  **kwargs)) as r:
+            if r.status_code != 200:
+                raise PowerTrackHTTPException(r.status_code)
+
+            self.connected_at = time.time()
+            self.stats.connected()
+
+            stats = self.stats
+            framer = LineFramer()
+            decoder = None
+            chunks = r.iter_content(chunk_size=self.chunk_size)
+            if self.gzip and r.headers.get('Content-Encoding') == 'gzip':
+                # Read the raw compressed chunks and decompress them here,
+                # so every bit of decompressor output reaches the framer
+                # right away.
+                decoder = GzipDecoder()
+                chunks = _raw_chunks(r.raw, self.chunk_size)
+
+            for chunk in chunks:
+                self.last_data_at = now = time.time()
+                compressed = 0
+                if decoder:
+                    compressed = len(chunk)
+                    chunk = decoder.decompress(chunk)
+                keepalives = framer.keepalives
+                lines = framer.feed(chunk)
+                stats.record_chunk(len(chunk), len(lines),
+                                   framer.keepalives - keepalives, now,
+                                   compressed)
+                for line in lines:
+                    self._deliver(line)
+
+                if self.stopped():
+                    break
+
+    def _deliver(self, line):
+        """
+            Hand a line to the callback. Its errors are reported and the
+            stream carries on: only stream and HTTP errors end a connection.
+        """
+        try:
+            self.on_data(line)
+        except Exception:
+            if self.on_error:
+                self.on_error(sys.exc_info())
+            else:
+                traceback.print_exc()
+
+    def _run_with_reconnect(self):
+        """
+            Keep calling _consume until the worker is stopped, waiting
+            between attempts as dictated by the ReconnectPolicy and asking
+            GNIP to backfill whatever we missed while disconnected.
+        """
+        self.schedule = ReconnectSchedule(self.reconnect, self.url)
+
+        while not self.stopped():
+            self.connected_at = None
+            status_code = None
+            try:
+                self._consume(self.schedule.next_url())
+            except Exception as e:
+                if self.stopped():
+                    break
+                if isinstance(e, PowerTrackHTTPException):
+                    status_code = e.status_code
+                if self.schedule.exhausted(self.connected_at is not None):
+                    raise
+                if self.on_error:
+                    self.on_error(sys.exc_info())
+
+            if self.stopped():
+                break
+
+            self._stop_event.wait(self.schedule.disconnected(
+                self.connected_at is not None, status_code))
+            self.stats.increment("reconnects")
+
+    @property
+    def reconnect_count(self):
+        return self.schedule.reconnect_count if self.schedule else 0
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+
+from gnippy.errors import BadArgumentException
+
+
+class TokenBucket(object):
+    """
+        A token bucket rate limiter: `rate` tokens are added per second, up
+        to `capacity` (which defaults to rate, allowing a second's burst,
+        but is never less than one token).
+        acquire() blocks until enough tokens are available. One instance
+        can be shared by any number of threads.
+
+        With `lock_path` the bucket's state lives in that file, guarded by
+        an exclusive lock, so every process using the same path shares one
+        bucket (POSIX only).
+    """
+
+    def __init__(self, rate, capacity=None, lock_path=None):
+        if rate <= 0:
+            raise BadArgumentException("rate must be positive")
+        if capacity is not None and capacity < 1:
+            raise BadArgumentException("capacity must be at least 1")
+        if lock_path and fcntl is None:
+            raise BadArgumentException(
+                "lock_path needs fcntl, which this platform doesn't have")
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(capacity or rate))
+        self.lock_path = lock_path
+        self._tokens = self.capacity
+        self._updated = time.time()
+        self._lock = threading.Lock()
+
+    def _take(self, tokens, state, now):
+        """
+            Refill `state` (tokens, updated) up to now and take `tokens`
+            if there are enough. Returns the new state and how long to wait
+            before trying again (0 if the tokens were taken).
+        """
+        available, updated = state
+        available = min(self.capacity,
+                        available + (now - updated) * self.rate)
+        if available >= tokens:
+            return (available - tokens, now), 0
+        return (available, now), (tokens - available) / self.rate
+
+    def try_acquire(self, tokens=1, now=None):
+        """
+            Take `tokens` if they're available. Returns 0 on success or the
+            number of seconds to wait before they will be.
+        """
+        now = now or time.time()
+        with self._lock:
+            if self.lock_path:
+                return self._try_acquire_shared(tokens, now)
+            state, wait = self._take(tokens, (self._tokens, self._updated),
+                                     now)
+            self._tokens, self._updated = state
+            return wait
+
+    def _try_acquire_shared(self, tokens, now):
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            saved = os.read(fd, 64).split()
+            state = (float(saved[0]), float(saved[1])) if len(saved) == 2 \
+                else (self.capacity, now)
+            state, wait = self._take(tokens, state, now)
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.ftruncate(fd, 0)
+            os.write(fd, ("%r %r" % state).encode("ascii"))
+            return wait
+        finally:
+            # Closing the file releases the lock.
+            os.close(fd)
+
+    def acquire(self, tokens=1):
+        """ Block until `tokens` tokens have been taken. """
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return
+            time.sleep(wait)
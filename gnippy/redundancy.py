@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+from gnippy.decoding import extract_id
+from gnippy.errors import BadArgumentException
+from gnippy.powertrackclient import PowerTrackClient, get_connection_url
+
+
+class RotatingIdSet(object):
+    """
+        Remembers recently seen activity ids in two generations of sets.
+        The current generation is retired once it is `window` seconds old
+        or holds max_ids / 2 ids, so an id is remembered for at least
+        `window` seconds (unless more than max_ids / 2 arrive in that
+        time) and memory is bounded by max_ids ids. Lookups and inserts
+        are plain set operations, so this keeps up with firehose rates.
+    """
+
+    def __init__(self, window=60, max_ids=2000000):
+        self.window = window
+        self.max_ids = max_ids
+        self._current = set()
+        self._previous = set()
+        self._rotated_at = None
+
+    def __len__(self):
+        return len(self._current) + len(self._previous)
+
+    def add(self, key, now=None):
+        """ Remember `key`; returns False if it was already seen. """
+        now = now or time.time()
+        if self._rotated_at is None:
+            self._rotated_at = now
+        if (now - self._rotated_at >= self.window or
+                len(self._current) >= self.max_ids // 2):
+            self._previous = self._current
+            self._current = set()
+            self._rotated_at = now
+        if key in self._current or key in self._previous:
+            return False
+        self._current.add(key)
+        return True
+
+
+class Deduplicator(object):
+    """
+        Callback wrapper that passes on each activity only the first time
+        its id is seen, no matter which connection delivered it.
+        Activities without an id (e.g. system messages) always pass.
+    """
+
+    def __init__(self, callback, seen):
+        self.callback = callback
+        self.seen = seen
+        self.duplicates = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, line):
+        activity_id = extract_id(line)
+        if activity_id is not None:
+            with self._lock:
+                if not self.seen.add(activity_id):
+                    self.duplicates += 1
+                    return
+        self.callback(line)
+
+
+class RedundantPowerTrackClient(PowerTrackClient):
+    """
+        Reads the same stream over several connections at once (GNIP's
+        redundant connections) and delivers each activity only once.
+
+        Every connection is a Worker of its own, reconnecting on its own,
+        and all of them feed one Deduplicator in front of the usual
+        delivery pipeline (queue, batching, decoding...), so losing one
+        connection doesn't interrupt the callback. Takes the same
+        arguments as PowerTrackClient, plus:
+            connections: How many connections to open to the stream URL.
+            urls: Alternatively, the URLs to connect to, one connection
+                each, e.g. to go through different endpoints or proxies.
+            dedupe_window: Seconds an activity id is remembered for.
+            max_ids: Upper bound on remembered ids.
+        Reconnecting is on by default.
+    """
+
+    def __init__(self, callback, exception_callback=None, connections=2,
+                 urls=None, dedupe_window=60, max_ids=2000000, **kwargs):
+        kwargs.setdefault("reconnect", True)
+        PowerTrackClient.__init__(self, callback, exception_callback,
+                                  **kwargs)
+        self.urls = list(urls) if urls else [self.url] * connections
+        if not self.urls:
+            raise BadArgumentException("At least one connection is required")
+        self.seen = RotatingIdSet(dedupe_window, max_ids)
+        self.deduplicator = None
+        self.workers = []
+
+    def connect(self, backfill_minutes=None):
+        self.deduplicator = Deduplicator(self._start_delivery(), self.seen)
+        self.workers = [
+            self._start_worker(get_connection_url(url, backfill_minutes),
+                               self.deduplicator)
+            for url in self.urls]
+        self.worker = self.workers[0]
+        self._start_stats_reporter()
+
+    def connected(self):
+        """ True while at least one connection is running. """
+        return any(not worker.stopped() for worker in self.workers)
+
+    def disconnect(self):
+        for worker in self.workers:
+            worker.stop()
+        for worker in self.workers:
+            worker.join()
+        self._stop_delivery()
+        self._stop_stats_reporter()
+
+    def stats(self):
+        """
+            PowerTrackClient.stats(), where bytes and activities count what
+            every connection received and connected is True while any
+            connection is, plus the number of duplicates dropped and ids
+            currently remembered.
+        """
+        snapshot = PowerTrackClient.stats(self)
+        snapshot['connections'] = len(self.workers)
+        snapshot['duplicates'] = \
+            self.deduplicator.duplicates if self.deduplicator else 0
+        snapshot['remembered_ids'] = len(self.seen)
+        return snapshot
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+from collections import defaultdict
+
+from gnippy.decoding import extract_matching_rules
+from gnippy.errors import BadArgumentException
+
+
+ROUTE_BY_TAG = "tag"
+ROUTE_BY_VALUE = "value"
+
+
+def _sink(route):
+    """ A queue is routed to through its put(), anything else is called. """
+    put = getattr(route, "put", None)
+    return put if put is not None else route
+
+
+class Router(object):
+    """
+        Callback that hands each raw activity to the sinks registered for
+        the rules it matched, keyed on the rule tag (or, with
+        by="value", the rule value). The matching rules are pulled out
+        with a partial scan, so routing never decodes the whole activity.
+
+        A sink is a callable or anything with a put() method, such as an
+        ActivityQueue. An activity that matched several rules is given to
+        each distinct sink once. Activities that matched no route go to
+        `default`, or are dropped if it's None.
+    """
+
+    def __init__(self, routes, default=None, by=ROUTE_BY_TAG):
+        if by not in (ROUTE_BY_TAG, ROUTE_BY_VALUE):
+            raise BadArgumentException("by must be 'tag' or 'value'")
+        self.by = by
+        self.routes = dict((key, _sink(route))
+                           for key, route in routes.items())
+        self.default = None if default is None else _sink(default)
+        self.routed = defaultdict(int)
+        self.unrouted = 0
+
+    def __call__(self, line):
+        sinks = []
+        routes = self.routes
+        for rule in extract_matching_rules(line):
+            key = rule.get(self.by)
+            sink = routes.get(key)
+            if sink is not None and sink not in sinks:
+                sinks.append(sink)
+                self.routed[key] += 1
+        if not sinks:
+            self.unrouted += 1
+            if self.default is not None:
+                self.default(line)
+            return
+        for sink in sinks:
+            sink(line)
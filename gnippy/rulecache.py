@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+import io
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from gnippy.errors import RuleAddFailedException, RuleDeleteFailedException
+from gnippy.rules import RulesClient
+
+
+class RuleCache(object):
+    """
+        A local copy of the stream's rule set.
+
+        The rules are fetched with get_rules() when first needed and again
+        once they are more than `ttl` seconds old. Changes made through
+        add_rules() and delete_rules() are written through to the cache
+        instead of triggering a refresh. With `path` the cache is saved
+        to that file after every change and loaded from it on start-up,
+        so a restarted process only downloads the rules once they expire.
+
+        Rules can be looked up by value, tag or id without scanning, and
+        written through in time proportional to the number changed.
+    """
+
+    def __init__(self, client=None, ttl=300, path=None, **kwargs):
+        """
+            Optional Args:
+                client: The RulesClient to use; otherwise one is created
+                    from kwargs (rules_url, auth, config_file_path).
+                ttl: Seconds before the cached rules are fetched again.
+                path: File to persist the cache to.
+        """
+        self.client = client or RulesClient(**kwargs)
+        self.ttl = ttl
+        self.path = path
+        self.fetched_at = None
+        self._lock = threading.RLock()
+        self._index([])
+        if path and os.path.isfile(path):
+            self._load()
+
+    def _index(self, rules):
+        # Rules are kept in dicts keyed by value, in the order they were
+        # added, so removing one is a dict operation. The list of them is
+        # only built when needed.
+        self._by_value = OrderedDict()
+        self._by_id = {}
+        self._by_tag = {}
+        self._rules = None
+        for rule in rules:
+            self._index_rule(rule)
+
+    def _index_rule(self, rule):
+        if rule['value'] in self._by_value:
+            self._unindex_rule(self._by_value[rule['value']])
+        self._by_value[rule['value']] = rule
+        for key in ('id', 'id_str'):
+            if rule.get(key) is not None:
+                self._by_id[rule[key]] = rule
+        self._by_tag.setdefault(rule.get('tag'), OrderedDict())[
+            rule['value']] = rule
+        self._rules = None
+
+    def _unindex_rule(self, rule):
+        self._by_value.pop(rule['value'], None)
+        for key in ('id', 'id_str'):
+            if rule.get(key) is not None:
+                self._by_id.pop(rule[key], None)
+        tagged = self._by_tag.get(rule.get('tag'))
+        if tagged is not None:
+            tagged.pop(rule['value'], None)
+            if not tagged:
+                del self._by_tag[rule.get('tag')]
+        self._rules = None
+
+    def _rule_list(self):
+        if self._rules is None:
+            self._rules = list(self._by_value.values())
+        return self._rules
+
+    def _load(self):
+        with io.open(self.path, encoding="utf-8") as f:
+            saved = json.load(f)
+        with self._lock:
+            self.fetched_at = saved['fetched_at']
+            self._index(saved['rules'])
+
+    def _save(self):
+        if not self.path:
+            return
+        tmp = self.path + ".tmp"
+        with io.open(tmp, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"fetched_at": self.fetched_at,
+                                "rules": self._rule_list()},
+                               ensure_ascii=False))
+        os.rename(tmp, self.path)
+
+    def expired(self, now=None):
+        return self.fetched_at is None or \
+            (now or time.time()) - self.fetched_at >= self.ttl
+
+    def refresh(self):
+        """ Fetch the rules from GNIP now. """
+        rules = self.client.get_rules()
+        with self._lock:
+            self.fetched_at = time.time()
+            self._index(rules)
+            self._save()
+
+    def _fresh(self):
+        if self.expired():
+            self.refresh()
+
+    def rules(self):
+        """ All the rules, fetched again first if they've expired. """
+        self._fresh()
+        with self._lock:
+            return list(self._rule_list())
+
+    def by_value(self, value):
+        """ The rule with this value, or None. """
+        self._fresh()
+        return self._by_value.get(value)
+
+    def by_tag(self, tag):
+        """ The rules with this tag. """
+        self._fresh()
+        with self._lock:
+            return list(self._by_tag.get(tag, {}).values())
+
+    def by_id(self, rule_id):
+        """ The rule with this id (or id_str), or None. """
+        self._fresh()
+        return self._by_id.get(rule_id)
+
+    def __len__(self):
+        self._fresh()
+        return len(self._by_value)
+
+    def __contains__(self, value):
+        return self.by_value(value) is not None
+
+    def _write_through(self, added=(), deleted=()):
+        with self._lock:
+            if self.fetched_at is None:
+                # Nothing cached yet; the first read fetches the changes.
+                return
+            for rule in deleted:
+                cached = self._by_value.get(rule['value'])
+                if cached is not None:
+                    self._unindex_rule(cached)
+            for rule in added:
+                if rule['value'] not in self._by_value:
+                    self._index_rule(dict(rule))
+            self._save()
+
+    def add_rules(self, rules_list):
+        """ Add rules through the client and to the cache. """
+        try:
+            report = self.client.add_rules(rules_list)
+        except RuleAddFailedException as e:
+            if e.report is not None:
+                self._write_through(added=e.report.succeeded)
+            raise
+        self._write_through(added=report.succeeded)
+        return report
+
+    def delete_rules(self, rules_list):
+        """ Delete rules through the client and from the cache. """
+        try:
+            report = self.client.delete_rules(rules_list)
+        except RuleDeleteFailedException as e:
+            if e.report is not None:
+                self._write_through(deleted=e.report.succeeded)
+            raise
+        self._write_through(deleted=report.succeeded)
+        return report
@@ -1,6 +1,13 @@
 # -*- coding: utf-8 -*-
 
+import codecs
 import json
+import re
+import threading
+import time
+import warnings
+from contextlib import closing
+from email.utils import mktime_tz, parsedate_tz
 
 try:
     from urllib.parse import urlparse
@@ -8,10 +15,27 @@ except:
     from urlparse import urlparse
 
 import requests
+from requests.packages.urllib3.util.retry import Retry
 from six import string_types
 
 from gnippy import config
 from gnippy.errors import *
+from gnippy.backoff import Backoff
+from gnippy.ratelimit import TokenBucket
+from gnippy.rulesyntax import check_rules
+
+
+# GNIP's limits on a single Rules API request.
+MAX_RULES_PER_REQUEST = 5000
+MAX_REQUEST_BYTES = 1024 * 1024
+
+ITER_CHUNK_SIZE = 64 * 1024
+
+# Responses worth retrying: rate limited, or a transient server problem.
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# The longest a Retry-After header is allowed to make a request wait.
+MAX_RETRY_AFTER = 300
 
 
 def _generate_post_object(rules_list):
@@ -54,35 +78,10 @@ def _check_rules_list(rules_list):
                 fail()
 
 
-def _post(conf, built_rules):
-    """
-        Generate the Rules URL and POST data and make the POST request.
-        POST data must look like:
-        {
-            "rules": [
-                        {"value":"rule1", "tag":"tag1"},
-                        {"value":"rule2"}
-                     ]
-        }
-
-        Args:
-            conf: A configuration object that contains auth and url info.
-            built_rules: A single or list of built rules.
-    """
-    _check_rules_list(built_rules)
-    rules_url = conf['rules_url']
-    post_data = json.dumps(_generate_post_object(built_rules))
-    r = requests.post(rules_url, auth=conf['auth'], data=post_data)
-    if not r.status_code in range(200, 300):
-        error_text = "HTTP Response Code: %s, Text: '%s'" % (str(r.status_code), r.text)
-        raise RuleAddFailedException(error_text)
-
-
-def _generate_delete_url(conf):
+def _generate_delete_url(rules_url):
     """
         Generate the Rules URL for a DELETE request.
     """
-    rules_url = conf['rules_url']
     parsed_url = urlparse(rules_url)
     query = parsed_url.query
     if query != '':
@@ -91,28 +90,559 @@ def _generate_delete_url(conf):
         return rules_url + "?_method=delete"
 
 
-def _delete(conf, built_rules):
+def chunk_rules(rules_list, max_rules=MAX_RULES_PER_REQUEST,
+                max_bytes=MAX_REQUEST_BYTES):
     """
-        Generate the Delete Rules URL and make a POST request.
-        POST data must look like:
-        {
-            "rules": [
-                        {"value":"rule1", "tag":"tag1"},
-                        {"value":"rule2"}
-                     ]
-        }
+        Split rules_list into lists of at most `max_rules` rules whose
+        POST data is at most `max_bytes` long. A rule too big to fit on
+        its own still gets a chunk, for GNIP to reject.
+    """
+    overhead = len(json.dumps(_generate_post_object([])))
+    chunk = []
+    size = overhead
+    for rule in rules_list:
+        # Plus one for the comma separating it from the previous rule.
+        rule_size = len(json.dumps(rule).encode("utf-8")) + 1
+        if chunk and (len(chunk) >= max_rules or
+                      size + rule_size > max_bytes):
+            yield chunk
+            chunk = []
+            size = overhead
+        chunk.append(rule)
+        size += rule_size
+    if chunk:
+        yield chunk
+
+
+class RulesReport(object):
+    """
+        What happened to each rule in a bulk add or delete:
+            succeeded: Rules GNIP created (or deleted).
+            duplicates: Rules that were repeated in the list, or that GNIP
+                reported it already had.
+            failed: (rule, reason) pairs for the rest.
+    """
+
+    def __init__(self):
+        self.succeeded = []
+        self.duplicates = []
+        self.failed = []
+
+    def add_response(self, chunk, response, applied):
+        """
+            Record the outcome of the request for `chunk`: the Response,
+            or the error text if there was none.
+        """
+        if not hasattr(response, "status_code"):
+            self.failed.extend((rule, response) for rule in chunk)
+            return
+        if response.status_code not in range(200, 300):
+            reason = "HTTP Response Code: %s, Text: '%s'" % (
+                str(response.status_code), response.text)
+            self.failed.extend((rule, reason) for rule in chunk)
+            return
+        # GNIP may detail the outcome of each rule; assume success if not.
+        try:
+            detail = (response.json() or {}).get("detail") or []
+        except Exception:
+            detail = []
+        outcomes = dict((d.get("rule", {}).get("value"), d) for d in detail
+                        if isinstance(d, dict))
+        for rule in chunk:
+            outcome = outcomes.get(rule['value'])
+            if outcome is None or outcome.get(applied, True):
+                self.succeeded.append(rule)
+                continue
+            message = outcome.get("message") or "Not %s" % applied
+            if "duplicate" in message.lower() or \
+                    "already exists" in message.lower():
+                self.duplicates.append(rule)
+            else:
+                self.failed.append((rule, message))
+
+    def error_text(self):
+        reasons = sorted(set(reason for rule, reason in self.failed))
+        return "%d of %d rules failed: %s" % (
+            len(self.failed),
+            len(self.failed) + len(self.succeeded) + len(self.duplicates),
+            "; ".join(reasons))
+
+
+def rule_key(rule):
+    """ What identifies a rule when diffing: its value and tag. """
+    return (rule['value'], rule.get('tag') or None)
+
 
-        Args:
-            conf: A configuration object that contains auth and url info.
-            built_rules: A single or list of built rules.
+class RulesDiff(object):
     """
-    _check_rules_list(built_rules)
-    rules_url = _generate_delete_url(conf)
-    delete_data = json.dumps(_generate_post_object(built_rules))
-    r = requests.post(rules_url, auth=conf['auth'], data=delete_data)
-    if not r.status_code in range(200,300):
-        error_text = "HTTP Response Code: %s, Text: '%s'" % (str(r.status_code), r.text)
-        raise RuleDeleteFailedException(error_text)
+        The changes that turn one rule set into another:
+            to_add: Desired rules that aren't current.
+            to_delete: Current rules that aren't desired. A rule whose tag
+                changed is deleted and added again.
+            unchanged: Rules that are both.
+        Once applied, `add_report` and `delete_report` hold the
+        RulesReports of the changes. str() lists the changes, one per
+        line, as "+ value [tag]" or "- value [tag]".
+    """
+
+    def __init__(self, current, desired):
+        current_keys = set(rule_key(r) for r in current)
+        desired_keys = set(rule_key(r) for r in desired)
+        self.to_add = []
+        for rule in desired:
+            key = rule_key(rule)
+            if key not in current_keys:
+                self.to_add.append(rule)
+                # Only add a rule repeated in desired once.
+                current_keys.add(key)
+        self.to_delete = [r for r in current
+                          if rule_key(r) not in desired_keys]
+        self.unchanged = [r for r in current if rule_key(r) in desired_keys]
+        self.add_report = None
+        self.delete_report = None
+
+    def __bool__(self):
+        return bool(self.to_add or self.to_delete)
+    __nonzero__ = __bool__
+
+    def __str__(self):
+        def line(sign, rule):
+            tag = rule.get('tag')
+            return "%s %s%s" % (sign, rule['value'],
+                                " [%s]" % tag if tag else "")
+        return "\n".join([line("-", r) for r in self.to_delete] +
+                         [line("+", r) for r in self.to_add])
+
+
+def retry_after(response):
+    """
+        The delay in seconds a response's Retry-After header asks for
+        (given either in seconds or as an HTTP date), or None.
+    """
+    value = (getattr(response, "headers", None) or {}).get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    date = parsedate_tz(value)
+    if date is None:
+        return None
+    return max(0.0, mktime_tz(date) - time.time())
+
+
+_shared_rate_limiter = None
+
+
+def set_rate_limit(rate, capacity=None, lock_path=None):
+    """
+        Limit every RulesClient in this process that wasn't given its own
+        limit (including the ones behind the module level functions) to
+        `rate` requests per second, through one shared TokenBucket. With
+        `lock_path` the bucket is shared with other processes too.
+        Pass rate=None to remove the limit.
+    """
+    global _shared_rate_limiter
+    _shared_rate_limiter = TokenBucket(rate, capacity, lock_path) \
+        if rate else None
+    return _shared_rate_limiter
+
+
+_RULES_ARRAY = re.compile(r'"rules"\s*:\s*\[')
+_raw_decode = json.JSONDecoder().raw_decode
+
+
+def iter_rules_json(chunks):
+    """
+        Incrementally parse a Rules API response, given as an iterable of
+        byte chunks, yielding the rules in its "rules" array one at a time.
+        Only the rules not yet yielded are kept in memory.
+        Raises RulesGetFailedException if the response is malformed.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buf = ""
+    pos = None
+
+    def more():
+        for chunk in chunks:
+            text = decoder.decode(chunk)
+            if text:
+                return text
+        return None
+
+    while pos is None:
+        match = _RULES_ARRAY.search(buf)
+        if match:
+            pos = match.end()
+            break
+        text = more()
+        if text is None:
+            raise RulesGetFailedException(
+                "GNIP API response did not return a rules object")
+        # Keep enough of the tail to match a key split across chunks.
+        buf = buf[-32:] + text
+
+    while True:
+        # Skip to the next rule, or the end of the array.
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buf):
+                break
+            text = more()
+            if text is None:
+                raise RulesGetFailedException(
+                    "GNIP API returned malformed JSON")
+            buf, pos = text, 0
+        if buf[pos] == "]":
+            return
+        try:
+            rule, end = _raw_decode(buf, pos)
+        except ValueError:
+            # Probably a rule split across chunks: read on.
+            text = more()
+            if text is None:
+                raise RulesGetFailedException(
+                    "GNIP API returned malformed JSON")
+            buf, pos = buf[pos:] + text, 0
+            continue
+        yield rule
+        pos = end
+
+
+def _retry(retries, backoff_factor):
+    """
+        Retry connection and read errors, including for POSTs: adding or
+        deleting the same rules twice is harmless.
+    """
+    kwargs = dict(total=retries, connect=retries, read=retries,
+                  backoff_factor=backoff_factor)
+    try:
+        return Retry(allowed_methods=None, status=0, raise_on_status=False,
+                     **kwargs)
+    except TypeError: # urllib3 < 1.26
+        pass
+    try:
+        return Retry(method_whitelist=False, status=0, raise_on_status=False,
+                     **kwargs)
+    except TypeError: # urllib3 < 1.16, as bundled with older requests
+        return Retry(method_whitelist=False, **kwargs)
+
+
+def _create_session(pool_size, retries, backoff_factor):
+    """ A requests Session with a keep-alive connection pool. """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size,
+        max_retries=_retry(retries, backoff_factor))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class RulesClient(object):
+    """
+        Talks to the Rules API over a pooled requests Session, so that
+        consecutive calls reuse their connections instead of doing a new
+        TCP and TLS handshake each time. Configuration is resolved once,
+        the same way as for the module level functions.
+    """
+
+    def __init__(self, pool_size=10, retries=3, backoff_factor=0.5,
+                 session=None, max_rules_per_request=MAX_RULES_PER_REQUEST,
+                 max_request_bytes=MAX_REQUEST_BYTES, parallelism=4,
+                 requests_per_second=None, validate=True, rate_limiter=None,
+                 http_retries=5, retry_backoff=None,
+                 max_retry_after=MAX_RETRY_AFTER, **kwargs):
+        """
+            Optional Args:
+                pool_size: Number of connections kept alive.
+                retries: How many times a request that failed to connect
+                    or read is retried, with exponential backoff starting
+                    at `backoff_factor` seconds.
+                session: Use this requests Session instead of creating one.
+                max_rules_per_request, max_request_bytes: Larger rule lists
+                    are split into chunks within these limits.
+                parallelism: How many chunks are sent at once.
+                requests_per_second: Limit on the rate of requests.
+                rate_limiter: A TokenBucket to share with other clients
+                    instead. Without either, the limit set with
+                    set_rate_limit() applies, if any.
+                http_retries: How many times a request that got HTTP 429
+                    or a transient 5xx (RETRY_STATUSES) is retried. The
+                    delay is the one the Retry-After header asks for, up
+                    to `max_retry_after` seconds, or else from
+                    `retry_backoff` (a Backoff).
+                validate: Check the syntax of rules locally before adding
+                    them, raising RuleSyntaxException for any that are
+                    invalid without sending anything. Operators the check
+                    doesn't know only give a RuleSyntaxWarning.
+                rules_url, auth, config_file_path: As for get_rules().
+        """
+        conf = config.resolve(kwargs)
+        if not conf.get('rules_url'):
+            raise IncompleteConfigurationException(
+                "Please provide a PowerTrack rules_url.")
+        self.rules_url = conf['rules_url']
+        self.auth = conf['auth']
+        if session is None:
+            session = _create_session(pool_size, retries, backoff_factor)
+        self.session = session
+        self.max_rules_per_request = max_rules_per_request
+        self.max_request_bytes = max_request_bytes
+        self.parallelism = max(1, parallelism)
+        if requests_per_second:
+            rate_limiter = TokenBucket(requests_per_second, capacity=1)
+        self._rate_limiter = rate_limiter
+        self.http_retries = http_retries
+        self.retry_backoff = retry_backoff or Backoff(1, 60)
+        self.max_retry_after = max_retry_after
+        self.validate = validate
+
+    @property
+    def rate_limiter(self):
+        return self._rate_limiter or _shared_rate_limiter
+
+    def _request(self, method, url, **kwargs):
+        """
+            Make a request within the rate limit, retrying it when GNIP
+            answers with one of the RETRY_STATUSES.
+        """
+        attempt = 0
+        while True:
+            limiter = self.rate_limiter
+            if limiter is not None:
+                limiter.acquire()
+            r = getattr(self.session, method)(url, auth=self.auth, **kwargs)
+            if r.status_code not in RETRY_STATUSES or \
+                    attempt >= self.http_retries:
+                return r
+            delay = retry_after(r)
+            if delay is None:
+                delay = self.retry_backoff.delay(attempt)
+            else:
+                delay = min(delay, self.max_retry_after)
+            if hasattr(r, "close"):
+                r.close()
+            attempt += 1
+            time.sleep(delay)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _send(self, url, chunk):
+        """
+            POST one chunk of rules. POST data must look like:
+            {
+                "rules": [
+                            {"value":"rule1", "tag":"tag1"},
+                            {"value":"rule2"}
+                         ]
+            }
+            Returns the Response, or the error text if the request failed.
+        """
+        data = json.dumps(_generate_post_object(chunk))
+        try:
+            return self._request("post", url, data=data)
+        except requests.RequestException as e:
+            return str(e)
+
+    def _submit(self, url, rules_list, applied):
+        """
+            Split rules_list into chunks GNIP accepts, POST them to `url`
+            `parallelism` at a time and return a RulesReport.
+            `applied` is the key in the response's per-rule detail that
+            says whether a rule was created or deleted.
+        """
+        _check_rules_list(rules_list)
+        report = RulesReport()
+        unique = []
+        seen = set()
+        for rule in rules_list:
+            if rule['value'] in seen:
+                report.duplicates.append(rule)
+            else:
+                seen.add(rule['value'])
+                unique.append(rule)
+
+        chunks = list(chunk_rules(unique, self.max_rules_per_request,
+                                  self.max_request_bytes))
+        responses = [None] * len(chunks)
+        pending = iter(range(len(chunks)))
+        lock = threading.Lock()
+
+        def work():
+            while True:
+                with lock:
+                    i = next(pending, None)
+                if i is None:
+                    return
+                responses[i] = self._send(url, chunks[i])
+
+        threads = [threading.Thread(target=work)
+                   for _ in range(min(self.parallelism, len(chunks)) - 1)]
+        for t in threads:
+            t.start()
+        work()
+        for t in threads:
+            t.join()
+
+        for chunk, r in zip(chunks, responses):
+            report.add_response(chunk, r, applied)
+        return report
+
+    def _validate(self, rules_list, validate=None):
+        """
+            Raise RuleSyntaxException, before anything is sent, if
+            validation is on and any rule in rules_list is invalid.
+            `validate` overrides the client's setting for one call.
+        """
+        if validate is None:
+            validate = self.validate
+        if not validate:
+            return
+        _check_rules_list(rules_list)
+        invalid, warned = check_rules(rules_list)
+        if invalid:
+            raise RuleSyntaxException(invalid)
+        for rule, messages in warned:
+            warnings.warn("'%s': %s" % (rule['value'], ", ".join(messages)),
+                          RuleSyntaxWarning, stacklevel=3)
+
+    def add_rule(self, rule_string, tag=None, validate=None):
+        """ Synchronously add a single rule to GNIP PowerTrack. """
+        return self.add_rules([build(rule_string, tag),], validate)
+
+    def add_rules(self, rules_list, validate=None):
+        """
+            Synchronously add multiple rules to GNIP PowerTrack, in as many
+            requests as GNIP's limits require. `validate` overrides the
+            client's setting for this call.
+            Returns a RulesReport. Raises RuleAddFailedException, with the
+            report attached, if any rule could not be added.
+        """
+        self._validate(rules_list, validate)
+        report = self._submit(self.rules_url, rules_list, "created")
+        if report.failed:
+            raise RuleAddFailedException(report.error_text(), report)
+        return report
+
+    def get_rules(self):
+        """ Get all the rules currently applied to PowerTrack. """
+        rules_url = self.rules_url
+
+        def fail(reason):
+            raise RulesGetFailedException("Could not get current rules for '%s'. Reason: '%s'" % (rules_url, reason))
+
+        try:
+            r = self._request("get", rules_url)
+        except Exception as e:
+            fail(str(e))
+
+        if r.status_code not in range(200,300):
+            fail("HTTP Status Code: %s" % r.status_code)
+
+        try:
+            rules_json = r.json()
+        except:
+            fail("GNIP API returned malformed JSON")
+
+        if "rules" in rules_json:
+            return rules_json['rules']
+        else:
+            fail("GNIP API response did not return a rules object")
+
+    def iter_rules(self, chunk_size=ITER_CHUNK_SIZE):
+        """
+            Like get_rules, but yields the rules one at a time, parsing
+            the response as it arrives so memory use doesn't grow with
+            the number of rules.
+        """
+        rules_url = self.rules_url
+
+        def fail(reason):
+            raise RulesGetFailedException("Could not get current rules for '%s'. Reason: '%s'" % (rules_url, reason))
+
+        try:
+            r = self._request("get", rules_url, stream=True)
+        except Exception as e:
+            fail(str(e))
+
+        with closing(r):
+            if r.status_code not in range(200,300):
+                fail("HTTP Status Code: %s" % r.status_code)
+            try:
+                for rule in iter_rules_json(r.iter_content(chunk_size)):
+                    yield rule
+            except RulesGetFailedException as e:
+                fail(str(e))
+            except requests.RequestException as e:
+                fail(str(e))
+
+    def delete_rule(self, rule_dict):
+        """ Synchronously delete a single rule from GNIP PowerTrack. """
+        return self.delete_rules([rule_dict,])
+
+    def delete_rules(self, rules_list):
+        """
+            Synchronously delete multiple rules from GNIP PowerTrack, in as
+            many requests as GNIP's limits require.
+            Returns a RulesReport. Raises RuleDeleteFailedException, with
+            the report attached, if any rule could not be deleted.
+        """
+        report = self._submit(_generate_delete_url(self.rules_url),
+                              rules_list, "deleted")
+        if report.failed:
+            raise RuleDeleteFailedException(report.error_text(), report)
+        return report
+
+
+    def sync(self, desired_rules, dry_run=False, validate=None):
+        """
+            Make the stream's rules match desired_rules: fetch the current
+            rules once, diff them on (value, tag) and only delete and add
+            the difference, in bulk. Deletes go first so that a rule whose
+            tag changed can be added again. The desired rules are
+            validated first, so an invalid one changes nothing.
+            Returns the RulesDiff; with dry_run nothing is changed.
+        """
+        _check_rules_list(desired_rules)
+        self._validate(desired_rules, validate)
+        diff = RulesDiff(self.get_rules(), desired_rules)
+        if dry_run:
+            return diff
+        if diff.to_delete:
+            diff.delete_report = self.delete_rules(diff.to_delete)
+        if diff.to_add:
+            diff.add_report = self.add_rules(diff.to_add, validate=False)
+        return diff
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _client(kwargs):
+    """
+        The shared RulesClient for the configuration in kwargs, so that
+        the module level functions reuse connections too.
+    """
+    conf = config.resolve(kwargs)
+    key = (conf.get('rules_url'), tuple(conf['auth']))
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = RulesClient(
+                rules_url=conf.get('rules_url'), auth=conf['auth'])
+        return client
 
 
 def build(rule_string, tag=None):
@@ -128,18 +658,18 @@ def build(rule_string, tag=None):
     return rule
 
 
-def add_rule(rule_string, tag=None, **kwargs):
+def add_rule(rule_string, tag=None, validate=True, **kwargs):
     """ Synchronously add a single rule to GNIP PowerTrack. """
-    conf = config.resolve(kwargs)
-    rule = build(rule_string, tag)
-    rules_list = [rule,]
-    _post(conf, rules_list)
+    return _client(kwargs).add_rule(rule_string, tag, validate)
 
 
-def add_rules(rules_list, **kwargs):
-    """ Synchronously add multiple rules to GNIP PowerTrack in one go. """
-    conf = config.resolve(kwargs)
-    _post(conf, rules_list)
+def add_rules(rules_list, validate=True, **kwargs):
+    """
+        Synchronously add multiple rules to GNIP PowerTrack, split into
+        chunks within GNIP's limits. Returns a RulesReport.
+        Pass validate=False to skip the local syntax check.
+    """
+    return _client(kwargs).add_rules(rules_list, validate)
 
 
 def get_rules(**kwargs):
@@ -156,39 +686,35 @@ def get_rules(**kwargs):
                 { "value": "Hello", "tag": "mytag" }
             ]
     """
-    conf = config.resolve(kwargs)
-    rules_url = conf['rules_url']
-
-    def fail(reason):
-        raise RulesGetFailedException("Could not get current rules for '%s'. Reason: '%s'" % (rules_url, reason))
-
-    try:
-        r = requests.get(rules_url, auth=conf['auth'])
-    except Exception as e:
-        fail(str(e))
+    return _client(kwargs).get_rules()
 
-    if r.status_code not in range(200,300):
-        fail("HTTP Status Code: %s" % r.status_code)
 
-    try:
-        rules_json = r.json()
-    except:
-        fail("GNIP API returned malformed JSON")
-
-    if "rules" in rules_json:
-        return rules_json['rules']
-    else:
-        fail("GNIP API response did not return a rules object")
+def iter_rules(**kwargs):
+    """
+        Like get_rules, but returns an iterator that yields the rules one
+        at a time as the response is parsed, so memory use stays flat.
+    """
+    return _client(kwargs).iter_rules()
 
 
 def delete_rule(rule_dict, **kwargs):
     """ Synchronously delete a single rule from GNIP PowerTrack. """
-    conf = config.resolve(kwargs)
-    rules_list = [rule_dict,]
-    _delete(conf, rules_list)
+    return _client(kwargs).delete_rule(rule_dict)
 
 
 def delete_rules(rules_list, **kwargs):
-    """ Synchronously delete multiple rules from GNIP PowerTrack. """
-    conf = config.resolve(kwargs)
-    _delete(conf, rules_list)
+    """
+        Synchronously delete multiple rules from GNIP PowerTrack, split into
+        chunks within GNIP's limits. Returns a RulesReport.
+    """
+    return _client(kwargs).delete_rules(rules_list)
+
+
+def sync(desired_rules, dry_run=False, validate=True, **kwargs):
+    """
+        Synchronously make the PowerTrack rules match desired_rules,
+        changing only what differs. Returns a RulesDiff; pass dry_run=True
+        to see what would change without changing anything, and
+        validate=False to skip the local syntax check.
+    """
+    return _client(kwargs).sync(desired_rules, dry_run, validate)
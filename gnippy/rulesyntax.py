@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+"""
+    An offline tokenizer, parser and validator for PowerTrack rule syntax,
+    so that bad rules are caught before a round trip to GNIP.
+
+    A rule is a boolean expression of clauses: keywords, "quoted phrases",
+    #hashtags, @mentions and operator:value pairs, optionally negated with
+    a leading -. Clauses next to each other are ANDed, OR (upper case)
+    has lower precedence, and parentheses group.
+
+    Operators GNIP keeps adding to, such as the operator names themselves
+    and the values of has: and is:, are checked against lists that may be
+    behind GNIP's; anything not on them is a warning rather than an error.
+"""
+
+import re
+
+# GNIP's limits on a single rule.
+MAX_RULE_LENGTH = 2048
+MAX_POSITIVE_CLAUSES = 30
+MAX_NEGATED_CLAUSES = 50
+
+OPERATORS = frozenset((
+    "bio", "bio_contains", "bio_location", "bio_location_contains",
+    "bio_name", "bio_name_contains", "bounding_box", "contains",
+    "conversation_id", "country_code", "followers_count",
+    "following_count", "friends_count", "from", "has",
+    "in_reply_to_status_id", "in_reply_to_tweet_id", "is", "keyword",
+    "lang", "listed_count", "place", "place_contains", "place_country",
+    "point_radius", "profile_bounding_box", "profile_country",
+    "profile_country_contains", "profile_locality",
+    "profile_locality_contains", "profile_point_radius", "profile_region",
+    "profile_region_contains", "profile_subregion",
+    "profile_subregion_contains", "retweets_of", "retweets_of_status_id",
+    "retweets_of_tweet_id", "sample", "source", "statuses_count",
+    "time_zone", "to", "tweets_count", "url", "url_contains",
+    "url_description", "url_title",
+))
+
+HAS_VALUES = frozenset((
+    "cashtags", "geo", "hashtags", "images", "lang", "links", "media",
+    "mentions", "profile_geo", "symbols", "videos",
+))
+
+IS_VALUES = frozenset(("quote", "reply", "retweet", "verified"))
+
+LPAREN, RPAREN, OR, NEG, TERM, PHRASE = \
+    "(", ")", "OR", "-", "term", "phrase"
+
+_BREAK = frozenset(' \t\r\n()"')
+
+# Operator names are lower case ASCII; anything else before a colon is
+# part of a keyword.
+_OPERATOR_NAME = re.compile(r"[a-z][a-z_]*\Z")
+
+
+class RuleSyntaxError(Exception):
+    """ A syntax error in one rule, at character `position`. """
+    def __init__(self, message, position=None):
+        if position is not None:
+            message = "%s at position %d" % (message, position)
+        super(RuleSyntaxError, self).__init__(message)
+        self.position = position
+
+
+def tokenize(value):
+    """
+        Split a rule into (kind, text, position) tokens. Quoted operator
+        values (bio:"a b") and bracketed ones (point_radius:[x y 5mi])
+        stay part of their term.
+    """
+    tokens = []
+    i = 0
+    n = len(value)
+    while i < n:
+        c = value[i]
+        if c in " \t\r\n":
+            i += 1
+        elif c == "(" or c == ")":
+            tokens.append((c, c, i))
+            i += 1
+        elif c == '"':
+            end = _end_of_phrase(value, i)
+            tokens.append((PHRASE, value[i:end], i))
+            i = end
+        elif c == "-":
+            if i + 1 == n or value[i + 1] in " \t\r\n)":
+                raise RuleSyntaxError("Nothing to negate", i)
+            tokens.append((NEG, c, i))
+            i += 1
+        else:
+            start = i
+            while i < n and value[i] not in _BREAK:
+                if value[i] == "[":
+                    close = value.find("]", i)
+                    if close == -1:
+                        raise RuleSyntaxError("Unterminated [", i)
+                    i = close + 1
+                elif value[i] == ":" and i + 1 < n and value[i + 1] == '"':
+                    i = _end_of_phrase(value, i + 1)
+                else:
+                    i += 1
+            text = value[start:i]
+            tokens.append((OR if text == "OR" else TERM, text, start))
+    return tokens
+
+
+def _end_of_phrase(value, start):
+    """ The index just past the quote closing the phrase at `start`. """
+    i = start + 1
+    while True:
+        i = value.find('"', i)
+        if i == -1:
+            raise RuleSyntaxError("Unterminated quote", start)
+        if value[i - 1] != "\\":
+            return i + 1
+        i += 1
+
+
+class _Parser(object):
+    """
+        Recursive descent over the tokens, producing nested tuples:
+            ("or", [nodes]), ("and", [nodes]), ("not", node),
+            ("term", text) and ("phrase", text).
+        Warnings about operators it doesn't know go in `warnings`.
+    """
+
+    def __init__(self, tokens, end):
+        self.tokens = tokens
+        self.end = end
+        self.i = 0
+        self.warnings = []
+
+    def peek(self):
+        if self.i < len(self.tokens):
+            return self.tokens[self.i]
+        return (None, None, self.end)
+
+    def parse(self):
+        if not self.tokens:
+            raise RuleSyntaxError("Empty rule")
+        node = self.parse_or()
+        kind, text, position = self.peek()
+        if kind == RPAREN:
+            raise RuleSyntaxError("Unbalanced )", position)
+        return node
+
+    def parse_or(self):
+        nodes = [self.parse_and()]
+        while self.peek()[0] == OR:
+            self.i += 1
+            nodes.append(self.parse_and())
+        return nodes[0] if len(nodes) == 1 else ("or", nodes)
+
+    def parse_and(self):
+        nodes = []
+        while True:
+            kind, text, position = self.peek()
+            if kind in (None, RPAREN, OR):
+                break
+            nodes.append(self.parse_unary())
+        if not nodes:
+            kind, text, position = self.peek()
+            if kind == OR:
+                raise RuleSyntaxError("OR without a clause before it",
+                                      position)
+            if kind == RPAREN:
+                raise RuleSyntaxError("Empty group", position)
+            raise RuleSyntaxError("OR without a clause after it", position)
+        return nodes[0] if len(nodes) == 1 else ("and", nodes)
+
+    def parse_unary(self):
+        kind, text, position = self.peek()
+        if kind == NEG:
+            self.i += 1
+            if self.peek()[0] in (None, OR, RPAREN, NEG):
+                raise RuleSyntaxError("Nothing to negate", position)
+            return ("not", self.parse_unary())
+        self.i += 1
+        if kind == LPAREN:
+            node = self.parse_or()
+            if self.peek()[0] != RPAREN:
+                raise RuleSyntaxError("Unbalanced (", position)
+            self.i += 1
+            return node
+        if kind == TERM:
+            _check_term(text, position, self.warnings)
+        return (kind, text)
+
+
+def _check_term(text, position, warnings):
+    """
+        Check an operator:value term, adding a warning to `warnings` for
+        an operator (or has:/is: value) that isn't a known one.
+    """
+    name, colon, operand = text.partition(":")
+    if not colon or not _OPERATOR_NAME.match(name) or \
+            operand.startswith("//"):
+        # A plain keyword (or a URL, time etc. that contains a colon).
+        return
+    if name not in OPERATORS:
+        warnings.append("Unknown operator %s: at position %d" % (
+            name, position))
+        return
+    if not operand:
+        raise RuleSyntaxError("Missing value for %s:" % name, position)
+    if name == "has" and operand not in HAS_VALUES:
+        warnings.append("Unknown has: value %s at position %d" % (
+            operand, position))
+    if name == "is" and operand not in IS_VALUES:
+        warnings.append("Unknown is: value %s at position %d" % (
+            operand, position))
+    if name == "sample" and not (operand.isdigit() and
+                                 1 <= int(operand) <= 100):
+        raise RuleSyntaxError("sample: must be between 1 and 100",
+                              position)
+
+
+def parse(value):
+    """ Parse a rule value into a syntax tree, raising RuleSyntaxError. """
+    return _Parser(tokenize(value), len(value)).parse()
+
+
+def count_clauses(node, negated=False):
+    """ Returns (positive, negated) clause counts for a syntax tree. """
+    kind = node[0]
+    if kind == "not":
+        return count_clauses(node[1], not negated)
+    if kind in ("and", "or"):
+        positive = negative = 0
+        for child in node[1]:
+            p, n = count_clauses(child, negated)
+            positive += p
+            negative += n
+        return positive, negative
+    return (0, 1) if negated else (1, 0)
+
+
+def format_rule(node, parent=None):
+    """ The canonical text of a syntax tree. """
+    kind = node[0]
+    if kind == "not":
+        return "-" + format_rule(node[1], kind)
+    if kind in ("and", "or"):
+        joiner = " OR " if kind == "or" else " "
+        text = joiner.join(format_rule(child, kind) for child in node[1])
+        if parent == "not" or (parent == "and" and kind == "or"):
+            text = "(%s)" % text
+        return text
+    return node[1]
+
+
+def check(value, max_length=MAX_RULE_LENGTH,
+          max_positive=MAX_POSITIVE_CLAUSES,
+          max_negated=MAX_NEGATED_CLAUSES):
+    """
+        Returns (errors, warnings) for a rule value: what's wrong with it,
+        and what might be, such as operators that aren't known ones.
+    """
+    errors = []
+    if len(value) > max_length:
+        errors.append("Rule is %d characters long, the limit is %d" % (
+            len(value), max_length))
+    warnings = []
+    try:
+        parser = _Parser(tokenize(value), len(value))
+        tree = parser.parse()
+    except RuleSyntaxError as e:
+        errors.append(str(e))
+        return errors, warnings
+    warnings.extend(parser.warnings)
+    positive, negated = count_clauses(tree)
+    if not positive:
+        errors.append("Rule has no positive clauses")
+    if positive > max_positive:
+        errors.append("Rule has %d positive clauses, the limit is %d" % (
+            positive, max_positive))
+    if negated > max_negated:
+        errors.append("Rule has %d negated clauses, the limit is %d" % (
+            negated, max_negated))
+    return errors, warnings
+
+
+def validate(value, **limits):
+    """ Returns a list of what's wrong with a rule value; empty if valid. """
+    return check(value, **limits)[0]
+
+
+def normalize(value):
+    """
+        The canonical form of a valid rule value: single spaces, and only
+        the parentheses the grouping needs.
+    """
+    return format_rule(parse(value))
+
+
+def check_rules(rules_list, **limits):
+    """
+        Check the values of built rules. Returns (invalid, warned): lists
+        of (rule, [errors]) and (rule, [warnings]) pairs for the rules
+        that have any.
+    """
+    invalid = []
+    warned = []
+    for rule in rules_list:
+        errors, warnings = check(rule['value'], **limits)
+        if errors:
+            invalid.append((rule, errors))
+        if warnings:
+            warned.append((rule, warnings))
+    return invalid, warned
+
+
+def validate_rules(rules_list, **limits):
+    """
+        Validate the values of built rules. Returns a list of
+        (rule, [errors]) pairs for the invalid ones.
+    """
+    return check_rules(rules_list, **limits)[0]
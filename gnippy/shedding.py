@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+import calendar
+import random
+import time
+from datetime import datetime
+
+from gnippy.decoding import _scan_value, extract_matching_rule_tags
+from gnippy.errors import BadArgumentException
+
+
+SHED_SAMPLE = "sample"
+SHED_DROP_TAGS = "drop_tags"
+SHED_SPOOL = "spool"
+SHED_ACTIONS = (SHED_SAMPLE, SHED_DROP_TAGS, SHED_SPOOL)
+
+
+def extract_posted_time(line):
+    """
+        Returns when the activity was posted, in seconds since the epoch,
+        using a partial scan. Understands Activity Streams' postedTime and
+        the original format's created_at. Returns None if neither is found.
+    """
+    posted = _scan_value(line, "postedTime")
+    if posted:
+        # 2018-10-01T12:34:56.000Z
+        return calendar.timegm((
+            int(posted[0:4]), int(posted[5:7]), int(posted[8:10]),
+            int(posted[11:13]), int(posted[14:16]), int(posted[17:19])))
+    created = _scan_value(line, "created_at")
+    if created:
+        # Mon Oct 01 12:34:56 +0000 2018
+        return calendar.timegm(datetime.strptime(
+            created, "%a %b %d %H:%M:%S +0000 %Y").timetuple())
+    return None
+
+
+class LagMonitor(object):
+    """
+        Callback wrapper on the delivery side that estimates consumer lag:
+        how far behind the activities' posted time we are when they reach
+        the callback. Every `sample_every`th activity is measured and
+        folded into an exponentially weighted moving average, `lag`.
+    """
+
+    def __init__(self, callback, sample_every=100, alpha=0.2):
+        self.callback = callback
+        self.sample_every = sample_every
+        self.alpha = alpha
+        self.lag = 0.0
+        self._count = 0
+
+    def observe(self, line, now=None):
+        try:
+            posted = extract_posted_time(line)
+        except ValueError:
+            return
+        if posted is None:
+            return
+        sample = (now or time.time()) - posted
+        self.lag = self.alpha * sample + (1 - self.alpha) * self.lag
+
+    def __call__(self, line):
+        self._count += 1
+        if self._count % self.sample_every == 0:
+            self.observe(line)
+        self.callback(line)
+
+
+class SheddingPolicy(object):
+    """
+        When to shed load, and how.
+
+        The stream counts as overloaded while the consumer lag is above
+        `lag_threshold` seconds, or the delivery queue is more than
+        `queue_threshold` (a fraction) full. While overloaded, `action`
+        decides what happens to each activity:
+            sample: keep only `sample_rate` (a fraction) of them.
+            drop_tags: drop activities whose matching rule tags are all in
+                `low_priority_tags`.
+            spool: append them to `spool` (a gnippy.spool.Spool) instead
+                of delivering them, to be replayed later.
+    """
+
+    def __init__(self, action=SHED_SAMPLE, lag_threshold=30,
+                 queue_threshold=0.8, sample_rate=0.1,
+                 low_priority_tags=(), spool=None):
+        if action not in SHED_ACTIONS:
+            raise BadArgumentException(
+                "action must be one of: %s" % ", ".join(SHED_ACTIONS))
+        if action == SHED_SPOOL and spool is None:
+            raise BadArgumentException(
+                "A spool is required for the 'spool' action")
+        self.action = action
+        self.lag_threshold = lag_threshold
+        self.queue_threshold = queue_threshold
+        self.sample_rate = sample_rate
+        self.low_priority_tags = frozenset(low_priority_tags)
+        self.spool = spool
+
+
+class LoadShedder(object):
+    """
+        Callback wrapper on the reader side that applies a SheddingPolicy
+        before lines are handed on (usually to the delivery queue).
+        Whether we're overloaded is re-evaluated every `check_every` lines
+        so that the common, healthy case costs one counter increment.
+    """
+
+    def __init__(self, callback, policy, lag_monitor, activity_queue=None,
+                 check_every=100):
+        self.callback = callback
+        self.policy = policy
+        self.lag_monitor = lag_monitor
+        self.queue = activity_queue
+        self.check_every = check_every
+        self.overloaded = False
+        self.shed = 0
+        self._count = 0
+        self._random = random.Random()
+
+    def check(self):
+        policy = self.policy
+        overloaded = self.lag_monitor.lag > policy.lag_threshold
+        if not overloaded and self.queue is not None:
+            fill = self.queue.qsize() / float(self.queue.maxsize)
+            overloaded = fill > policy.queue_threshold
+        self.overloaded = overloaded
+        return overloaded
+
+    def __call__(self, line):
+        self._count += 1
+        if self._count % self.check_every == 0:
+            self.check()
+        if self.overloaded and self._shed(line):
+            self.shed += 1
+            return
+        self.callback(line)
+
+    def _shed(self, line):
+        """ Returns True if the line was shed. """
+        policy = self.policy
+        if policy.action == SHED_SAMPLE:
+            return self._random.random() >= policy.sample_rate
+        if policy.action == SHED_DROP_TAGS:
+            tags = extract_matching_rule_tags(line)
+            return bool(tags) and \
+                all(tag in policy.low_priority_tags for tag in tags)
+        policy.spool.append(line)
+        return True
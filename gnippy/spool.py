@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+import time
+
+from six import text_type
+
+from gnippy.errors import BadArgumentException
+
+
+SEGMENT_SUFFIX = ".spool"
+CHECKPOINT_FILE = "checkpoint"
+READ_BLOCK = 1024 * 1024
+
+
+def _segment_name(number):
+    return "%020d%s" % (number, SEGMENT_SUFFIX)
+
+
+def list_segments(directory):
+    """ The segment numbers in a spool directory, oldest first. """
+    numbers = []
+    for name in os.listdir(directory):
+        if name.endswith(SEGMENT_SUFFIX):
+            try:
+                numbers.append(int(name[:-len(SEGMENT_SUFFIX)]))
+            except ValueError:
+                continue
+    return sorted(numbers)
+
+
+def read_checkpoint(directory):
+    """
+        Returns the last committed position as (segment, offset), or None
+        if nothing has been committed yet.
+    """
+    path = os.path.join(directory, CHECKPOINT_FILE)
+    try:
+        with open(path) as f:
+            segment, offset = f.read().split()
+    except (IOError, OSError, ValueError):
+        return None
+    return int(segment), int(offset)
+
+
+def write_checkpoint(directory, position):
+    """ Atomically replace the checkpoint with `position`. """
+    path = os.path.join(directory, CHECKPOINT_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write("%d %d\n" % position)
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(tmp, path)
+
+
+class Spool(object):
+    """
+        An append-only, on-disk log of raw activity lines.
+
+        Lines are written newline-terminated to numbered segment files in
+        `directory`; a new segment is started once the current one reaches
+        `segment_bytes`. Writes are fsynced in batches, whenever
+        `fsync_interval` seconds or `fsync_lines` lines have gone by since
+        the last fsync, and on close(). If the process dies mid-write, the
+        partial last line is dropped the next time the spool is opened.
+
+        Instances are callable, so a Spool can be used as a callback.
+        With max_segments set, the oldest segments are deleted to keep
+        at most that many on disk.
+    """
+
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024,
+                 fsync_interval=1.0, fsync_lines=10000, max_segments=None):
+        if max_segments is not None and max_segments < 1:
+            raise BadArgumentException("max_segments must be at least 1")
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync_interval = fsync_interval
+        self.fsync_lines = fsync_lines
+        self.max_segments = max_segments
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        self._last_sync = time.time()
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        segments = list_segments(directory)
+        self.segment = segments[-1] if segments else 0
+        self._file = open(self._path(self.segment), "ab")
+        self._drop_partial_line()
+
+    def _path(self, segment):
+        return os.path.join(self.directory, _segment_name(segment))
+
+    def _drop_partial_line(self):
+        """ Truncate anything after the last complete line (crash recovery). """
+        size = self._file.tell()
+        keep = 0
+        with open(self._path(self.segment), "rb") as f:
+            end = size
+            while end > 0:
+                start = max(0, end - READ_BLOCK)
+                f.seek(start)
+                i = f.read(end - start).rfind(b"\n")
+                if i != -1:
+                    keep = start + i + 1
+                    break
+                end = start
+        if keep < size:
+            self._file.truncate(keep)
+            self._file.seek(keep)
+
+    def position(self):
+        """ The (segment, offset) the next line will be written at. """
+        with self._lock:
+            return self.segment, self._file.tell()
+
+    def __call__(self, line):
+        self.append(line)
+
+    def append(self, line):
+        if isinstance(line, text_type):
+            line = line.encode("utf-8")
+        with self._lock:
+            self._file.write(line + b"\n")
+            self._unsynced += 1
+            if self._file.tell() >= self.segment_bytes:
+                self._rotate()
+            elif (self._unsynced >= self.fsync_lines or
+                  time.time() - self._last_sync >= self.fsync_interval):
+                self._sync()
+
+    def sync(self):
+        """ Flush and fsync whatever has been written so far. """
+        with self._lock:
+            self._sync()
+
+    def close(self):
+        with self._lock:
+            self._sync()
+            self._file.close()
+
+    def _sync(self):
+        if self._unsynced:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+        self._last_sync = time.time()
+
+    def _rotate(self):
+        self._sync()
+        self._file.close()
+        self.segment += 1
+        self._file = open(self._path(self.segment), "ab")
+        if self.max_segments:
+            segments = list_segments(self.directory)
+            for old in segments[:-self.max_segments]:
+                os.remove(self._path(old))
+
+
+class SpooledCallback(object):
+    """ Appends each line to a Spool before passing it on to `callback`. """
+
+    def __init__(self, spool, callback):
+        self.spool = spool
+        self.callback = callback
+
+    def __call__(self, line):
+        self.spool.append(line)
+        self.callback(line)
+
+
+class SpoolReader(object):
+    """
+        Reads lines back from a Spool directory, from the committed
+        checkpoint or any other (segment, offset) position, and feeds them
+        to a callback with the same interface PowerTrackClient uses.
+        Another process can read a spool while it's being written.
+    """
+
+    poll_interval = 0.5
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._stop_event = threading.Event()
+
+    def checkpoint(self):
+        return read_checkpoint(self.directory)
+
+    def commit(self, position):
+        write_checkpoint(self.directory, position)
+
+    def stop(self):
+        """ Make a running replay(follow=True) return. """
+        self._stop_event.set()
+
+    def read(self, position=None):
+        """
+            Yields ((segment, offset), line) for every complete line after
+            `position` (default: the checkpoint, or the oldest segment),
+            where (segment, offset) is the position after that line.
+        """
+        for item in self._read(position, follow=False):
+            yield item
+
+    def replay(self, callback, position=None, follow=False,
+               commit_every=1000):
+        """
+            Call `callback` with each line after `position` (default: the
+            checkpoint), committing the checkpoint every `commit_every`
+            lines and at the end. With follow=True, keep waiting for new
+            lines until stop() is called.
+            Returns the position after the last line delivered.
+        """
+        last = position or self.checkpoint()
+        count = 0
+        for last, line in self._read(position, follow):
+            callback(line)
+            count += 1
+            if count % commit_every == 0:
+                self.commit(last)
+        if last is not None:
+            self.commit(last)
+        return last
+
+    def _read(self, position, follow):
+        if position is None:
+            position = self.checkpoint()
+        segments = list_segments(self.directory)
+        if position is None:
+            position = (segments[0] if segments else 0, 0)
+        segment, offset = position
+        if segments and segment < segments[0]:
+            # Older segments were rotated away, start at the oldest left.
+            segment, offset = segments[0], 0
+
+        while True:
+            for item in self._read_segment(segment, offset):
+                offset = item[0][1]
+                yield item
+
+            later = [s for s in list_segments(self.directory) if s > segment]
+            if later:
+                # The writer never goes back to a segment once it has
+                # started the next one, so one more pass finishes this one.
+                for item in self._read_segment(segment, offset):
+                    yield item
+                segment, offset = later[0], 0
+                continue
+
+            if not follow or self._stop_event.isSet():
+                return
+            self._stop_event.wait(self.poll_interval)
+
+    def _read_segment(self, segment, offset):
+        """ Yields the complete lines of one segment after `offset`. """
+        path = os.path.join(self.directory, _segment_name(segment))
+        if not os.path.isfile(path):
+            return
+        with open(path, "rb") as f:
+            f.seek(offset)
+            pending = b""
+            while True:
+                block = f.read(READ_BLOCK)
+                if not block:
+                    return
+                lines = (pending + block).split(b"\n")
+                pending = lines.pop()
+                for line in lines:
+                    offset += len(line) + 1
+                    yield (segment, offset), line
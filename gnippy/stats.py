@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+
+class Meter(object):
+    """
+        Counts events and reports their rate over a sliding window of
+        `window` seconds, kept as one bucket per second. Safe to mark from
+        several threads.
+    """
+
+    def __init__(self, window=10):
+        self.window = window
+        self.count = 0
+        self._buckets = [0] * window
+        self._seconds = [0] * window
+        self._lock = threading.Lock()
+
+    def mark(self, n=1, now=None):
+        second = int(now or time.time())
+        i = second % self.window
+        with self._lock:
+            if self._seconds[i] != second:
+                self._seconds[i] = second
+                self._buckets[i] = 0
+            self._buckets[i] += n
+            self.count += n
+
+    def rate(self, now=None):
+        """ Events per second over the last `window` complete seconds. """
+        current = int(now or time.time())
+        oldest = current - self.window
+        total = 0
+        with self._lock:
+            pairs = list(zip(self._seconds, self._buckets))
+        for second, n in pairs:
+            if oldest <= second < current:
+                total += n
+        return total / float(self.window)
+
+
+class Histogram(object):
+    """ Counts observations (in seconds) into fixed upper-bound buckets. """
+
+    # Upper bounds in seconds: 100us up to 10s.
+    DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5,
+                       1, 5, 10)
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = 0
+        for bound in self.buckets:
+            if value <= bound:
+                break
+            i += 1
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.total += value
+            if value > self.max:
+                self.max = value
+
+    def snapshot(self):
+        with self._lock:
+            bounds = [str(b) for b in self.buckets] + ["+Inf"]
+            return {
+                "buckets": dict(zip(bounds, self.counts)),
+                "count": self.count,
+                "mean": self.total / self.count if self.count else 0.0,
+                "max": self.max,
+            }
+
+
+class StreamStats(object):
+    """
+        Counters and gauges for one PowerTrack stream. The reader records
+        what arrives on the wire, the delivery side records how long the
+        callback takes; snapshot() turns it all into a plain dict.
+        Several connections (e.g. redundant ones) can share one instance:
+        it counts as connected while any of them is.
+    """
+
+    def __init__(self, window=10):
+        self.started_at = time.time()
+        self.bytes = Meter(window)
+        self.compressed_bytes = 0
+        self.activities = Meter(window)
+        self.heartbeats = 0
+        self.reconnects = 0
+        self.stalls = 0
+        self.callback_latency = Histogram()
+        self._connections = 0
+        self._connected_at = None
+        self._connected_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record_chunk(self, nbytes, activities, heartbeats, now=None,
+                     compressed_bytes=0):
+        now = now or time.time()
+        self.bytes.mark(nbytes, now)
+        if activities:
+            self.activities.mark(activities, now)
+        if heartbeats or compressed_bytes:
+            with self._lock:
+                self.heartbeats += heartbeats
+                self.compressed_bytes += compressed_bytes
+
+    def increment(self, counter, n=1):
+        """ Add n to a counter such as stalls or reconnects. """
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + n)
+
+    def connected(self):
+        """ A connection opened; pair with disconnected() when it closes. """
+        with self._lock:
+            if not self._connections:
+                self._connected_at = time.time()
+            self._connections += 1
+
+    def disconnected(self):
+        with self._lock:
+            if not self._connections:
+                return
+            self._connections -= 1
+            if not self._connections:
+                self._connected_seconds += time.time() - self._connected_at
+                self._connected_at = None
+
+    def connected_seconds(self):
+        """
+            Total time spent with at least one connection open, including
+            the current stretch.
+        """
+        with self._lock:
+            seconds = self._connected_seconds
+            if self._connected_at is not None:
+                seconds += time.time() - self._connected_at
+        return seconds
+
+    def snapshot(self):
+        now = time.time()
+        return {
+            "uptime_seconds": now - self.started_at,
+            "connected": self._connections > 0,
+            "connected_seconds": self.connected_seconds(),
+            "bytes": self.bytes.count,
+            "bytes_per_second": self.bytes.rate(now),
+            "compressed_bytes": self.compressed_bytes,
+            "activities": self.activities.count,
+            "activities_per_second": self.activities.rate(now),
+            "heartbeats": self.heartbeats,
+            "reconnects": self.reconnects,
+            "stalls": self.stalls,
+            "callback_latency": self.callback_latency.snapshot(),
+        }
+
+
+class TimedCallback(object):
+    """ Callback wrapper that records how long each call takes. """
+
+    def __init__(self, callback, histogram):
+        self.callback = callback
+        self.histogram = histogram
+
+    def __call__(self, data):
+        start = time.time()
+        try:
+            self.callback(data)
+        finally:
+            self.histogram.observe(time.time() - start)
+
+
+class StatsReporter(threading.Thread):
+    """
+        Calls `hook` with the result of `snapshot()` every `interval`
+        seconds, so stats can be pushed to statsd, Prometheus, logs etc.
+        Exceptions raised by the hook are ignored.
+    """
+
+    def __init__(self, snapshot, hook, interval=10):
+        super(StatsReporter, self).__init__(name="gnippy-stats")
+        self.setDaemon(True)
+        self.snapshot = snapshot
+        self.hook = hook
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.hook(self.snapshot())
+            except Exception:
+                pass
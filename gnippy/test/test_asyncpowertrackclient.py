@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import mock
+
+try:
+    import asyncio
+    from aiohttp import web
+    from gnippy.asyncpowertrackclient import AsyncPowerTrackClient
+    from gnippy.powertrackclient import Backoff, ReconnectPolicy
+except (ImportError, SyntaxError):
+    web = None
+
+from gnippy.errors import PowerTrackHTTPException, StreamStalledException
+from gnippy.test import test_utils
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+@unittest.skipIf(web is None, "aiohttp is not installed")
+class AsyncPowerTrackClientTestCase(unittest.TestCase):
+
+    def setUp(self):
+        test_utils.generate_test_config_file()
+        self.requested = []
+        self.responses = []
+        self.hang = None
+
+    def tearDown(self):
+        test_utils.delete_test_config()
+
+    async def _handler(self, request):
+        self.requested.append(str(request.rel_url))
+        status, body = self.responses.pop(0)
+        if status != 200:
+            return web.Response(status=status)
+        response = web.StreamResponse()
+        await response.prepare(request)
+        await response.write(body)
+        if self.hang:
+            await asyncio.sleep(self.hang)
+        return response
+
+    async def _serve(self, coro_fn):
+        app = web.Application()
+        app.router.add_get("/stream.json", self._handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            return await coro_fn("http://127.0.0.1:%d/stream.json" % port)
+        finally:
+            await runner.cleanup()
+
+    def _client(self, url, **kwargs):
+        return AsyncPowerTrackClient(
+            url=url, config_file_path=test_utils.test_config_path, **kwargs)
+
+    def test_stream_yields_lines_and_skips_keepalives(self):
+        self.responses = [(200, b'{"id": 1}\r\n\r\n{"id": 2}\r\n')]
+
+        async def consume(url):
+            async with self._client(url) as client:
+                return [line async for line in client]
+
+        lines = run(self._serve(consume))
+        self.assertEqual(lines, [b'{"id": 1}', b'{"id": 2}'])
+
+    def test_http_error_raises_without_reconnect(self):
+        self.responses = [(503, None)]
+
+        async def consume(url):
+            async with self._client(url) as client:
+                return [line async for line in client]
+
+        with self.assertRaises(PowerTrackHTTPException) as cm:
+            run(self._serve(consume))
+        self.assertEqual(cm.exception.status_code, 503)
+
+    def test_reconnect_with_backfill(self):
+        self.responses = [(200, b'one\r\n'), (503, None), (200, b'two\r\n')]
+        fast = Backoff(0.001, 0.001)
+        policy = ReconnectPolicy(network_backoff=fast, http_backoff=fast)
+        exception_callback = mock.Mock()
+
+        async def consume(url):
+            received = []
+            async with self._client(
+                    url, reconnect=policy,
+                    exception_callback=exception_callback) as client:
+                async for line in client:
+                    received.append(line)
+                    if len(received) == 2:
+                        break
+            return received
+
+        lines = run(self._serve(consume))
+        self.assertEqual(lines, [b'one', b'two'])
+        self.assertEqual(self.requested, [
+            "/stream.json",
+            "/stream.json?backfillMinutes=1",
+            "/stream.json?backfillMinutes=1"])
+        self.assertEqual(exception_callback.call_count, 1)
+
+    def test_stall_timeout(self):
+        self.responses = [(200, b'one\r\n')]
+        self.hang = 0.5
+
+        async def consume(url):
+            received = []
+            async with self._client(url, stall_timeout=0.1) as client:
+                try:
+                    async for line in client:
+                        received.append(line)
+                except StreamStalledException as e:
+                    return received, e
+
+        received, e = run(self._serve(consume))
+        self.assertEqual(received, [b'one'])
+        self.assertEqual(e.idle_seconds, 0.1)
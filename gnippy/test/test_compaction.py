@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from gnippy import rules
+from gnippy.compaction import analyze, canonical
+from gnippy.rulesyntax import check, validate
+
+
+def values(rules_list):
+    return [r["value"] for r in rules_list]
+
+
+class CanonicalTestCase(unittest.TestCase):
+
+    def test_order_case_and_nesting(self):
+        self.assertEqual(canonical("Tea (cocoa OR (Coffee OR cocoa)) lang:EN"),
+                         canonical("lang:en (coffee OR cocoa) tea"))
+
+    def test_case_sensitive_operators_are_kept(self):
+        self.assertEqual(canonical("bio:Barista"), "bio:Barista")
+        self.assertEqual(canonical("from:Barista"), "from:barista")
+
+
+class AnalyzeTestCase(unittest.TestCase):
+
+    def test_duplicates(self):
+        a = analyze([rules.build("coffee tea", "x"),
+                     rules.build("Tea  coffee", "y"),
+                     rules.build("cocoa", "x"),
+                     rules.build("tea coffee", "x")], merge=False)
+        self.assertEqual([values(g) for g in a.duplicates],
+                         [["coffee tea", "Tea  coffee", "tea coffee"]])
+        # Only the duplicate with the same tag is dropped.
+        self.assertEqual(values(a.compacted),
+                         ["coffee tea", "Tea  coffee", "cocoa"])
+
+    def test_subsumed(self):
+        a = analyze([rules.build("coffee lang:en", "x"),
+                     rules.build("coffee", "x"),
+                     rules.build("cocoa -milk", "x"),
+                     rules.build("tea OR cocoa", "x"),
+                     rules.build("juice (apple OR pear)", "y"),
+                     rules.build("juice (apple OR pear OR plum)", "y")],
+                    merge=False)
+        self.assertEqual(
+            [(r["value"], b["value"]) for r, b in a.subsumed],
+            [("coffee lang:en", "coffee"), ("cocoa -milk", "tea OR cocoa"),
+             ("juice (apple OR pear)", "juice (apple OR pear OR plum)")])
+        self.assertEqual(values(a.compacted),
+                         ["coffee", "tea OR cocoa",
+                          "juice (apple OR pear OR plum)"])
+
+    def test_narrower_is_not_subsumed_across_tags(self):
+        a = analyze([rules.build("coffee", "x"),
+                     rules.build("coffee lang:en", "y")], merge=False)
+        self.assertEqual(len(a.subsumed), 1)
+        self.assertEqual(len(a.compacted), 2)
+        a = analyze([rules.build("coffee", "x"),
+                     rules.build("coffee lang:en", "y")], merge=False,
+                    ignore_tags=True)
+        self.assertEqual(values(a.compacted), ["coffee"])
+
+    def test_broader_is_not_subsumed(self):
+        a = analyze([rules.build("coffee -tea"), rules.build("coffee"),
+                     rules.build("(coffee OR tea) milk"),
+                     rules.build("coffee milk")], merge=False)
+        self.assertEqual(
+            [(r["value"], b["value"]) for r, b in a.subsumed],
+            [("coffee -tea", "coffee"), ("coffee milk", "coffee")])
+
+    def test_merge(self):
+        a = analyze([rules.build("coffee", "x"), rules.build("tea cake", "x"),
+                     rules.build("-milk cocoa", "x"), rules.build("juice", "y")])
+        self.assertEqual(a.compacted, [
+            {"value": "(-milk cocoa) OR (tea cake) OR coffee", "tag": "x"},
+            {"value": "juice", "tag": "y"}])
+        self.assertEqual(len(a.merged), 1)
+        for rule in a.compacted:
+            self.assertEqual(validate(rule["value"]), [])
+
+    def test_merge_limits(self):
+        rules_list = [rules.build("word%d" % i) for i in range(100)]
+        a = analyze(rules_list, max_positive=30)
+        self.assertEqual(len(a.compacted), 4)
+        a = analyze(rules_list, max_length=60)
+        for rule in a.compacted:
+            self.assertTrue(len(rule["value"]) <= 60)
+
+    def test_merge_limits_negated_clauses(self):
+        rules_list = [rules.build("word%d -no%d -none%d" % (i, i, i))
+                      for i in range(60)]
+        a = analyze(rules_list, max_negated=10)
+        self.assertEqual(len(a.compacted), 12)
+
+    def test_compacted_rules_pass_check(self):
+        rules_list = [rules.build("word%d -no%d -none%d" % (i, i, i))
+                      for i in range(60)]
+        rules_list += [rules.build("cake%d cake%d -milk -milk" % (i, i))
+                       for i in range(40)]
+        rules_list += [rules.build("tea%d" % i) for i in range(200)]
+        a = analyze(rules_list)
+        self.assertTrue(len(a.compacted) < len(rules_list))
+        for rule in a.compacted:
+            self.assertEqual(check(rule["value"]), ([], []))
+
+    def test_invalid_rules_pass_through(self):
+        a = analyze([rules.build("(coffee"), rules.build("tea")])
+        self.assertEqual(values(a.compacted), ["(coffee", "tea"])
+        self.assertEqual(len(a.invalid), 1)
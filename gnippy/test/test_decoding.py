@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import mock
+
+from gnippy import PowerTrackClient
+from gnippy import decoding
+from gnippy.errors import BadArgumentException
+from gnippy.test import test_utils
+
+
+activity_streams = (
+    b'{"id":"tag:search.twitter.com,2005:1","objectType":"activity",'
+    b'"actor":{"id":"id:twitter.com:2","summary":"\\"matching_rules\\": no"},'
+    b'"body":"caf\xc3\xa9 ' + b'x' * 400 + b'",'
+    b'"gnip":{"matching_rules":[{"tag":"coffee","id":10},'
+    b'{"tag":null,"id":11}]}}')
+
+original_format = (
+    b'{"created_at":"Mon Oct 01 00:00:00 +0000 2018","id":1046,'
+    b'"id_str":"1046","user":{"id":7},'
+    b'"matching_rules":[{"tag":"news","id":5,"id_str":"5"}]}')
+
+
+class ExtractTestCase(unittest.TestCase):
+
+    def test_extract_id(self):
+        self.assertEqual(decoding.extract_id(activity_streams),
+                         "tag:search.twitter.com,2005:1")
+        self.assertEqual(decoding.extract_id(original_format), 1046)
+        self.assertEqual(decoding.extract_id(b'{"body":"x"}'), None)
+
+    def test_extract_matching_rules(self):
+        self.assertEqual(decoding.extract_matching_rule_tags(activity_streams),
+                         ["coffee", None])
+        self.assertEqual(decoding.extract_matching_rules(original_format),
+                         [{"tag": "news", "id": 5, "id_str": "5"}])
+        self.assertEqual(decoding.extract_matching_rules(b'{"id":1}'), [])
+
+    def test_extract_long_value(self):
+        """ Values longer than the scan window are still decoded. """
+        rules = [{"tag": "t%d" % i, "id": i} for i in range(100)]
+        line = json.dumps({"id": 1, "matching_rules": rules}).encode("utf-8")
+        self.assertEqual(decoding.extract_matching_rules(line), rules)
+
+    def test_extract_from_text(self):
+        self.assertEqual(decoding.extract_id(u'{"id": "abc"}'), "abc")
+
+
+class ParserTestCase(unittest.TestCase):
+
+    def test_named_parser(self):
+        self.assertTrue(decoding.get_parser("json") is json.loads)
+
+    def test_callable_parser(self):
+        loads = mock.Mock()
+        self.assertTrue(decoding.get_parser(loads) is loads)
+
+    def test_default_parser_decodes_bytes(self):
+        loads = decoding.get_parser()
+        self.assertEqual(loads(original_format)["id"], 1046)
+
+    def test_unknown_parser(self):
+        self.assertRaises(BadArgumentException, decoding.get_parser, "yaml")
+
+
+class LazyActivityTestCase(unittest.TestCase):
+
+    def test_partial_fields_without_full_decode(self):
+        loads = mock.Mock(side_effect=json.loads)
+        activity = decoding.LazyActivity(activity_streams, loads)
+        self.assertEqual(activity.id, "tag:search.twitter.com,2005:1")
+        self.assertEqual(activity.matching_rule_tags, ["coffee", None])
+        self.assertFalse(loads.called)
+        self.assertEqual(activity.json()["objectType"], "activity")
+        activity.json()
+        self.assertEqual(loads.call_count, 1)
+
+
+class DecoderTestCase(unittest.TestCase):
+
+    def test_decoder(self):
+        received = []
+        decoding.Decoder(received.append, parser="json")(original_format)
+        self.assertEqual(received[0]["id_str"], "1046")
+
+    def test_batch_decoder(self):
+        received = []
+        decoder = decoding.Decoder(received.append, lazy=True, batch=True)
+        decoder([original_format, activity_streams])
+        self.assertEqual([a.id for a in received[0]],
+                         [1046, "tag:search.twitter.com,2005:1"])
+
+
+class PowerTrackClientDecodeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        test_utils.generate_test_config_file()
+
+    def tearDown(self):
+        test_utils.delete_test_config()
+
+    def test_decode_true_delivers_dicts(self):
+        response = test_utils.stream_response([original_format + b"\r\n"])
+
+        received = []
+        client = PowerTrackClient(received.append, decode=True,
+                                  config_file_path=test_utils.test_config_path)
+        with mock.patch('requests.get', return_value=response):
+            client.connect()
+            client.worker.join(5)
+
+        self.assertEqual(received[0]["id"], 1046)
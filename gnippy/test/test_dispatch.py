@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+import time
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import mock
+from six.moves import queue
+
+from gnippy import PowerTrackClient
+from gnippy.dispatch import ActivityQueue, Batcher, ConsumerPool
+from gnippy.errors import BadArgumentException
+from gnippy.test import test_utils
+
+
+spill_path = "/tmp/.gnippy_spill"
+
+
+class ActivityQueueTestCase(unittest.TestCase):
+
+    def tearDown(self):
+        if os.path.isfile(spill_path):
+            os.remove(spill_path)
+
+    def test_fifo(self):
+        q = ActivityQueue(3)
+        for line in ("a", "b", "c"):
+            q.put(line)
+        self.assertEqual(q.qsize(), 3)
+        self.assertEqual([q.get(), q.get(), q.get()], ["a", "b", "c"])
+        self.assertRaises(queue.Empty, q.get, 0.01)
+
+    def test_drop_oldest(self):
+        q = ActivityQueue(2, overflow="drop_oldest")
+        for line in ("a", "b", "c"):
+            q.put(line)
+        self.assertEqual(q.dropped, 1)
+        self.assertEqual([q.get(), q.get()], ["b", "c"])
+
+    def test_spill_preserves_order(self):
+        q = ActivityQueue(2, overflow="spill", spill_path=spill_path)
+        for line in (b"a", b"b", b"c", b"d"):
+            q.put(line)
+        self.assertEqual(q.spilled, 2)
+        self.assertEqual(q.qsize(), 4)
+        self.assertEqual(q.get(), b"a")
+        # Still spilling while there's a backlog on disk
+        q.put(b"e")
+        self.assertEqual([q.get() for i in range(4)],
+                         [b"b", b"c", b"d", b"e"])
+        self.assertEqual(os.path.getsize(spill_path), 0)
+        q.close()
+        self.assertFalse(os.path.isfile(spill_path))
+
+    def test_block_waits_for_room(self):
+        q = ActivityQueue(1)
+        q.put("a")
+        t = threading.Thread(target=q.put, args=("b",))
+        t.start()
+        t.join(0.05)
+        self.assertTrue(t.is_alive())
+        self.assertEqual(q.get(), "a")
+        t.join(1)
+        self.assertFalse(t.is_alive())
+        self.assertEqual(q.get(), "b")
+
+    def test_bad_arguments(self):
+        self.assertRaises(BadArgumentException, ActivityQueue, 0)
+        self.assertRaises(BadArgumentException, ActivityQueue, 1, "wat")
+        self.assertRaises(BadArgumentException, ActivityQueue, 1, "spill")
+
+
+class ConsumerPoolTestCase(unittest.TestCase):
+
+    def test_consumers_drain_queue_before_stopping(self):
+        q = ActivityQueue(100)
+        received = []
+        lock = threading.Lock()
+
+        def callback(line):
+            with lock:
+                received.append(line)
+
+        pool = ConsumerPool(q, callback, consumers=4)
+        pool.start()
+        for i in range(50):
+            q.put(i)
+        pool.stop()
+        pool.join(5)
+        self.assertEqual(sorted(received), list(range(50)))
+
+    def test_callback_errors_are_reported(self):
+        q = ActivityQueue(10)
+        exception_callback = mock.Mock()
+
+        def callback(line):
+            raise ValueError(line)
+
+        pool = ConsumerPool(q, callback,
+                            exception_callback=exception_callback)
+        pool.start()
+        q.put("boom")
+        q.put("bang")
+        pool.stop()
+        pool.join(5)
+        self.assertEqual(exception_callback.call_count, 2)
+
+
+class BatcherTestCase(unittest.TestCase):
+
+    def test_flush_on_max_size(self):
+        batches = []
+        batcher = Batcher(batches.append, max_size=2, max_latency=60)
+        for line in ("a", "b", "c"):
+            batcher(line)
+        self.assertEqual(batches, [["a", "b"]])
+        batcher.stop()
+        self.assertEqual(batches, [["a", "b"], ["c"]])
+
+    def test_flush_on_max_latency(self):
+        batches = []
+        batcher = Batcher(batches.append, max_size=100, max_latency=0.05)
+        batcher.start()
+        batcher("a")
+        deadline = time.time() + 5
+        while not batches and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(batches, [["a"]])
+        batcher.stop()
+        self.assertEqual(batches, [["a"]])
+
+    def test_lines_after_stop_are_delivered(self):
+        batches = []
+        batcher = Batcher(batches.append, max_size=100, max_latency=60)
+        batcher.start()
+        batcher.stop()
+        batcher("late")
+        self.assertEqual(batches, [["late"]])
+
+    def test_callback_errors_are_reported(self):
+        exception_callback = mock.Mock()
+
+        def callback(batch):
+            raise ValueError()
+
+        batcher = Batcher(callback, max_size=1,
+                          exception_callback=exception_callback)
+        batcher("a")
+        self.assertEqual(exception_callback.call_count, 1)
+
+    def test_stop_between_check_and_wait(self):
+        """ The timer doesn't miss a stop() that lands just after its loop
+            checked for one, before it waited. """
+        batcher = Batcher(lambda batch: None, max_latency=60)
+        stop_event = batcher._stop_event
+        checks = []
+
+        def is_set():
+            checks.append(1)
+            if len(checks) == 1:
+                # Let stop() run to completion right after this check.
+                stop_event.set()
+                with batcher._cond:
+                    batcher._cond.notify_all()
+                return False
+            return stop_event.is_set()
+
+        batcher._stop_event = mock.Mock(isSet=is_set, set=stop_event.set)
+        batcher.start()
+        batcher._timer.join(5)
+        self.assertFalse(batcher._timer.is_alive())
+
+
+class PowerTrackClientQueueTestCase(unittest.TestCase):
+
+    def setUp(self):
+        test_utils.generate_test_config_file()
+
+    def tearDown(self):
+        test_utils.delete_test_config()
+
+    def test_reader_hands_lines_to_consumer_threads(self):
+        """ With queue_size set the callback runs on a consumer thread. """
+        response = test_utils.stream_response([b"a\r\nb", b"\r\nc\r\n"])
+
+        threads = set()
+        received = []
+
+        def callback(line):
+            threads.add(threading.current_thread().name)
+            received.append(line)
+
+        client = PowerTrackClient(callback, queue_size=10,
+                                  config_file_path=test_utils.test_config_path)
+        with mock.patch('requests.get', return_value=response):
+            client.connect()
+            client.worker.join(5)
+            client.disconnect()
+
+        self.assertEqual(received, [b"a", b"b", b"c"])
+        self.assertEqual(threads, set(["gnippy-consumer-0"]))
+
+    def test_batch_callback_receives_lists(self):
+        """ batch_callback gets lists of lines, flushed on disconnect. """
+        response = test_utils.stream_response([b"a\r\nb", b"\r\nc\r\n"])
+
+        batches = []
+        client = PowerTrackClient(None, batch_callback=batches.append,
+                                  batch_size=2, batch_latency=60,
+                                  config_file_path=test_utils.test_config_path)
+        with mock.patch('requests.get', return_value=response):
+            client.connect()
+            client.worker.join(5)
+            client.disconnect()
+
+        self.assertEqual(batches, [[b"a", b"b"], [b"c"]])
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+import zlib
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from gnippy.framing import GzipDecoder, LineFramer
+
+
+class LineFramerTestCase(unittest.TestCase):
+
+    def test_whole_activities(self):
+        framer = LineFramer()
+        self.assertEqual(framer.feed(b'{"a":1}\r\n{"b":2}\r\n'),
+                         [b'{"a":1}', b'{"b":2}'])
+
+    def test_activity_split_across_chunks(self):
+        framer = LineFramer()
+        self.assertEqual(framer.feed(b'{"a":'), [])
+        self.assertEqual(framer.feed(b'1}\r\n{"b"'), [b'{"a":1}'])
+        self.assertEqual(framer.feed(b':2}\r\n'), [b'{"b":2}'])
+
+    def test_delimiter_split_across_chunks(self):
+        framer = LineFramer()
+        self.assertEqual(framer.feed(b'{"a":1}\r'), [])
+        self.assertEqual(framer.feed(b'\n'), [b'{"a":1}'])
+
+    def test_keepalives_are_counted_not_returned(self):
+        framer = LineFramer()
+        self.assertEqual(framer.feed(b'\r\n\r\n{"a":1}\r\n\r\n'), [b'{"a":1}'])
+        self.assertEqual(framer.keepalives, 3)
+        self.assertEqual(framer.feed(b'\r'), [])
+        self.assertEqual(framer.feed(b'\n'), [])
+        self.assertEqual(framer.keepalives, 4)
+
+    def test_bare_newlines_are_not_delimiters(self):
+        framer = LineFramer()
+        self.assertEqual(framer.feed(b'a\nb\r\n'), [b'a\nb'])
+
+
+class GzipDecoderTestCase(unittest.TestCase):
+
+    def _gzip(self, data):
+        compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress(data) + compressor.flush()
+
+    def test_incremental_decompression(self):
+        payload = b"".join(b'{"id":%d}\r\n' % i for i in range(1000))
+        compressed = self._gzip(payload)
+        decoder = GzipDecoder()
+        framer = LineFramer()
+        activities = []
+        for i in range(0, len(compressed), 7):
+            activities.extend(framer.feed(
+                decoder.decompress(compressed[i:i + 7])))
+        self.assertEqual(len(activities), 1000)
+        self.assertEqual(activities[-1], b'{"id":999}')
+
+    def test_output_is_not_held_back(self):
+        """ Data flushed by the server comes out without waiting for more input. """
+        compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        first = compressor.compress(b'{"id":1}\r\n') + \
+            compressor.flush(zlib.Z_SYNC_FLUSH)
+        self.assertEqual(GzipDecoder().decompress(first), b'{"id":1}\r\n')
+
+    def test_multiple_members(self):
+        decoder = GzipDecoder()
+        data = self._gzip(b"a\r\n") + self._gzip(b"b\r\n")
+        self.assertEqual(decoder.decompress(data), b"a\r\nb\r\n")
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import mock
+
+from gnippy.errors import BadArgumentException
+from gnippy.manager import StreamManager
+from gnippy.test import test_utils
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class StreamManagerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        test_utils.generate_test_config_file()
+        self.received = {}
+        self.lock = threading.Lock()
+
+    def tearDown(self):
+        test_utils.delete_test_config()
+
+    def _callback(self, name):
+        def callback(line):
+            with self.lock:
+                self.received.setdefault(name, []).append(line)
+        return callback
+
+    def _fake_get(self, url, **kwargs):
+        # Each stream serves its own path name once, then nothing.
+        name = url.rsplit("/", 1)[-1].split("?")[0]
+        return test_utils.stream_response([name.encode("utf-8") + b"\r\n"])
+
+    def _stream(self, name):
+        return {"name": name, "callback": self._callback(name),
+                "url": "http://gnip.test/" + name, "reconnect": False,
+                "config_file_path": test_utils.test_config_path}
+
+    def test_streams_share_consumers_and_aggregate_stats(self):
+        manager = StreamManager([self._stream("a"), self._stream("b")],
+                                consumers=2, supervise_interval=60)
+        with mock.patch('requests.get', side_effect=self._fake_get):
+            manager.start()
+            self.assertTrue(wait_for(lambda: len(self.received) == 2))
+            manager.stop()
+
+        self.assertEqual(self.received, {"a": [b"a"], "b": [b"b"]})
+        stats = manager.stats()
+        self.assertEqual(stats["streams"], 2)
+        self.assertEqual(stats["activities"], 2)
+        self.assertEqual(stats["queue_depth"], 0)
+
+    def test_add_and_remove_at_runtime(self):
+        manager = StreamManager([self._stream("a")], supervise_interval=60)
+        with mock.patch('requests.get', side_effect=self._fake_get):
+            manager.start()
+            stream = self._stream("c")
+            manager.add_stream(stream.pop("name"), stream.pop("callback"),
+                               **stream)
+            self.assertTrue(wait_for(lambda: "c" in self.received))
+            self.assertEqual(manager.streams(), ["a", "c"])
+            manager.remove_stream("a")
+            self.assertEqual(manager.streams(), ["c"])
+            manager.stop()
+
+        self.assertRaises(BadArgumentException, manager.add_stream, "c",
+                          self._callback("c"), url="http://gnip.test/c",
+                          config_file_path=test_utils.test_config_path)
+
+    def test_batched_backlog_is_delivered(self):
+        """ Lines still queued when a batched stream stops aren't lost. """
+        lines = [b'{"id":%d}' % i for i in range(2000)]
+
+        def fake_get(url, **kwargs):
+            return test_utils.stream_response(
+                [b"".join(line + b"\r\n" for line in lines)])
+
+        def slow_batches(name):
+            def callback(batch):
+                time.sleep(0.02)
+                with self.lock:
+                    self.received.setdefault(name, []).extend(batch)
+            return callback
+
+        manager = StreamManager(consumers=1, supervise_interval=60)
+        for name in ("a", "b"):
+            stream = self._stream(name)
+            stream.pop("callback")
+            manager.add_stream(stream.pop("name"), None,
+                               batch_callback=slow_batches(name),
+                               batch_size=300, batch_latency=60, **stream)
+        with mock.patch('requests.get', side_effect=fake_get):
+            manager.start()
+            self.assertTrue(wait_for(lambda: all(
+                not client.connected() for client in
+                (manager.get_stream("a"), manager.get_stream("b")))))
+            self.assertTrue(manager.queue.qsize() > 0)
+            manager.remove_stream("a")
+            manager.stop()
+
+        self.assertEqual(sorted(self.received["a"]), sorted(lines))
+        self.assertEqual(sorted(self.received["b"]), sorted(lines))
+
+    def test_supervisor_restarts_dead_streams(self):
+        manager = StreamManager([self._stream("a")], supervise_interval=0.05)
+        with mock.patch('requests.get', side_effect=self._fake_get):
+            manager.start()
+            self.assertTrue(wait_for(
+                lambda: len(self.received.get("a", [])) >= 2))
+            manager.stop()
+
+        self.assertTrue(manager.health()["a"]["restarts"] >= 1)
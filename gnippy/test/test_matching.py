@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from gnippy import rules
+from gnippy.decoding import LazyActivity
+from gnippy.matching import RuleMatcher
+
+
+activity_streams = {
+    "verb": "post",
+    "body": "Breaking: the best #Coffee in town, says @Barista http://t.co/x",
+    "actor": {"preferredUsername": "CoffeeFan",
+              "id": "id:twitter.com:12345"},
+    "twitter_lang": "en",
+    "twitter_entities": {
+        "hashtags": [{"text": "Coffee"}],
+        "user_mentions": [{"screen_name": "Barista"}],
+        "urls": [{"url": "http://t.co/x"}],
+    },
+}
+
+original = {
+    "text": "RT tea time, not coffee",
+    "lang": "en",
+    "user": {"screen_name": "tea_drinker", "id_str": "678"},
+    "retweeted_status": {"text": "tea time, not coffee"},
+    "entities": {},
+}
+
+
+def values(matched):
+    return [r["value"] for r in matched]
+
+
+class RuleMatcherTestCase(unittest.TestCase):
+
+    def matcher(self, *values):
+        return RuleMatcher([rules.build(v, tag="t%d" % i)
+                            for i, v in enumerate(values)])
+
+    def test_keywords_and_phrases(self):
+        m = self.matcher("coffee", "Coffee town", '"best coffee"',
+                         '"coffee best"', "tea", "coff")
+        self.assertEqual(values(m.match(activity_streams)),
+                         ["coffee", "Coffee town", '"best coffee"'])
+
+    def test_boolean_logic(self):
+        m = self.matcher("(tea OR cocoa) coffee", "coffee -tea",
+                         "coffee -(tea OR cocoa)", "-tea coffee",
+                         "tea OR coffee")
+        self.assertEqual(values(m.match(activity_streams)),
+                         ["coffee -tea", "coffee -(tea OR cocoa)",
+                          "-tea coffee", "tea OR coffee"])
+        self.assertEqual(values(m.match(original)),
+                         ["(tea OR cocoa) coffee", "tea OR coffee"])
+
+    def test_operators(self):
+        m = self.matcher("from:coffeefan", "from:12345", "lang:en coffee",
+                         "lang:fr coffee", "has:links", "has:mentions",
+                         "#coffee", "@barista", "contains:reak",
+                         "is:retweet", "from:tea_drinker")
+        self.assertEqual(values(m.match(activity_streams)),
+                         ["from:coffeefan", "from:12345", "lang:en coffee",
+                          "has:links", "has:mentions", "#coffee",
+                          "@barista", "contains:reak"])
+        self.assertEqual(values(m.match(original)),
+                         ["lang:en coffee", "is:retweet",
+                          "from:tea_drinker"])
+
+    def test_raw_and_lazy_activities(self):
+        m = self.matcher("coffee")
+        raw = json.dumps(activity_streams).encode("utf-8")
+        self.assertEqual(len(m.match(raw)), 1)
+        self.assertEqual(len(m.match(LazyActivity(raw))), 1)
+
+    def test_matching_rules(self):
+        m = self.matcher("tea")
+        self.assertEqual(m.matching_rules(original),
+                         [{"value": "tea", "tag": "t0"}])
+
+    def test_unsupported_rules(self):
+        m = self.matcher("bio:coffee", "(tea", "coffee")
+        self.assertEqual([r["value"] for r, reason in m.unsupported],
+                         ["bio:coffee", "(tea"])
+        self.assertEqual(values(m.match(activity_streams)), ["coffee"])
+
+    def test_only_candidates_are_evaluated(self):
+        """ Rules are indexed under the features they need. """
+        m = self.matcher("coffee cake", "tea OR cocoa", "-cake", "milk")
+        self.assertEqual(m._index, {"coffee": [0], "tea": [1],
+                                    "cocoa": [1], "milk": [3]})
+        self.assertEqual(m._unanchored, [2])
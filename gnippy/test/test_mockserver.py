@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+import json
+import time
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import requests
+
+from gnippy import PowerTrackClient, rules
+from gnippy.errors import StreamStalledException
+from gnippy.mockserver import MockGnipServer
+from gnippy.powertrackclient import Backoff, ReconnectPolicy
+
+
+auth = ("user", "pass")
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+
+
+class MockGnipServerTestCase(unittest.TestCase):
+
+    def test_streams_activities(self):
+        with MockGnipServer(activities=5, activity_size=200) as server:
+            received = []
+            client = PowerTrackClient(received.append, url=server.url,
+                                      auth=auth)
+            client.connect()
+            client.worker.join(5)
+            client.disconnect()
+
+        self.assertEqual(len(received), 5)
+        activity = json.loads(received[0].decode("utf-8"))
+        self.assertEqual(len(received[0]), 200)
+        self.assertEqual(activity["gnip"]["matching_rules"][0]["tag"], "mock")
+        self.assertIn("postedTime", activity)
+
+    def test_keepalives(self):
+        with MockGnipServer(rate=1e-9, keepalive_interval=0.01) as server:
+            client = PowerTrackClient(lambda line: None, url=server.url,
+                                      auth=auth)
+            client.connect()
+            wait_for(lambda: client.stats()["heartbeats"] >= 2)
+            client.disconnect()
+        self.assertTrue(client.stats()["heartbeats"] >= 2)
+
+    def test_forced_disconnects_and_gzip(self):
+        with MockGnipServer(activities=9, disconnect_after=3,
+                            gzip=True) as server:
+            received = []
+            errors = []
+            policy = ReconnectPolicy(network_backoff=Backoff(0.01, 0.01))
+            client = PowerTrackClient(received.append, url=server.url,
+                                      auth=auth, gzip=True,
+                                      reconnect=policy,
+                                      exception_callback=errors.append)
+            client.connect()
+            wait_for(lambda: len(received) == 9)
+            client.disconnect()
+
+        self.assertEqual(len(received), 9)
+        # The stream ends after the third, so the client may reconnect again.
+        self.assertTrue(server.connections >= 3)
+        self.assertTrue(client.stats()["compressed_bytes"] > 0)
+        self.assertEqual(server.requests[1], ("GET", "/stream?backfillMinutes=1"))
+
+    def test_gzip_stall(self):
+        """ A silent gzip stream is reported as a stall, as a plain one is. """
+        for gzip in (False, True):
+            with MockGnipServer(rate=1e-9, keepalive_interval=60,
+                                gzip=gzip) as server:
+                errors = []
+                client = PowerTrackClient(lambda line: None, url=server.url,
+                                          auth=auth, gzip=gzip,
+                                          stall_timeout=0.3,
+                                          exception_callback=errors.append)
+                client.connect()
+                client.worker.join(5)
+                client.disconnect()
+            self.assertEqual([e[0] for e in errors],
+                             [StreamStalledException], gzip)
+            self.assertEqual(client.stats()["stalls"], 1)
+
+    def test_stream_errors(self):
+        with MockGnipServer(stream_errors=[503], retry_after=7) as server:
+            r = requests.get(server.url, auth=auth)
+        self.assertEqual(r.status_code, 503)
+        self.assertEqual(r.headers["Retry-After"], "7")
+
+    def test_rules_api(self):
+        with MockGnipServer(rules=[rules.build("a", "x")]) as server:
+            kwargs = {"rules_url": server.rules_url, "auth": auth}
+            rules.add_rules([rules.build("b"), rules.build("a", "x")],
+                            **kwargs)
+            self.assertEqual(rules.get_rules(**kwargs),
+                             [{"value": "a", "tag": "x"}, {"value": "b"}])
+            rules.delete_rule({"value": "a"}, **kwargs)
+            self.assertEqual(rules.get_rules(**kwargs), [{"value": "b"}])
+
+    def test_rules_api_rate_limited(self):
+        with MockGnipServer(rules_errors=[429, 503], retry_after=0) as server:
+            client = rules.RulesClient(rules_url=server.rules_url, auth=auth)
+            client.add_rule("a")
+            self.assertEqual(client.get_rules(), [{"value": "a"}])
+            self.assertEqual(len(server.requests), 4)
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+import functools
+import multiprocessing
+import os
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from gnippy.errors import BadArgumentException
+from gnippy.parallel import ProcessPool, SharedRingBuffer
+
+
+def record(results, line):
+    results.put((os.getpid(), line))
+
+
+def record_batch(results, lines):
+    results.put((os.getpid(), lines))
+
+
+def consume_ring(ring, results):
+    while True:
+        data = ring.get()
+        if not data:
+            return
+        results.put(data)
+
+
+def drain(results, n):
+    return [results.get(timeout=10) for i in range(n)]
+
+
+class SharedRingBufferTestCase(unittest.TestCase):
+
+    def test_put_get_wraps_around(self):
+        ring = SharedRingBuffer(size=32)
+        for i in range(20):
+            data = b"record %d" % i
+            ring.put(data)
+            self.assertEqual(ring.get(timeout=1), data)
+        self.assertEqual(ring.get(timeout=0.01), None)
+
+    def test_record_too_large(self):
+        ring = SharedRingBuffer(size=16)
+        self.assertRaises(BadArgumentException, ring.put, b"x" * 16)
+
+    def test_across_processes(self):
+        ring = SharedRingBuffer(size=64)
+        results = multiprocessing.Queue()
+        process = multiprocessing.Process(target=consume_ring,
+                                          args=(ring, results))
+        process.start()
+        sent = [b"%d" % i * 10 for i in range(100)]
+        for data in sent:
+            ring.put(data)
+        ring.put(b"")
+        received = drain(results, 100)
+        process.join(10)
+        self.assertEqual(received, sent)
+
+
+class ProcessPoolTestCase(unittest.TestCase):
+
+    def test_lines_reach_the_workers(self):
+        results = multiprocessing.Queue()
+        pool = ProcessPool(functools.partial(record, results), processes=2,
+                           batch_size=3)
+        pool.start()
+        lines = [b'{"id":%d}' % i for i in range(30)]
+        for line in lines:
+            pool(line)
+        pool.stop()
+        received = drain(results, 30)
+        self.assertEqual(sorted(line for pid, line in received),
+                         sorted(lines))
+        self.assertEqual(len(set(pid for pid, line in received)), 2)
+
+    def test_tag_ordering(self):
+        """ All activities for a tag go to one worker, in order. """
+        results = multiprocessing.Queue()
+        pool = ProcessPool(functools.partial(record, results), processes=3,
+                           ordering="tag", batch_size=7)
+        pool.start()
+        lines = [(b'{"id":%d,"matching_rules":[{"tag":"t%d"}]}' % (i, i % 4))
+                 for i in range(40)]
+        for line in lines:
+            pool(line)
+        pool.stop()
+        received = drain(results, 40)
+
+        by_tag = {}
+        for pid, line in received:
+            tag = line.split(b'"tag":"')[1][:2]
+            by_tag.setdefault(tag, []).append((pid, line))
+        for tag, items in by_tag.items():
+            self.assertEqual(len(set(pid for pid, line in items)), 1)
+            self.assertEqual([line for pid, line in items],
+                             [line for line in lines if b'"' + tag in line])
+
+    def test_batch_and_decode_in_workers(self):
+        results = multiprocessing.Queue()
+        pool = ProcessPool(functools.partial(record_batch, results),
+                           processes=1, batch=True, decode=True,
+                           parser="json", batch_size=2)
+        pool.start()
+        for i in range(4):
+            pool(b'{"id":%d}' % i)
+        pool.stop()
+        batches = [lines for pid, lines in drain(results, 2)]
+        self.assertEqual(batches, [[{"id": 0}, {"id": 1}],
+                                   [{"id": 2}, {"id": 3}]])
+
+    def test_batch_bigger_than_the_ring(self):
+        """ A batch that doesn't fit the ring is split, not dropped. """
+        results = multiprocessing.Queue()
+        pool = ProcessPool(functools.partial(record, results), processes=1,
+                           batch_size=500, batch_latency=60,
+                           ring_size=4096)
+        pool.start()
+        lines = [b'{"id":%d,"text":"%s"}' % (i, b"x" * 1000)
+                 for i in range(40)]
+        for line in lines:
+            pool(line)
+        pool.stop()
+        received = drain(results, 40)
+        self.assertEqual([line for pid, line in received], lines)
+
+    def test_dispatch_errors_are_reported(self):
+        errors = []
+        pool = ProcessPool(record, processes=1, ring_size=64,
+                           exception_callback=errors.append)
+        pool.batcher(b"x" * 100)
+        pool.batcher.flush()
+        self.assertEqual(errors[0][0], BadArgumentException)
+
+    def test_bad_ordering(self):
+        self.assertRaises(BadArgumentException, ProcessPool, record,
+                          ordering="wat")
@@ -2,10 +2,13 @@
 
 import os
 from time import sleep
+import zlib
 
 import mock
+import requests
 
-from gnippy.powertrackclient import append_backfill_to_url
+from gnippy.powertrackclient import append_backfill_to_url, Backoff, \
+    ReconnectPolicy
 
 try:
     import unittest2 as unittest
@@ -13,6 +16,7 @@ except ImportError:
     import unittest
 
 from gnippy import PowerTrackClient
+from gnippy.errors import PowerTrackHTTPException, StreamStalledException
 from gnippy.test import test_utils
 
 
@@ -29,12 +33,12 @@ def get_exception(*args, **kwargs):
     raise TestException("This is a test exception")
 
 
-def iter_lines_generator():
+def iter_content_generator(chunk_size):
 
     n = 0
     while True:
 
-        yield "arbitrary string value {0}".format(n)
+        yield "arbitrary string value {0}\r\n".format(n).encode("utf-8")
         n += 1
 
 def get_request_stream(url, auth, stream):
@@ -46,11 +50,18 @@ def get_request_stream(url, auth, stream):
 
     type(mocked_stream).status_code = p
 
-    mocked_stream.iter_lines.side_effect = iter_lines_generator
+    mocked_stream.iter_content.side_effect = iter_content_generator
 
     return mocked_stream
 
 
+def fast_reconnect_policy(**kwargs):
+    """ A ReconnectPolicy that doesn't make the tests wait. """
+    fast = Backoff(0.001, 0.001)
+    return ReconnectPolicy(network_backoff=fast, http_backoff=fast,
+                           rate_limit_backoff=fast, **kwargs)
+
+
 config_file = test_utils.test_config_path
 
 
@@ -240,4 +251,191 @@ class PowerTrackClientTestCase(unittest.TestCase):
 
         returned_value = append_backfill_to_url(base_url, backfill_minutes)
 
-        self.assertEqual(returned_value, expected_url)
\ No newline at end of file
+        self.assertEqual(returned_value, expected_url)
+
+    def test_reconnect_after_stream_ends_requests_backfill(self):
+        """ When the stream drops, the worker reconnects with backfillMinutes. """
+        test_utils.generate_test_config_file()
+
+        responses = [test_utils.stream_response([b"one\r\n"]),
+                     test_utils.stream_response([b"two\r\n"])]
+        received = []
+
+        def fake_get(url, auth, stream):
+            if not responses:
+                client.worker.stop()
+                return test_utils.stream_response([])
+            return responses.pop(0)
+
+        client = PowerTrackClient(received.append,
+                                  reconnect=fast_reconnect_policy(),
+                                  config_file_path=config_file)
+
+        with mock.patch('requests.get', side_effect=fake_get) as mocked_get:
+            client.connect()
+            client.worker.join(5)
+
+        self.assertEqual(received, [b"one", b"two"])
+        urls = [c[0][0] for c in mocked_get.call_args_list]
+        self.assertEqual(urls[0], test_utils.test_powertrack_url)
+        self.assertEqual(
+            urls[1], "{0}?backfillMinutes=1".format(
+                test_utils.test_powertrack_url))
+
+    def test_callback_errors_do_not_reconnect(self):
+        """ A failing callback is reported and the stream keeps being read. """
+        test_utils.generate_test_config_file()
+
+        responses = [test_utils.stream_response([b"one\r\n", b"two\r\n"])]
+        received = []
+        exception_callback = mock.Mock()
+
+        def callback(line):
+            received.append(line)
+            raise ValueError(line)
+
+        def fake_get(url, auth, stream):
+            if not responses:
+                client.worker.stop()
+                return test_utils.stream_response([])
+            return responses.pop(0)
+
+        client = PowerTrackClient(callback, exception_callback,
+                                  reconnect=fast_reconnect_policy(),
+                                  config_file_path=config_file)
+
+        with mock.patch('requests.get', side_effect=fake_get):
+            client.connect()
+            client.worker.join(5)
+
+        # Both lines came from the first connection.
+        self.assertEqual(received, [b"one", b"two"])
+        errors = [c[0][0] for c in exception_callback.call_args_list]
+        self.assertEqual([e[0] for e in errors], [ValueError, ValueError])
+
+    def test_reconnect_gives_up_after_max_attempts(self):
+        """ Once max_attempts is exhausted the last error is reported and the worker stops. """
+        test_utils.generate_test_config_file()
+
+        exception_callback = mock.Mock()
+        client = PowerTrackClient(_dummy_callback, exception_callback,
+                                  reconnect=fast_reconnect_policy(
+                                      max_attempts=2),
+                                  config_file_path=config_file)
+
+        with mock.patch('requests.get', get_exception):
+            client.connect()
+            client.worker.join(5)
+
+        self.assertFalse(client.connected())
+        # Two reported retries plus the final failure
+        self.assertEqual(exception_callback.call_count, 3)
+        self.assertEqual(client.worker.reconnect_count, 2)
+
+    def test_reconnect_http_error_status_exposed(self):
+        """ Non-200 responses surface as PowerTrackHTTPException with the status code. """
+        test_utils.generate_test_config_file()
+
+        exception_callback = mock.Mock()
+        client = PowerTrackClient(_dummy_callback, exception_callback,
+                                  reconnect=fast_reconnect_policy(
+                                      max_attempts=0),
+                                  config_file_path=config_file)
+
+        with mock.patch('requests.get', return_value=
+                        test_utils.stream_response([], status_code=503)):
+            client.connect()
+            client.worker.join(5)
+
+        actual_ex = exception_callback.call_args[0][0][1]
+        self.assertIsInstance(actual_ex, PowerTrackHTTPException)
+        self.assertEqual(actual_ex.status_code, 503)
+
+    def test_reconnect_policy_backoff_by_error_kind(self):
+        """ Network, HTTP and rate limit errors use separate backoff schedules. """
+        policy = ReconnectPolicy(network_backoff=Backoff(1, 4, jitter=0),
+                                 http_backoff=Backoff(5, 320, jitter=0),
+                                 rate_limit_backoff=Backoff(60, 960, jitter=0))
+        self.assertEqual(policy.delay(0), 1)
+        self.assertEqual(policy.delay(5), 4)
+        self.assertEqual(policy.delay(1, status_code=503), 10)
+        self.assertEqual(policy.delay(0, status_code=429), 60)
+
+    def test_backoff_jitter_stays_in_range(self):
+        backoff = Backoff(2, 8, jitter=0.5)
+        for attempt in range(6):
+            d = backoff.delay(attempt)
+            cap = min(8, 2 * 2 ** attempt)
+            self.assertTrue(cap * 0.5 <= d <= cap)
+
+    def test_reconnect_policy_backfill_minutes_is_clamped(self):
+        policy = ReconnectPolicy()
+        self.assertEqual(policy.backfill_minutes(0.5), 1)
+        self.assertEqual(policy.backfill_minutes(61), 2)
+        self.assertEqual(policy.backfill_minutes(3600), 5)
+
+    def test_stall_timeout_reports_stall_and_reconnects(self):
+        """ A read timeout after stall_timeout seconds of silence is reported as a stall. """
+        test_utils.generate_test_config_file()
+
+        def stalled_content(chunk_size):
+            yield b"one\r\n"
+            sleep(0.2)
+            raise requests.exceptions.ConnectionError("Read timed out.")
+
+        stalled = test_utils.stream_response([])
+        stalled.iter_content.side_effect = stalled_content
+
+        responses = [stalled, test_utils.stream_response([b"two\r\n"])]
+        received = []
+
+        def fake_get(url, **kwargs):
+            if not responses:
+                client.worker.stop()
+                return test_utils.stream_response([])
+            return responses.pop(0)
+
+        exception_callback = mock.Mock()
+        client = PowerTrackClient(received.append, exception_callback,
+                                  reconnect=fast_reconnect_policy(),
+                                  stall_timeout=0.1,
+                                  config_file_path=config_file)
+
+        with mock.patch('requests.get', side_effect=fake_get) as mocked_get:
+            client.connect()
+            client.worker.join(5)
+
+        self.assertEqual(received, [b"one", b"two"])
+        self.assertEqual(mocked_get.call_args[1]['timeout'], 0.1)
+        actual_ex = exception_callback.call_args_list[0][0][0][1]
+        self.assertIsInstance(actual_ex, StreamStalledException)
+        self.assertTrue(actual_ex.idle_seconds >= 0.1)
+
+    def test_gzip_stream_is_decompressed(self):
+        """ With gzip=True the raw compressed stream is decompressed and framed. """
+        test_utils.generate_test_config_file()
+
+        compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        compressed = compressor.compress(b"one\r\n\r\ntwo\r\n") + \
+            compressor.flush()
+
+        response = test_utils.stream_response([])
+        response.headers = {'Content-Encoding': 'gzip'}
+        response.raw.stream.return_value = iter(
+            [compressed[:5], compressed[5:]])
+
+        received = []
+        client = PowerTrackClient(received.append, gzip=True,
+                                  config_file_path=config_file)
+        with mock.patch('requests.get', return_value=response) as mocked_get:
+            client.connect()
+            client.worker.join(5)
+
+        self.assertEqual(received, [b"one", b"two"])
+        self.assertEqual(mocked_get.call_args[1]['headers'],
+                         {'Accept-Encoding': 'gzip'})
+        response.raw.stream.assert_called_with(client.chunk_size,
+                                               decode_content=False)
+        stats = client.stats()
+        self.assertEqual(stats['compressed_bytes'], len(compressed))
+        self.assertEqual(stats['bytes'], 12)
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from gnippy.errors import BadArgumentException
+from gnippy.ratelimit import TokenBucket
+
+
+class TokenBucketTestCase(unittest.TestCase):
+
+    def test_burst_then_rate(self):
+        bucket = TokenBucket(10, capacity=3)
+        now = 1000.0
+        bucket._updated = now
+        self.assertEqual([bucket.try_acquire(now=now) for i in range(3)],
+                         [0, 0, 0])
+        self.assertAlmostEqual(bucket.try_acquire(now=now), 0.1)
+        self.assertEqual(bucket.try_acquire(now=now + 0.1), 0)
+        # Never more than capacity, however long it was idle.
+        bucket.try_acquire(now=now + 60)
+        self.assertAlmostEqual(bucket._tokens, 2)
+
+    def test_acquire_blocks(self):
+        bucket = TokenBucket(50, capacity=1)
+        start = time.time()
+        for i in range(6):
+            bucket.acquire()
+        self.assertTrue(time.time() - start >= 0.09)
+
+    def test_shared_between_threads(self):
+        bucket = TokenBucket(100, capacity=1)
+        start = time.time()
+        threads = [threading.Thread(target=lambda: [bucket.acquire()
+                                                    for i in range(5)])
+                   for t in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertTrue(time.time() - start >= 0.18)
+
+    @unittest.skipIf(os.name != "posix", "lock_path needs fcntl")
+    def test_shared_between_instances_through_a_file(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            a = TokenBucket(10, capacity=2, lock_path=path)
+            b = TokenBucket(10, capacity=2, lock_path=path)
+            now = time.time()
+            self.assertEqual(a.try_acquire(now=now), 0)
+            self.assertEqual(b.try_acquire(now=now), 0)
+            self.assertTrue(a.try_acquire(now=now) > 0)
+            self.assertTrue(b.try_acquire(now=now) > 0)
+        finally:
+            os.remove(path)
+
+    def test_bad_rate(self):
+        self.assertRaises(BadArgumentException, TokenBucket, 0)
+        self.assertRaises(BadArgumentException, TokenBucket, 1, capacity=0.5)
+
+    def test_fractional_rate(self):
+        """ Below one request a second the bucket still holds one token. """
+        bucket = TokenBucket(0.5)
+        now = bucket._updated
+        self.assertEqual(bucket.capacity, 1)
+        self.assertEqual(bucket.try_acquire(now=now), 0)
+        self.assertEqual(bucket.try_acquire(now=now), 2)
+        self.assertEqual(bucket.try_acquire(now=now + 2), 0)
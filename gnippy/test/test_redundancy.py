@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import mock
+
+from gnippy.redundancy import Deduplicator, RedundantPowerTrackClient, \
+    RotatingIdSet
+from gnippy.test import test_utils
+
+
+class RotatingIdSetTestCase(unittest.TestCase):
+
+    def test_add(self):
+        seen = RotatingIdSet(window=10)
+        self.assertTrue(seen.add("a", now=1))
+        self.assertFalse(seen.add("a", now=2))
+
+    def test_ids_expire_after_two_windows(self):
+        seen = RotatingIdSet(window=10)
+        seen.add("a", now=100)
+        # Rotated into the previous generation, still remembered
+        self.assertFalse(seen.add("a", now=111))
+        seen.add("b", now=122)
+        self.assertTrue(seen.add("a", now=123))
+
+    def test_size_is_bounded(self):
+        seen = RotatingIdSet(window=1000, max_ids=10)
+        for i in range(100):
+            seen.add(i, now=1)
+        self.assertTrue(len(seen) <= 10)
+
+
+class DeduplicatorTestCase(unittest.TestCase):
+
+    def test_duplicates_are_dropped(self):
+        received = []
+        dedupe = Deduplicator(received.append, RotatingIdSet())
+        for line in (b'{"id":1}', b'{"id":2}', b'{"id":1}', b'{"info":{}}',
+                     b'{"info":{}}'):
+            dedupe(line)
+        self.assertEqual(received, [b'{"id":1}', b'{"id":2}', b'{"info":{}}',
+                                    b'{"info":{}}'])
+        self.assertEqual(dedupe.duplicates, 1)
+
+
+class RedundantPowerTrackClientTestCase(unittest.TestCase):
+
+    def setUp(self):
+        test_utils.generate_test_config_file()
+
+    def tearDown(self):
+        test_utils.delete_test_config()
+
+    def test_two_connections_merge_into_one_feed(self):
+        """ Each connection sees a different subset; the callback sees everything once. """
+        feeds = {
+            "http://a/stream.json": b'{"id":1}\r\n{"id":2}\r\n{"id":4}\r\n',
+            "http://b/stream.json": b'{"id":1}\r\n{"id":3}\r\n{"id":4}\r\n',
+        }
+
+        def fake_get(url, **kwargs):
+            return test_utils.stream_response([feeds[url]])
+
+        received = []
+        client = RedundantPowerTrackClient(
+            received.append, reconnect=False,
+            urls=sorted(feeds), config_file_path=test_utils.test_config_path)
+        with mock.patch('requests.get', side_effect=fake_get):
+            client.connect()
+            for worker in client.workers:
+                worker.join(5)
+            self.assertFalse(client.connected())
+            client.disconnect()
+
+        self.assertEqual(sorted(received), [b'{"id":1}', b'{"id":2}',
+                                            b'{"id":3}', b'{"id":4}'])
+        stats = client.stats()
+        self.assertEqual(stats['duplicates'], 2)
+        self.assertEqual(stats['activities'], 6)
+        self.assertEqual(stats['connections'], 2)
+
+    def test_default_connections_use_the_configured_url(self):
+        client = RedundantPowerTrackClient(
+            None, connections=3, config_file_path=test_utils.test_config_path)
+        self.assertEqual(client.urls, [test_utils.test_powertrack_url] * 3)
+        self.assertTrue(client.reconnect)
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import mock
+
+from gnippy import PowerTrackClient
+from gnippy.dispatch import ActivityQueue
+from gnippy.errors import BadArgumentException
+from gnippy.routing import Router
+from gnippy.test import test_utils
+
+
+def activity(*rules):
+    matching = ",".join('{"tag":"%s","value":"%s"}' % rule for rule in rules)
+    return ('{"id":"1","gnip":{"matching_rules":[%s]}}' % matching).encode()
+
+
+sports = activity(("sports", "football"))
+news = activity(("news", "election"))
+both = activity(("sports", "football"), ("news", "election"))
+other = activity(("other", "cats"))
+
+
+class RouterTestCase(unittest.TestCase):
+
+    def test_routes_by_tag(self):
+        a, b, rest = [], [], []
+        router = Router({"sports": a.append, "news": b.append},
+                        default=rest.append)
+        for line in (sports, news, both, other):
+            router(line)
+        self.assertEqual(a, [sports, both])
+        self.assertEqual(b, [news, both])
+        self.assertEqual(rest, [other])
+        self.assertEqual(router.routed, {"sports": 2, "news": 2})
+        self.assertEqual(router.unrouted, 1)
+
+    def test_routes_by_value(self):
+        a = []
+        router = Router({"election": a.append}, by="value")
+        for line in (sports, news, other):
+            router(line)
+        self.assertEqual(a, [news])
+
+    def test_shared_sink_gets_activity_once(self):
+        a = []
+        router = Router({"sports": a.append, "news": a.append})
+        router(both)
+        self.assertEqual(a, [both])
+
+    def test_queues(self):
+        q = ActivityQueue(10)
+        router = Router({"news": q})
+        router(news)
+        self.assertEqual(q.get(), news)
+
+    def test_bad_arguments(self):
+        self.assertRaises(BadArgumentException, Router, {}, by="id")
+
+
+class PowerTrackClientRoutingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        test_utils.generate_test_config_file()
+
+    def tearDown(self):
+        test_utils.delete_test_config()
+
+    def test_routes_decoded_activities(self):
+        response = test_utils.stream_response([sports + b"\r\n", other + b"\r\n"])
+
+        routed, rest = [], []
+        client = PowerTrackClient(rest.append, decode=True,
+                                  routes={"sports": routed.append},
+                                  config_file_path=test_utils.test_config_path)
+        with mock.patch('requests.get', return_value=response):
+            client.connect()
+            client.worker.join(5)
+            client.disconnect()
+
+        self.assertEqual([a["gnip"]["matching_rules"][0]["tag"]
+                          for a in routed], ["sports"])
+        self.assertEqual(len(rest), 1)
+        self.assertEqual(client.stats()["routed"], {"sports": 1})
+        self.assertEqual(client.stats()["unrouted"], 1)
+
+    def test_routes_and_batch_callback(self):
+        self.assertRaises(BadArgumentException, PowerTrackClient, None,
+                          batch_callback=list, routes={"a": list},
+                          config_file_path=test_utils.test_config_path)
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import time
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import mock
+
+from gnippy import rules
+from gnippy.errors import RuleAddFailedException
+from gnippy.rulecache import RuleCache
+
+
+current = [
+    {"value": "coffee", "tag": "drinks", "id": 1},
+    {"value": "tea", "tag": "drinks", "id": 2},
+    {"value": "python", "id": 3},
+]
+
+
+def make_client():
+    client = mock.Mock()
+    client.get_rules.side_effect = lambda: [dict(r) for r in current]
+    return client
+
+
+def report(succeeded):
+    r = rules.RulesReport()
+    r.succeeded.extend(succeeded)
+    return r
+
+
+class RuleCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "rules.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_lookups(self):
+        cache = RuleCache(make_client())
+        self.assertEqual(len(cache), 3)
+        self.assertEqual(cache.by_value("tea")["id"], 2)
+        self.assertEqual([r["value"] for r in cache.by_tag("drinks")],
+                         ["coffee", "tea"])
+        self.assertEqual(cache.by_id(3)["value"], "python")
+        self.assertTrue("coffee" in cache)
+        self.assertFalse("cocoa" in cache)
+
+    def test_ttl(self):
+        client = make_client()
+        cache = RuleCache(client, ttl=60)
+        cache.rules()
+        cache.rules()
+        self.assertEqual(client.get_rules.call_count, 1)
+        cache.fetched_at -= 61
+        cache.rules()
+        self.assertEqual(client.get_rules.call_count, 2)
+
+    def test_write_through(self):
+        client = make_client()
+        cache = RuleCache(client)
+        cache.rules()
+        client.add_rules.return_value = report([rules.build("cocoa", "drinks")])
+        cache.add_rules([rules.build("cocoa", "drinks")])
+        client.delete_rules.return_value = report([{"value": "coffee"}])
+        cache.delete_rules([{"value": "coffee"}])
+
+        self.assertEqual(client.get_rules.call_count, 1)
+        self.assertEqual([r["value"] for r in cache.by_tag("drinks")],
+                         ["tea", "cocoa"])
+        self.assertEqual(cache.by_value("coffee"), None)
+        self.assertEqual(cache.by_id(1), None)
+
+    def test_large_write_through(self):
+        """ Deleting rules doesn't scan the whole cache for each one. """
+        big = [{"value": "rule%d" % i, "tag": "t%d" % (i % 3), "id": i}
+               for i in range(50000)]
+        client = mock.Mock()
+        client.get_rules.return_value = big
+        cache = RuleCache(client)
+        cache.rules()
+        deleted = big[::5]
+        client.delete_rules.return_value = report(deleted)
+        start = time.time()
+        cache.delete_rules(deleted)
+        self.assertTrue(time.time() - start < 2)
+        self.assertEqual(len(cache), 40000)
+        self.assertEqual(cache.rules()[:2], [big[1], big[2]])
+        self.assertEqual(len(cache.by_tag("t0")), 13333)
+
+    def test_partial_failure_writes_through_successes(self):
+        client = make_client()
+        cache = RuleCache(client)
+        cache.rules()
+        partial = report([rules.build("cocoa")])
+        partial.failed.append((rules.build("juice"), "HTTP 500"))
+        client.add_rules.side_effect = RuleAddFailedException("1 of 2",
+                                                              partial)
+        self.assertRaises(RuleAddFailedException, cache.add_rules,
+                          [rules.build("cocoa"), rules.build("juice")])
+        self.assertTrue("cocoa" in cache)
+        self.assertFalse("juice" in cache)
+
+    def test_persisted_across_restarts(self):
+        client = make_client()
+        cache = RuleCache(client, path=self.path)
+        cache.rules()
+        client.add_rules.return_value = report([rules.build("cocoa")])
+        cache.add_rules([rules.build("cocoa")])
+
+        restarted_client = make_client()
+        restarted = RuleCache(restarted_client, path=self.path)
+        self.assertEqual(len(restarted), 4)
+        self.assertEqual(restarted_client.get_rules.call_count, 0)
+        self.assertEqual(restarted.by_id(2)["value"], "tea")
+
+        # Expiry is based on when the rules were fetched, not loaded.
+        expired = RuleCache(make_client(), ttl=0, path=self.path)
+        self.assertEqual(len(expired), 3)
@@ -1,5 +1,9 @@
 # -*- coding: utf-8 -*-
 
+import json
+import threading
+import time
+
 try:
     import unittest2 as unittest
 except ImportError:
@@ -9,48 +13,49 @@ import mock
 
 from gnippy import rules
 from gnippy.errors import *
+from gnippy.backoff import Backoff
 from gnippy.test import test_utils
 
 
-# Mocks
-def bad_post(url, auth, data):
+# Mocks, patched onto requests.Session
+def bad_post(session, url, auth, data):
     return test_utils.BadResponse()
 
 
-def good_post(url, auth, data):
+def good_post(session, url, auth, data):
     return test_utils.GoodResponse()
 
 
-def bad_get(url, auth):
+def bad_get(session, url, auth):
     return test_utils.BadResponse()
 
 
-def get_exception(url, auth):
+def get_exception(session, url, auth):
     raise Exception("This is a test exception")
 
 
-def get_json_exception(url, auth):
+def get_json_exception(session, url, auth):
     return test_utils.GoodResponseJsonError()
 
 
-def good_get_no_rules_field(url, auth):
+def good_get_no_rules_field(session, url, auth):
     return test_utils.GoodResponse(json={"hello": "world"})
 
 
-def good_get_no_rules(url, auth):
+def good_get_no_rules(session, url, auth):
     return test_utils.GoodResponse(json={"rules": []})
 
 
-def good_get_one_rule(url, auth):
+def good_get_one_rule(session, url, auth):
     return test_utils.GoodResponse(
         json={"rules": [{"value": "Hello", "tag": "mytag"}]})
 
 
-def bad_delete(url, auth, data):
+def bad_delete(session, url, auth, data):
     return test_utils.BadResponse()
 
 
-def good_delete(url, auth, data):
+def good_delete(session, url, auth, data):
     return test_utils.GoodResponse()
 
 
@@ -66,6 +71,10 @@ class RulesTestCase(unittest.TestCase):
 
     def setUp(self):
         test_utils.generate_test_config_file()
+        # BadResponse is a 500, which is retried: don't wait in between.
+        sleep = mock.patch('time.sleep')
+        sleep.start()
+        self.addCleanup(sleep.stop)
 
     def tearDown(self):
         test_utils.delete_test_config()
@@ -151,7 +160,7 @@ class RulesTestCase(unittest.TestCase):
         rules._check_rules_list([r])
 
     @mock.patch('os.path.isfile', test_utils.os_file_exists_false)
-    @mock.patch('requests.post', good_post)
+    @mock.patch('requests.Session.post', good_post)
     def test_add_one_rule_no_creds(self):
         """ Make sure adding rule without credentials fail. """
         try:
@@ -161,13 +170,13 @@ class RulesTestCase(unittest.TestCase):
         self.fail(
             "Rule Add was supposed to fail and throw a ConfigFileNotFoundException")
 
-    @mock.patch('requests.post', good_post)
+    @mock.patch('requests.Session.post', good_post)
     def test_add_one_rule_ok(self):
         """Add one rule with config. """
         rules.add_rule(self.rule_string, self.tag,
                        config_file_path=test_utils.test_config_path)
 
-    @mock.patch('requests.post', bad_post)
+    @mock.patch('requests.Session.post', bad_post)
     def test_add_one_rule_not_ok(self):
         """Add one rule with exception thrown. """
         try:
@@ -178,7 +187,7 @@ class RulesTestCase(unittest.TestCase):
         self.fail("Rule Add was supposed to fail and throw a RuleAddException")
 
     @mock.patch('os.path.isfile', test_utils.os_file_exists_false)
-    @mock.patch('requests.post', good_post)
+    @mock.patch('requests.Session.post', good_post)
     def test_add_many_rules_no_creds(self):
         """ Make sure adding rules with non-existent config fails. """
         try:
@@ -188,14 +197,14 @@ class RulesTestCase(unittest.TestCase):
         self.fail(
             "Rule Add was supposed to fail and throw a ConfigFileNotFoundException")
 
-    @mock.patch('requests.post', good_post)
+    @mock.patch('requests.Session.post', good_post)
     def test_add_many_rules_ok(self):
         """ Add many rules. """
         rules_list = self._generate_rules_list()
         rules.add_rules(rules_list,
                         config_file_path=test_utils.test_config_path)
 
-    @mock.patch('requests.post', bad_post)
+    @mock.patch('requests.Session.post', bad_post)
     def test_add_many_rules_not_ok(self):
         """ Add many rules with exception thrown. """
         try:
@@ -206,7 +215,7 @@ class RulesTestCase(unittest.TestCase):
             return
         self.fail("Rule Add was supposed to fail and throw a RuleAddException")
 
-    @mock.patch('requests.get', get_exception)
+    @mock.patch('requests.Session.get', get_exception)
     def test_get_rules_requests_get_exception(self):
         """ Get rules with exception thrown. """
         try:
@@ -215,7 +224,7 @@ class RulesTestCase(unittest.TestCase):
             return
         self.fail("rules.get() was supposed to throw a RulesGetFailedException")
 
-    @mock.patch('requests.get', bad_get)
+    @mock.patch('requests.Session.get', bad_get)
     def test_get_rules_bad_status_code(self):
         """ Get rules with error response. """
         try:
@@ -225,7 +234,7 @@ class RulesTestCase(unittest.TestCase):
             return
         self.fail("rules.get() was supposed to throw a RulesGetFailedException")
 
-    @mock.patch('requests.get', get_json_exception)
+    @mock.patch('requests.Session.get', get_json_exception)
     def test_get_rules_bad_json(self):
         """ Get rules with bad json response. """
         try:
@@ -235,7 +244,7 @@ class RulesTestCase(unittest.TestCase):
             return
         self.fail("rules.get() was supposed to throw a RulesGetFailedException")
 
-    @mock.patch('requests.get', good_get_no_rules_field)
+    @mock.patch('requests.Session.get', good_get_no_rules_field)
     def test_get_rules_no_rules_field_json(self):
         """ Get rules with invalid response. """
         try:
@@ -246,25 +255,25 @@ class RulesTestCase(unittest.TestCase):
             return
         self.fail("rules.get() was supposed to throw a RulesGetFailedException")
 
-    @mock.patch('requests.get', good_get_no_rules)
+    @mock.patch('requests.Session.get', good_get_no_rules)
     def test_get_rules_success_no_rules(self):
         """ Get rules with empty response. """
         r = rules.get_rules(config_file_path=test_utils.test_config_path)
         self.assertEqual(0, len(r))
 
-    @mock.patch('requests.get', good_get_one_rule)
+    @mock.patch('requests.Session.get', good_get_one_rule)
     def test_get_rules_success_one_rule(self):
         """ Get one rule. """
         r = rules.get_rules(config_file_path=test_utils.test_config_path)
         self.assertEqual(1, len(r))
 
-    @mock.patch('requests.post', good_delete)
+    @mock.patch('requests.Session.post', good_delete)
     def test_delete_rules_single(self):
         """ Delete one rule. """
         rules.delete_rule({"value": "Hello World"},
                           config_file_path=test_utils.test_config_path)
 
-    @mock.patch('requests.post', good_delete)
+    @mock.patch('requests.Session.post', good_delete)
     def test_delete_rules_multiple(self):
         """ Delete multiple rules. """
         rules_list = [
@@ -273,3 +282,381 @@ class RulesTestCase(unittest.TestCase):
         ]
         rules.delete_rules(rules_list,
                            config_file_path=test_utils.test_config_path)
+
+
+class RulesClientTestCase(unittest.TestCase):
+
+    def setUp(self):
+        test_utils.generate_test_config_file()
+
+    def tearDown(self):
+        test_utils.delete_test_config()
+
+    def test_resolves_config_once(self):
+        """ The config is read when the client is created, not per call. """
+        client = rules.RulesClient(
+            config_file_path=test_utils.test_config_path)
+        self.assertEqual(client.rules_url, test_utils.test_rules_url)
+        test_utils.delete_test_config()
+        with mock.patch('requests.Session.get', good_get_one_rule):
+            self.assertEqual(len(client.get_rules()), 1)
+
+    def test_session_is_pooled_with_retries(self):
+        """ Both schemes share one adapter with keep-alive and retries. """
+        client = rules.RulesClient(pool_size=4, retries=5,
+                                   config_file_path=test_utils.test_config_path)
+        adapter = client.session.get_adapter(test_utils.test_rules_url)
+        self.assertEqual(adapter._pool_maxsize, 4)
+        self.assertEqual(adapter.max_retries.total, 5)
+        self.assertIs(client.session.get_adapter("http://example.com"),
+                      adapter)
+
+    def test_uses_its_session(self):
+        """ Requests go through the client's own session. """
+        session = mock.Mock()
+        session.post.return_value = test_utils.GoodResponse()
+        client = rules.RulesClient(session=session,
+                                   config_file_path=test_utils.test_config_path)
+        client.add_rule("Hello", "mytag")
+        client.delete_rules([{"value": "Hello"}])
+        self.assertEqual(session.post.call_count, 2)
+        self.assertTrue(
+            session.post.call_args[0][0].endswith("?_method=delete"))
+
+    def test_module_functions_share_a_client(self):
+        """ Module level calls with the same config reuse one client. """
+        kwargs = {"config_file_path": test_utils.test_config_path}
+        self.assertIs(rules._client(dict(kwargs)), rules._client(kwargs))
+
+    def test_missing_rules_url(self):
+        """ A client can't be created without a rules_url. """
+        self.assertRaises(IncompleteConfigurationException, rules.RulesClient,
+                          url=test_utils.test_powertrack_url,
+                          auth=("user", "pass"))
+
+
+class BulkRulesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        test_utils.generate_test_config_file()
+
+    def tearDown(self):
+        test_utils.delete_test_config()
+
+    def _client(self, session, **kwargs):
+        return rules.RulesClient(session=session,
+                                 config_file_path=test_utils.test_config_path,
+                                 **kwargs)
+
+    def test_chunk_by_count(self):
+        """ No chunk holds more than max_rules rules. """
+        rules_list = [rules.build("rule %d" % i) for i in range(7)]
+        chunks = list(rules.chunk_rules(rules_list, max_rules=3))
+        self.assertEqual([len(c) for c in chunks], [3, 3, 1])
+        self.assertEqual(sum(chunks, []), rules_list)
+
+    def test_chunk_by_size(self):
+        """ No chunk's POST data is longer than max_bytes. """
+        rules_list = [rules.build("x" * 100) for i in range(10)]
+        for chunk in rules.chunk_rules(rules_list, max_bytes=500):
+            data = json.dumps(rules._generate_post_object(chunk))
+            self.assertTrue(len(data) <= 500)
+        self.assertEqual(len(list(rules.chunk_rules(rules_list,
+                                                    max_bytes=500))), 3)
+
+    def test_oversized_rule_gets_own_chunk(self):
+        rules_list = [rules.build("a"), rules.build("x" * 1000),
+                      rules.build("b")]
+        chunks = list(rules.chunk_rules(rules_list, max_bytes=100))
+        self.assertEqual([len(c) for c in chunks], [1, 1, 1])
+
+    def test_report(self):
+        """ Duplicates in the list and in GNIP's detail are reported. """
+        session = mock.Mock()
+        session.post.return_value = test_utils.GoodResponse(json={
+            "detail": [
+                {"rule": {"value": "b"}, "created": False,
+                 "message": "Rule already exists"},
+                {"rule": {"value": "c"}, "created": False,
+                 "message": "Rule too long"},
+            ]})
+        client = self._client(session)
+        rules_list = [rules.build(v) for v in ("a", "b", "c", "a")]
+        try:
+            client.add_rules(rules_list)
+        except RuleAddFailedException as e:
+            report = e.report
+        else:
+            self.fail("add_rules was supposed to throw a RuleAddException")
+        self.assertEqual(report.succeeded, [{"value": "a"}])
+        self.assertEqual(report.duplicates, [{"value": "a"}, {"value": "b"}])
+        self.assertEqual(report.failed, [({"value": "c"}, "Rule too long")])
+
+    def test_partial_failure(self):
+        """ Only the rules in chunks that failed are reported as failed. """
+        session = mock.Mock()
+        session.post.side_effect = [test_utils.GoodResponse(),
+                                    test_utils.BadResponse()]
+        client = self._client(session, max_rules_per_request=2,
+                              parallelism=1, http_retries=0)
+        rules_list = [rules.build(v) for v in ("a", "b", "c")]
+        try:
+            client.delete_rules(rules_list)
+        except RuleDeleteFailedException as e:
+            self.assertEqual(e.report.succeeded, rules_list[:2])
+            self.assertEqual([r for r, reason in e.report.failed],
+                             rules_list[2:])
+            self.assertTrue("HTTP Response Code: 500" in str(e))
+            return
+        self.fail("delete_rules was supposed to throw a "
+                  "RuleDeleteFailedException")
+
+    def test_parallel_submission(self):
+        """ Chunks are sent concurrently, at most parallelism at a time. """
+        lock = threading.Lock()
+        state = {"running": 0, "peak": 0}
+
+        def post(url, auth, data):
+            with lock:
+                state["running"] += 1
+                state["peak"] = max(state["peak"], state["running"])
+            time.sleep(0.02)
+            with lock:
+                state["running"] -= 1
+            return test_utils.GoodResponse()
+
+        session = mock.Mock()
+        session.post.side_effect = post
+        client = self._client(session, max_rules_per_request=1,
+                              parallelism=3)
+        report = client.add_rules([rules.build(str(i)) for i in range(9)])
+        self.assertEqual(len(report.succeeded), 9)
+        self.assertEqual(session.post.call_count, 9)
+        self.assertEqual(state["peak"], 3)
+
+    def test_rate_limit(self):
+        """ requests_per_second spaces out the requests. """
+        session = mock.Mock()
+        session.post.return_value = test_utils.GoodResponse()
+        client = self._client(session, max_rules_per_request=1,
+                              requests_per_second=50)
+        start = time.time()
+        client.add_rules([rules.build(str(i)) for i in range(6)])
+        self.assertTrue(time.time() - start >= 0.09)
+
+
+class SyncTestCase(unittest.TestCase):
+    current = [
+        {"value": "keep", "tag": "a", "id": 1},
+        {"value": "retag", "tag": "old", "id": 2},
+        {"value": "gone", "id": 3},
+    ]
+    desired = [
+        rules.build("keep", "a"),
+        rules.build("retag", "new"),
+        rules.build("new"),
+        rules.build("new"),
+    ]
+
+    def setUp(self):
+        test_utils.generate_test_config_file()
+
+    def tearDown(self):
+        test_utils.delete_test_config()
+
+    def _client(self):
+        session = mock.Mock()
+        session.get.return_value = test_utils.GoodResponse(
+            json={"rules": self.current})
+        session.post.return_value = test_utils.GoodResponse()
+        return rules.RulesClient(session=session,
+                                 config_file_path=test_utils.test_config_path)
+
+    def test_diff(self):
+        diff = rules.RulesDiff(self.current, self.desired)
+        self.assertEqual(diff.to_add, [{"value": "retag", "tag": "new"},
+                                       {"value": "new"}])
+        self.assertEqual([r["id"] for r in diff.to_delete], [2, 3])
+        self.assertEqual([r["id"] for r in diff.unchanged], [1])
+        self.assertEqual(str(diff).split("\n"),
+                         ["- retag [old]", "- gone", "+ retag [new]", "+ new"])
+
+    def test_no_changes(self):
+        diff = rules.RulesDiff(self.current, self.current)
+        self.assertFalse(diff)
+
+    def test_dry_run(self):
+        client = self._client()
+        diff = client.sync(self.desired, dry_run=True)
+        self.assertTrue(diff)
+        self.assertEqual(client.session.get.call_count, 1)
+        self.assertEqual(client.session.post.call_count, 0)
+
+    def test_sync_deletes_then_adds(self):
+        client = self._client()
+        diff = client.sync(self.desired)
+        urls = [c[0][0] for c in client.session.post.call_args_list]
+        self.assertTrue(urls[0].endswith("_method=delete"))
+        self.assertFalse(urls[1].endswith("_method=delete"))
+        posted = [json.loads(c[1]["data"])["rules"]
+                  for c in client.session.post.call_args_list]
+        self.assertEqual(posted, [diff.to_delete, diff.to_add])
+        self.assertEqual(len(diff.add_report.succeeded), 2)
+        self.assertEqual(len(diff.delete_report.succeeded), 2)
+
+    def test_invalid_rule_changes_nothing(self):
+        """ A desired rule that fails validation stops sync before any
+            rule is fetched or deleted. """
+        client = self._client()
+        desired = self.desired + [rules.build("(unbalanced", "t")]
+        self.assertRaises(RuleSyntaxException, client.sync, desired)
+        self.assertEqual(client.session.get.call_count, 0)
+        self.assertEqual(client.session.post.call_count, 0)
+
+
+class IterRulesTestCase(unittest.TestCase):
+    rules_list = [{"value": u"café \"au lait\"", "tag": "[drinks]"},
+                  {"value": "tea", "id": 2}]
+
+    def setUp(self):
+        test_utils.generate_test_config_file()
+
+    def tearDown(self):
+        test_utils.delete_test_config()
+
+    def _response(self, body, status_code=200, chunk=5):
+        return test_utils.stream_response(
+            [body[i:i + chunk] for i in range(0, len(body), chunk)],
+            status_code)
+
+    def _iter(self, response):
+        session = mock.Mock()
+        session.get.return_value = response
+        client = rules.RulesClient(session=session, http_retries=0,
+                                   config_file_path=test_utils.test_config_path)
+        return list(client.iter_rules())
+
+    def test_split_across_chunks(self):
+        """ Rules split anywhere across chunks are parsed. """
+        body = json.dumps({"sent": "now", "rules": self.rules_list})
+        body = body.encode("utf-8")
+        for chunk in (1, 2, 7, 1000):
+            self.assertEqual(self._iter(self._response(body, chunk=chunk)),
+                             self.rules_list)
+
+    def test_rules_are_yielded_as_they_arrive(self):
+        """ The first rule is available before the response has ended. """
+        def chunks(chunk_size):
+            yield b'{"rules": [{"value": "a"}, '
+            raise AssertionError("read too far")
+
+        response = mock.MagicMock(status_code=200)
+        response.iter_content.side_effect = chunks
+        session = mock.Mock()
+        session.get.return_value = response
+        client = rules.RulesClient(session=session,
+                                   config_file_path=test_utils.test_config_path)
+        self.assertEqual(next(client.iter_rules()), {"value": "a"})
+
+    def test_empty(self):
+        self.assertEqual(self._iter(self._response(b'{"rules": []}')), [])
+
+    def test_failures(self):
+        for response, reason in (
+                (self._response(b"", status_code=500), "HTTP Status Code"),
+                (self._response(b'{"rules": [{"value": "a"}, {"val'),
+                 "malformed JSON"),
+                (self._response(b'{"hello": "world"}'),
+                 "did not return a rules object")):
+            try:
+                self._iter(response)
+            except RulesGetFailedException as e:
+                self.assertTrue(reason in str(e))
+            else:
+                self.fail("iter_rules was supposed to throw a "
+                          "RulesGetFailedException")
+            response.close.assert_called_once_with()
+
+    def test_module_function(self):
+        body = json.dumps({"rules": self.rules_list}).encode("utf-8")
+        response = self._response(body)
+        with mock.patch('requests.Session.get', return_value=response):
+            self.assertEqual(
+                list(rules.iter_rules(
+                    config_file_path=test_utils.test_config_path)),
+                self.rules_list)
+
+
+class RetryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        test_utils.generate_test_config_file()
+
+    def tearDown(self):
+        test_utils.delete_test_config()
+        rules.set_rate_limit(None)
+
+    def _client(self, responses, **kwargs):
+        session = mock.Mock()
+        session.post.side_effect = responses
+        session.get.side_effect = responses
+        return rules.RulesClient(session=session,
+                                 config_file_path=test_utils.test_config_path,
+                                 **kwargs)
+
+    def _response(self, status_code, retry_after=None, json=None):
+        r = test_utils.GoodResponse(response_code=status_code, json=json)
+        r.headers = {"Retry-After": retry_after} if retry_after else {}
+        return r
+
+    @mock.patch('time.sleep')
+    def test_retries_honour_retry_after(self, sleep):
+        client = self._client([self._response(429, "7"),
+                               self._response(503),
+                               self._response(201)],
+                              retry_backoff=Backoff(2, 2, jitter=0))
+        report = client.add_rules([rules.build("a")])
+        self.assertEqual(len(report.succeeded), 1)
+        self.assertEqual(client.session.post.call_count, 3)
+        self.assertEqual([c[0][0] for c in sleep.call_args_list], [7.0, 2])
+
+    @mock.patch('time.sleep')
+    def test_get_rules_retries(self, sleep):
+        client = self._client([self._response(502),
+                               self._response(200, json={"rules": []})])
+        self.assertEqual(client.get_rules(), [])
+
+    @mock.patch('time.sleep')
+    def test_gives_up(self, sleep):
+        client = self._client([self._response(429)] * 3, http_retries=2)
+        self.assertRaises(RuleAddFailedException, client.add_rules,
+                          [rules.build("a")])
+        self.assertEqual(client.session.post.call_count, 3)
+
+    @mock.patch('time.sleep')
+    def test_retries_500_and_caps_retry_after(self, sleep):
+        client = self._client([self._response(500, "86400"),
+                               self._response(201)], max_retry_after=30)
+        client.add_rules([rules.build("a")])
+        self.assertEqual(client.session.post.call_count, 2)
+        self.assertEqual([c[0][0] for c in sleep.call_args_list], [30])
+
+    def test_no_retry_on_other_errors(self):
+        client = self._client([self._response(400)])
+        self.assertRaises(RuleAddFailedException, client.add_rules,
+                          [rules.build("a")])
+        self.assertEqual(client.session.post.call_count, 1)
+
+    def test_retry_after_date(self):
+        r = self._response(429, "Wed, 21 Oct 2015 07:28:00 GMT")
+        self.assertEqual(rules.retry_after(r), 0)
+        self.assertEqual(rules.retry_after(self._response(429)), None)
+
+    def test_shared_rate_limit(self):
+        limiter = rules.set_rate_limit(100)
+        client = self._client([self._response(201)])
+        self.assertIs(client.rate_limiter, limiter)
+        own = self._client([], requests_per_second=5)
+        self.assertIsNot(own.rate_limiter, limiter)
+        client.add_rules([rules.build("a")])
+        self.assertTrue(limiter._tokens < 100)
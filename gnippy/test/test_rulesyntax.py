@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import warnings
+
+import mock
+
+from gnippy import rules
+from gnippy.errors import RulesListFormatException, RuleSyntaxException, \
+    RuleSyntaxWarning
+from gnippy.rulesyntax import check, normalize, parse, RuleSyntaxError, \
+    tokenize, validate, validate_rules
+from gnippy.test import test_utils
+
+
+class TokenizeTestCase(unittest.TestCase):
+
+    def test_tokens(self):
+        kinds = [t[0] for t in tokenize('-(a OR "b c") from:x')]
+        self.assertEqual(kinds, ["-", "(", "term", "OR", "phrase", ")",
+                                 "term"])
+
+    def test_operator_values_stay_together(self):
+        texts = [t[1] for t in tokenize(
+            'bio:"a b" point_radius:[-105.27 40.01 16mi] c')]
+        self.assertEqual(texts, ['bio:"a b"',
+                                 'point_radius:[-105.27 40.01 16mi]', 'c'])
+
+    def test_escaped_quote(self):
+        self.assertEqual(tokenize(r'"say \"hi\""')[0][1], r'"say \"hi\""')
+
+
+class ParseTestCase(unittest.TestCase):
+
+    def test_precedence(self):
+        """ Adjacent clauses bind tighter than OR. """
+        self.assertEqual(parse("a b OR c"),
+                         ("or", [("and", [("term", "a"), ("term", "b")]),
+                                 ("term", "c")]))
+
+    def test_lower_case_or_is_a_keyword(self):
+        self.assertEqual(parse("a or b")[0], "and")
+
+    def test_errors(self):
+        for value in ("(a OR b", "a)", "a OR", "OR a", "()", '"abc',
+                      "a -", "", "point_radius:[1 2"):
+            self.assertRaises(RuleSyntaxError, parse, value)
+
+
+class ValidateTestCase(unittest.TestCase):
+
+    def test_valid(self):
+        for value in ('(Hello OR World OR "this is a test") lang:en',
+                      "coffee -is:retweet has:links sample:10",
+                      "http://example.com", "#python OR @gnip",
+                      "-(tea OR cocoa) coffee"):
+            self.assertEqual(validate(value), [], value)
+
+    def test_operators(self):
+        for value in ("tweets_count:1000", "following_count:500",
+                      "profile_region_contains:york", u"東京:foo"):
+            self.assertEqual(check(value), ([], []), value)
+        self.assertEqual(len(validate("a sample:101")), 1)
+        self.assertEqual(len(validate("a lang:")), 1)
+
+    def test_unknown_operators_are_warnings(self):
+        self.assertEqual(check("wat:x a"),
+                         ([], ["Unknown operator wat: at position 0"]))
+        self.assertEqual(check("has:wat"),
+                         ([], ["Unknown has: value wat at position 0"]))
+
+    def test_limits(self):
+        self.assertEqual(validate("-a -b"), ["Rule has no positive clauses"])
+        self.assertEqual(len(validate(" ".join(["a"] * 31))), 1)
+        self.assertEqual(len(validate("x" * 2049)), 1)
+        self.assertEqual(validate("a b c", max_positive=2),
+                         ["Rule has 3 positive clauses, the limit is 2"])
+
+    def test_normalize(self):
+        self.assertEqual(normalize("  a   ((b OR c))  -( d )"),
+                         "a (b OR c) -d")
+
+    def test_validate_rules(self):
+        good, bad = rules.build("a"), rules.build("(a")
+        self.assertEqual(validate_rules([good, bad]),
+                         [(bad, ["Unbalanced ( at position 0"])])
+
+
+class AddRulesValidationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        test_utils.generate_test_config_file()
+
+    def tearDown(self):
+        test_utils.delete_test_config()
+
+    def test_invalid_rules_are_not_sent(self):
+        session = mock.Mock()
+        client = rules.RulesClient(session=session,
+                                   config_file_path=test_utils.test_config_path)
+        try:
+            client.add_rules([rules.build("ok"), rules.build("a OR")])
+        except RuleSyntaxException as e:
+            self.assertEqual(e.invalid[0][0], {"value": "a OR"})
+            self.assertTrue(isinstance(e, RulesListFormatException))
+        else:
+            self.fail("add_rules was supposed to throw a RuleSyntaxException")
+        self.assertEqual(session.post.call_count, 0)
+
+    def test_validation_can_be_turned_off(self):
+        session = mock.Mock()
+        session.post.return_value = test_utils.GoodResponse()
+        client = rules.RulesClient(session=session, validate=False,
+                                   config_file_path=test_utils.test_config_path)
+        client.add_rules([rules.build("a OR")])
+        self.assertEqual(session.post.call_count, 1)
+
+    def test_unknown_operator_is_sent_with_a_warning(self):
+        session = mock.Mock()
+        session.post.return_value = test_utils.GoodResponse()
+        client = rules.RulesClient(session=session,
+                                   config_file_path=test_utils.test_config_path)
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            client.add_rules([rules.build("wat:x coffee")])
+        self.assertEqual(session.post.call_count, 1)
+        self.assertEqual([w.category for w in caught], [RuleSyntaxWarning])
+
+    def test_module_functions_can_skip_validation(self):
+        with mock.patch('requests.Session.post',
+                        return_value=test_utils.GoodResponse()) as post:
+            rules.add_rules([rules.build("a OR")], validate=False,
+                            config_file_path=test_utils.test_config_path)
+            rules.add_rule("a OR", validate=False,
+                           config_file_path=test_utils.test_config_path)
+            self.assertRaises(RuleSyntaxException, rules.add_rule, "a OR",
+                              config_file_path=test_utils.test_config_path)
+        self.assertEqual(post.call_count, 2)
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+import shutil
+import tempfile
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import mock
+
+from gnippy import PowerTrackClient
+from gnippy.dispatch import ActivityQueue
+from gnippy.errors import BadArgumentException
+from gnippy.shedding import extract_posted_time, LagMonitor, LoadShedder, \
+    SheddingPolicy
+from gnippy.spool import Spool, SpoolReader
+from gnippy.test import test_utils
+
+
+posted = b'{"id":"1","postedTime":"2018-10-01T12:34:56.000Z"}'
+posted_epoch = 1538397296
+
+
+def tagged(*tags):
+    rules = ",".join('{"tag":"%s","value":"x"}' % tag for tag in tags)
+    return ('{"id":"1","gnip":{"matching_rules":[%s]}}' % rules).encode()
+
+
+class ExtractPostedTimeTestCase(unittest.TestCase):
+
+    def test_activity_streams(self):
+        self.assertEqual(extract_posted_time(posted), posted_epoch)
+
+    def test_original_format(self):
+        line = b'{"created_at":"Mon Oct 01 12:34:56 +0000 2018","id":1}'
+        self.assertEqual(extract_posted_time(line), posted_epoch)
+
+    def test_missing(self):
+        self.assertEqual(extract_posted_time(b'{"id":"1"}'), None)
+
+
+class LagMonitorTestCase(unittest.TestCase):
+
+    def test_samples_lag(self):
+        received = []
+        monitor = LagMonitor(received.append, sample_every=1, alpha=1)
+        monitor.observe(posted, now=posted_epoch + 42)
+        self.assertEqual(monitor.lag, 42)
+        monitor(b'{"id":"2"}')
+        self.assertEqual(monitor.lag, 42)
+        self.assertEqual(received, [b'{"id":"2"}'])
+
+
+class LoadShedderTestCase(unittest.TestCase):
+
+    def shedder(self, policy, lag=0, activity_queue=None):
+        received = []
+        monitor = mock.Mock(lag=lag)
+        shedder = LoadShedder(received.append, policy, monitor,
+                              activity_queue=activity_queue, check_every=1)
+        return shedder, received
+
+    def test_passes_through_when_healthy(self):
+        shedder, received = self.shedder(
+            SheddingPolicy(sample_rate=0), lag=1)
+        shedder(posted)
+        self.assertEqual(received, [posted])
+        self.assertFalse(shedder.overloaded)
+
+    def test_sample_when_lagging(self):
+        shedder, received = self.shedder(
+            SheddingPolicy(lag_threshold=10, sample_rate=0), lag=11)
+        for i in range(10):
+            shedder(posted)
+        self.assertEqual(received, [])
+        self.assertEqual(shedder.shed, 10)
+
+    def test_queue_threshold(self):
+        q = ActivityQueue(10)
+        for i in range(9):
+            q.put(i)
+        shedder, received = self.shedder(
+            SheddingPolicy(queue_threshold=0.8, sample_rate=0),
+            activity_queue=q)
+        shedder(posted)
+        self.assertTrue(shedder.overloaded)
+        self.assertEqual(received, [])
+
+    def test_drop_tags(self):
+        policy = SheddingPolicy("drop_tags", lag_threshold=0,
+                                low_priority_tags=["low"])
+        shedder, received = self.shedder(policy, lag=1)
+        for line in (tagged("low"), tagged("low", "high"), tagged("high")):
+            shedder(line)
+        self.assertEqual(received, [tagged("low", "high"), tagged("high")])
+
+    def test_spool(self):
+        directory = tempfile.mkdtemp()
+        try:
+            spool = Spool(directory)
+            shedder, received = self.shedder(
+                SheddingPolicy("spool", lag_threshold=0, spool=spool), lag=1)
+            shedder(posted)
+            spool.close()
+            self.assertEqual(received, [])
+            replayed = []
+            SpoolReader(directory).replay(replayed.append)
+            self.assertEqual(replayed, [posted])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_bad_arguments(self):
+        self.assertRaises(BadArgumentException, SheddingPolicy, "wat")
+        self.assertRaises(BadArgumentException, SheddingPolicy, "spool")
+
+
+class PowerTrackClientSheddingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        test_utils.generate_test_config_file()
+
+    def tearDown(self):
+        test_utils.delete_test_config()
+
+    def test_stats_report_lag_and_shed(self):
+        response = test_utils.stream_response([posted + b"\r\n"] * 3)
+
+        received = []
+        client = PowerTrackClient(received.append, queue_size=10,
+                                  shedding=SheddingPolicy(),
+                                  config_file_path=test_utils.test_config_path)
+        with mock.patch('requests.get', return_value=response):
+            client.connect()
+            client.worker.join(5)
+            client.disconnect()
+
+        self.assertEqual(received, [posted] * 3)
+        stats = client.stats()
+        self.assertEqual(stats['lag_seconds'], 0.0)
+        self.assertEqual(stats['shed'], 0)
+        self.assertFalse(stats['shedding'])
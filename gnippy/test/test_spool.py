@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import threading
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import mock
+
+from gnippy import PowerTrackClient
+from gnippy.spool import Spool, SpoolReader, list_segments, read_checkpoint
+from gnippy.test import test_utils
+
+
+class SpoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_append_and_read_back(self):
+        spool = Spool(self.directory)
+        for i in range(5):
+            spool.append(b"line %d" % i)
+        spool.close()
+        lines = [line for pos, line in SpoolReader(self.directory).read()]
+        self.assertEqual(lines, [b"line %d" % i for i in range(5)])
+
+    def test_segments_rotate(self):
+        spool = Spool(self.directory, segment_bytes=20)
+        for i in range(10):
+            spool.append(b"0123456789")
+        spool.close()
+        # Five full segments plus the empty one being written to
+        self.assertEqual(len(list_segments(self.directory)), 6)
+        lines = [line for pos, line in SpoolReader(self.directory).read()]
+        self.assertEqual(len(lines), 10)
+
+    def test_max_segments(self):
+        spool = Spool(self.directory, segment_bytes=11, max_segments=2)
+        for i in range(5):
+            spool.append(b"%010d" % i)
+        spool.close()
+        self.assertEqual(list_segments(self.directory), [4, 5])
+        lines = [line for pos, line in SpoolReader(self.directory).read()]
+        self.assertEqual(lines, [b"0000000004"])
+
+    def test_partial_line_dropped_on_reopen(self):
+        spool = Spool(self.directory)
+        spool.append(b"complete")
+        spool.close()
+        path = os.path.join(self.directory, "%020d.spool" % 0)
+        with open(path, "ab") as f:
+            f.write(b'{"half an activ')
+        reader = SpoolReader(self.directory)
+        self.assertEqual([l for p, l in reader.read()], [b"complete"])
+        spool = Spool(self.directory)
+        spool.append(b"next")
+        spool.close()
+        self.assertEqual([l for p, l in reader.read()],
+                         [b"complete", b"next"])
+
+    def test_replay_from_checkpoint(self):
+        spool = Spool(self.directory, segment_bytes=12)
+        for i in range(6):
+            spool.append(b"activity %d" % i)
+        spool.close()
+
+        reader = SpoolReader(self.directory)
+        received = []
+        first = [pos for pos, line in reader.read()][2]
+        reader.commit(first)
+        end = reader.replay(received.append, commit_every=2)
+        self.assertEqual(received, [b"activity %d" % i for i in range(3, 6)])
+        self.assertEqual(read_checkpoint(self.directory), end)
+
+        # Nothing left after the checkpoint
+        received = []
+        reader.replay(received.append)
+        self.assertEqual(received, [])
+
+        # Any position can be replayed from
+        reader.replay(received.append, position=(0, 0))
+        self.assertEqual(len(received), 6)
+
+    def test_follow_sees_new_segments(self):
+        spool = Spool(self.directory, segment_bytes=8)
+        reader = SpoolReader(self.directory)
+        reader.poll_interval = 0.01
+        received = []
+
+        def callback(line):
+            received.append(line)
+            if len(received) == 4:
+                reader.stop()
+
+        t = threading.Thread(target=reader.replay, args=(callback,),
+                             kwargs={"follow": True})
+        t.start()
+        for i in range(4):
+            spool.append(b"line %d" % i)
+            spool.sync()
+        t.join(5)
+        spool.close()
+        self.assertFalse(t.is_alive())
+        self.assertEqual(received, [b"line %d" % i for i in range(4)])
+
+
+class PowerTrackClientSpoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        test_utils.generate_test_config_file()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        test_utils.delete_test_config()
+        shutil.rmtree(self.directory)
+
+    def test_spool_only(self):
+        response = test_utils.stream_response([b"a\r\nb\r\n"])
+
+        client = PowerTrackClient(None, spool=self.directory,
+                                  config_file_path=test_utils.test_config_path)
+        with mock.patch('requests.get', return_value=response):
+            client.connect()
+            client.worker.join(5)
+            client.disconnect()
+
+        received = []
+        SpoolReader(self.directory).replay(received.append)
+        self.assertEqual(received, [b"a", b"b"])
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import mock
+
+from gnippy import PowerTrackClient
+from gnippy.stats import Histogram, Meter, StatsReporter, StreamStats
+from gnippy.test import test_utils
+
+
+class MeterTestCase(unittest.TestCase):
+
+    def test_rate_over_window(self):
+        meter = Meter(window=4)
+        meter.mark(10, now=100)
+        meter.mark(10, now=101.5)
+        meter.mark(20, now=103)
+        # Only complete seconds 99..102 count at t=103
+        self.assertEqual(meter.rate(now=103), 5.0)
+        self.assertEqual(meter.count, 40)
+        # Old buckets are reused rather than accumulated
+        meter.mark(1, now=104)
+        self.assertEqual(meter.rate(now=105), (10 + 20 + 1) / 4.0)
+
+
+class HistogramTestCase(unittest.TestCase):
+
+    def test_observe(self):
+        h = Histogram(buckets=(0.01, 0.1))
+        for value in (0.005, 0.05, 0.05, 3):
+            h.observe(value)
+        snapshot = h.snapshot()
+        self.assertEqual(snapshot['buckets'],
+                         {"0.01": 1, "0.1": 2, "+Inf": 1})
+        self.assertEqual(snapshot['count'], 4)
+        self.assertEqual(snapshot['max'], 3)
+
+
+class StreamStatsTestCase(unittest.TestCase):
+
+    def test_connected_seconds(self):
+        stats = StreamStats()
+        with mock.patch('time.time', return_value=10):
+            stats.connected()
+        with mock.patch('time.time', return_value=15):
+            stats.disconnected()
+            self.assertEqual(stats.connected_seconds(), 5)
+            self.assertFalse(stats.snapshot()['connected'])
+
+    def test_shared_by_several_connections(self):
+        """ Connected while any connection is open; time isn't double counted. """
+        stats = StreamStats()
+        with mock.patch('time.time', return_value=10):
+            stats.connected()
+        with mock.patch('time.time', return_value=12):
+            stats.connected()
+        with mock.patch('time.time', return_value=15):
+            stats.disconnected()
+            self.assertTrue(stats.snapshot()['connected'])
+            self.assertEqual(stats.connected_seconds(), 5)
+        with mock.patch('time.time', return_value=20):
+            stats.disconnected()
+            stats.disconnected()
+            self.assertFalse(stats.snapshot()['connected'])
+            self.assertEqual(stats.connected_seconds(), 10)
+
+    def test_counts_from_several_threads(self):
+        stats = StreamStats()
+
+        def read():
+            for _ in range(10000):
+                stats.record_chunk(1, 1, 1)
+                stats.increment("stalls")
+
+        threads = [threading.Thread(target=read) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        snapshot = stats.snapshot()
+        self.assertEqual(snapshot['bytes'], 40000)
+        self.assertEqual(snapshot['activities'], 40000)
+        self.assertEqual(snapshot['heartbeats'], 40000)
+        self.assertEqual(snapshot['stalls'], 40000)
+
+    def test_reporter_calls_hook(self):
+        called = threading.Event()
+        reporter = StatsReporter(lambda: {"a": 1},
+                                 lambda s: called.set(), interval=0.01)
+        reporter.start()
+        self.assertTrue(called.wait(5))
+        reporter.stop()
+
+
+class PowerTrackClientStatsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        test_utils.generate_test_config_file()
+
+    def tearDown(self):
+        test_utils.delete_test_config()
+
+    def test_stats_after_stream(self):
+        response = test_utils.stream_response([b"a\r\n\r\nb", b"\r\nc\r\n\r\n"])
+
+        client = PowerTrackClient(lambda line: None, queue_size=10,
+                                  config_file_path=test_utils.test_config_path)
+        with mock.patch('requests.get', return_value=response):
+            client.connect()
+            client.worker.join(5)
+            client.disconnect()
+
+        stats = client.stats()
+        self.assertEqual(stats['bytes'], 13)
+        self.assertEqual(stats['activities'], 3)
+        self.assertEqual(stats['heartbeats'], 2)
+        self.assertEqual(stats['reconnects'], 0)
+        self.assertEqual(stats['callback_latency']['count'], 3)
+        self.assertEqual(stats['queue_depth'], 0)
+        self.assertFalse(stats['connected'])
@@ -6,6 +6,8 @@ except ImportError:
     import configparser as ConfigParser
 import os
 import pwd
+
+import mock
 from six import PY2
 
 test_config_path = "/tmp/.gnippy"
@@ -133,4 +135,15 @@ class GoodResponseJsonError(Response):
 
 class GoodResponse(Response):
     def __init__(self, response_code=200, text="All OK", json=None):
-        Response.__init__(self, response_code, text, json)
\ No newline at end of file
+        Response.__init__(self, response_code, text, json)
+
+
+def stream_response(chunks, status_code=200):
+    """
+        A mocked streaming response, as returned by requests.get with
+        stream=True, whose body arrives as the byte strings in `chunks`.
+    """
+    response = mock.MagicMock()
+    type(response).status_code = mock.PropertyMock(return_value=status_code)
+    response.iter_content.side_effect = lambda chunk_size: iter(chunks)
+    return response
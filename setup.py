@@ -38,5 +38,8 @@ setup(
     install_requires=[
         "requests>=2.8.1,<3.0.0",
         "six>=1.10.0"
-    ]
+    ],
+    extras_require={
+        "async": ["aiohttp>=3.3"]
+    }
 )